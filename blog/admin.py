@@ -1,16 +1,22 @@
-import locale
-from sys import platform
-from django.contrib import admin
+from collections import defaultdict
+
+from django.contrib import admin, messages
 from django.contrib.admin.options import IS_POPUP_VAR
+from django.contrib.admin.widgets import AutocompleteSelect
 from django.contrib.auth.admin import UserAdmin
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
 from django.db import models
-from django.db.models import Count, Sum, F, Q
-from django.db.models.fields import TextField
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.fields import IntegerField, TextField
+from django.db.models.functions import Coalesce
 from django.forms import CheckboxSelectMultiple
+from django.forms.models import BaseInlineFormSet
 from django.forms.widgets import TextInput
-from django.contrib.postgres.aggregates import StringAgg
+from django.http import Http404, JsonResponse
+from django.utils.dateparse import parse_date
 from django.utils.html import format_html
-from django.urls import resolve
+from django.urls import path, resolve, reverse
 
 from tinymce.widgets import TinyMCE
 
@@ -23,9 +29,17 @@ from .models import (
     NatureBesoin,
     Cas,
     Cotisation,
-    VueCotisationNonLiberee,
     AffectationNonLibere,
+    StatistiquesReunion,
+    Tache,
 )
+from . import taches
+from .cache import choix_reunions, reunion_recente
+from .formatage import formatte_nombre
+from .pagination import CleCurseur, PaginationCurseurAdminMixin, SansNull
+from .rapports import FORMATS, RAPPORTS, reponse_rapport
+from .recherche import RechercheAdminMixin
+from .referentiel import ReferentielAdminMixin, ReferentielsAdminMixin, communautes, natures
 from .forms import (
     CasCreationForm,
     CasChangeForm,
@@ -35,34 +49,74 @@ from .forms import (
 
 
 
-def formatte_nombre(valeur, couleur=None, gras=False):
+def fige_choix(champ, db_field):
+    """
+    Évalue une fois pour toutes les choix d'un champ de sélection : les copies
+    du champ faites pour chaque formulaire d'un formset partagent alors la même
+    liste, au lieu de relancer chacune la requête de leur queryset
     """
-    Formatte des valeurs de montant pour un affichage correct dans l'interface
+    if champ is not None and hasattr(champ, 'queryset'):
+        # Restriction limit_choices_to du modèle, appliquée d'ordinaire par le
+        # ModelForm après la création du champ, donc après l'évaluation des choix
+        limite = db_field.get_limit_choices_to()
+        if limite:
+            champ.queryset = champ.queryset.complex_filter(limite)
+        # iter() : list() demanderait d'abord la longueur des choix, soit une requête COUNT
+        champ.choices = list(iter(champ.choices))
+    return champ
+
+
+def choix_planifies(champ, objets):
     """
-    # Défintion du paramètre de localisation des affichages
-    if not bool(locale.getlocale()[0]):
-        if platform == "linux" or platform == "linux2":
-            locale.setlocale(locale.LC_ALL, 'fr_FR')
-        elif platform == "darwin":
-            locale.setlocale(locale.LC_ALL, 'fr_FR')
-        elif platform == "win32":
-            locale.setlocale(locale.LC_ALL, 'French_France.1252')
+    Choix d'un champ de sélection construits à partir d'objets déjà chargés
+    (la requête du queryset du champ ne sert plus qu'à la validation)
+    """
+    champ.choices = [('', champ.empty_label)] + [
+        (champ.prepare_value(objet), champ.label_from_instance(objet)) for objet in objets
+    ]
+    return champ
 
-    style_couleur = f'color: {couleur};' if couleur else ''
-    style_gras = f'font-weight: bold;' if gras else ''
-    montant = f'{valeur:n}' if valeur is not None else '-'
-    return format_html(f'<div style="{style_gras}{style_couleur}text-align: right;">{montant}</div>')
+
+class AutocompletePlanifie(AutocompleteSelect):
+    """
+    Sélection par autocomplétion dont l'option choisie est construite à partir
+    d'objets déjà chargés pour la page : ni liste complète des choix dans la page,
+    ni requête par formulaire pour retrouver l'objet choisi. Les choix proposés
+    viennent de la vue url, ou de l'autocomplétion de l'administration du modèle.
+    """
+    def __init__(self, rel, admin_site, objets, url=None, **kwargs):
+        super().__init__(rel, admin_site, **kwargs)
+        self.objets = {str(objet.pk): objet for objet in objets}
+        self.url = url
+
+    def get_url(self):
+        return self.url or super().get_url()
+
+    def optgroups(self, name, value, attr=None):
+        choisis = [str(v) for v in value if str(v) not in self.choices.field.empty_values]
+        if any(choisi not in self.objets for choisi in choisis):
+            # Valeur saisie hors des objets de la page (formulaire réaffiché)
+            return super().optgroups(name, value, attr)
+        options = []
+        if not self.is_required:
+            options.append(self.create_option(name, '', '', False, 0))
+        for choisi in choisis:
+            objet = self.objets[choisi]
+            options.append(self.create_option(
+                name, objet.pk, self.choices.field.label_from_instance(objet), True, len(options),
+            ))
+        return [(None, options, 0)]
 
 
 # Utilisateur Providence
 @admin.register(ProvUser)
-class ProvUserAdmin(UserAdmin):
+class ProvUserAdmin(RechercheAdminMixin, UserAdmin):
     pass
 
 
 # Membre Providence
 @admin.register(Membre)
-class ProvMembreAdmin(UserAdmin):
+class ProvMembreAdmin(RechercheAdminMixin, ReferentielsAdminMixin, UserAdmin):
     model = Membre
     list_display = ('last_name', 'first_name', 'telephone1', 'telephone2', 'adresse', 'email')
     list_display_links = ('last_name', 'first_name',)
@@ -108,9 +162,10 @@ class ProvMembreAdmin(UserAdmin):
 
 # Communautés
 @admin.register(Communaute)
-class CommunauteAdmin(admin.ModelAdmin):
+class CommunauteAdmin(ReferentielAdminMixin, admin.ModelAdmin):
     list_display = ('nom', 'nom_long',)
     search_fields = ('nom', 'nom_long',)
+    referentiel = communautes
 
 # @admin.register(Communaute)
 # class CommunauteAdmin(admin.ModelAdmin):
@@ -120,8 +175,13 @@ class CommunauteAdmin(admin.ModelAdmin):
 
 # Bénéficiaire
 @admin.register(Beneficiaire)
-class BeneficiaireAdmin(admin.ModelAdmin):
+class BeneficiaireAdmin(RechercheAdminMixin, PaginationCurseurAdminMixin, ReferentielsAdminMixin, admin.ModelAdmin):
     list_display = ('__str__', 'nombre_cas')
+    cle_pagination = CleCurseur((
+        ('nom', SansNull('nom')),
+        ('prenoms', SansNull('prenoms')),
+        ('id', F('id')),
+    ))
     radio_fields = {'sexe': admin.HORIZONTAL}
     search_fields = ('nom', 'prenoms',)
     fieldsets = (
@@ -137,6 +197,23 @@ class BeneficiaireAdmin(admin.ModelAdmin):
     )
     autocomplete_fields = ('communaute',)
 
+    def get_queryset(self, request):
+        # Nombre de cas de chaque bénéficiaire lu par une sous-requête de la requête
+        # de la liste (évaluée pour les seules lignes de la page), plutôt que par
+        # une requête COUNT par ligne affichée
+        cas = Cas.objects\
+            .filter(beneficiaire=OuterRef('pk'))\
+            .order_by()\
+            .values('beneficiaire')\
+            .annotate(nombre=Count('pk'))\
+            .values('nombre')
+        return super().get_queryset(request)\
+            .annotate(_nombre_cas=Coalesce(Subquery(cas, output_field=IntegerField()), Value(0)))
+
+    def nombre_cas(self, obj):
+        return obj._nombre_cas
+    nombre_cas.short_description = "Nombre de cas"
+
 
 class CasReunionListFilter(admin.SimpleListFilter):
     """
@@ -148,21 +225,13 @@ class CasReunionListFilter(admin.SimpleListFilter):
     # Paramètre pour le filtre qui sera utilisé dans l'URL
     parameter_name = 'reunion'
 
-    valeur_defaut = None
-
     def lookups(self, request, model_admin):
         """
         Retourne une liste de tuples. Le premier élément de chaque tuple
         est le code de la valeur du parèmtre d'URL (en l'occurrence 'reunion')
         Le second élément est le nom exploitable de la réunion
         """
-        liste_reunions = []
-        queryset = Reunion.objects.all()
-        for reunion in queryset:
-            liste_reunions.append(
-                (str(reunion.pk), reunion.__str__())
-            )
-        return liste_reunions
+        return choix_reunions()
 
     def queryset(self, request, queryset):
         """
@@ -179,30 +248,26 @@ class CasReunionListFilter(admin.SimpleListFilter):
         Redéfinition de la méthode pour avoir une valeur par défaut
         """
         valeur = super(CasReunionListFilter, self).value()
-        # if (valeur is None) and (self.valeur_defaut is None):
-        #     # S'il existe au moins une réunion, retourne la plus récente, sinon None.
-        #     reunion_recente = Reunion.objects.first()
-        #     valeur = None if reunion_recente is None else reunion_recente.id
-        #     self.valeur_defaut = valeur
-        #     # else:
-        #     #     valeur = self.valeur_defaut
-        # return str(valeur) if valeur else None
-
         if valeur is None:
-            if self.valeur_defaut is None:
-                # S'il existe au moins une réunion, retourne la plus récente, sinon None.
-                reunion_recente = Reunion.objects.first()
-                valeur = None if reunion_recente is None else reunion_recente.id
-                self.valeur_defaut = valeur
-            else:
-                valeur = self.valeur_defaut
-        return str(valeur)
+            # Par défaut, la réunion la plus récente (lue dans le cache des réunions)
+            valeur = reunion_recente()
+        return valeur
 
 # Cas
 @admin.register(Cas)
-class CasAdmin(admin.ModelAdmin):
+class CasAdmin(RechercheAdminMixin, PaginationCurseurAdminMixin, ReferentielsAdminMixin, admin.ModelAdmin):
     list_display = ('__str__', 'est_urgent', 'soumis_par', 'classification')
+    # soumis_par peut être nul : il n'est pas suivi par le select_related() par défaut de la liste
+    list_select_related = ('soumis_par',)
+    # Cas des dernières réunions créées en premier : la clé ne porte que sur des
+    # colonnes de blog_cas pour que l'index cas_cle_pagination_idx la parcoure
+    # directement (le tri sur la date de la réunion imposerait une jointure)
+    cle_pagination = CleCurseur((
+        ('reunion', F('reunion_id')),
+        ('id', F('id')),
+    ), descendant=True)
     list_filter = (CasReunionListFilter, 'classification',)
+    search_fields = ('nom', 'prenoms',)
     form = CasChangeForm
     add_form = CasCreationForm
     radio_fields = {'sexe': admin.HORIZONTAL, 'don_remis': admin.HORIZONTAL}
@@ -247,10 +312,9 @@ class CasAdmin(admin.ModelAdmin):
     }
 
     def get_changeform_initial_data(self, request):
-        reunion = Reunion.objects.all()[0]  # Réunion la plus récente
         return {
             'soumis_par': request.user,
-            'reunion' : reunion,
+            'reunion' : reunion_recente(),
         }
 
     def get_readonly_fields(self, request, obj=None):
@@ -299,8 +363,127 @@ class NatureBesoinAdmin(admin.ModelAdmin):
     list_display = ('libelle', 'classification')
 
 
+def attache_natures(liste_cas, liaisons):
+    """
+    Mémorise sur chaque cas le libellé de ses natures (attribut _natures),
+    à partir des couples (cas, nature) de la table de liaison et des libellés
+    des natures lus dans leur référentiel : ni jointure ni regroupement sur les cas
+    """
+    natures_cas = defaultdict(set)
+    for cas_id, nature_id in liaisons:
+        natures_cas[cas_id].add(nature_id)
+    libelles = natures.libelles()
+    for cas in liste_cas:
+        ids = natures_cas[cas.pk]
+        cas._natures = ", ".join(libelle for pk, libelle in libelles.items() if pk in ids)
+
+
+class PlanReunion:
+    """
+    Lignes de tous les inlines de la page d'une réunion, chargées en quatre
+    requêtes (cas, natures des cas, cotisations, affectations) avec les objets
+    liés affichés sur chaque ligne, puis réparties entre les inlines
+    """
+    def __init__(self, reunion):
+        self.reunion = reunion
+        liste_cas = list(
+            Cas.objects.filter(reunion=reunion)
+                .select_related('beneficiaire', 'soumis_par')
+                .order_by('-urgence', 'nom', 'prenoms')
+        )
+        attache_natures(
+            liste_cas,
+            Cas.nature.through.objects.filter(cas__reunion=reunion).values_list('cas_id', 'naturebesoin_id'),
+        )
+        self.cas = {
+            classification: [cas for cas in liste_cas if cas.classification == classification]
+            for classification in ('S', 'M')
+        }
+        self.tous_cas = liste_cas
+        self.cotisations = list(Cotisation.objects.filter(reunion=reunion).select_related('membre'))
+        self.cotisations_non_liberees = [
+            cotisation for cotisation in self.cotisations
+            if not (cotisation.social_libere and cotisation.mission_libere)
+        ]
+        self.affectations = list(
+            AffectationNonLibere.objects
+                .filter(reunion=reunion)
+                .select_related('cas', 'cotisation__membre', 'collecteur')
+                .order_by('pk')
+        )
+
+
+class FormSetPlanifie(BaseInlineFormSet):
+    """
+    Formset dont les objets sont les lignes préparées par le plan de la page
+    (voir PlanReunion) plutôt que le résultat de sa propre requête
+    """
+    lignes = None
+
+    def get_queryset(self):
+        if self.lignes is None:
+            return super().get_queryset()
+        return self.lignes
+
+
+class ReunionInlineMixin:
+    """
+    Inline de la page réunion : la réunion parente et le plan des lignes de la page
+    sont mémorisés sur la requête, et partagés par tous les inlines de la page
+    """
+    formset = FormSetPlanifie
+
+    def get_formset(self, request, obj=None, **kwargs):
+        request.reunion_parente = obj
+        formset = super().get_formset(request, obj, **kwargs)
+        plan = self.get_plan(request)
+        formset.lignes = self.lignes_planifiees(plan) if plan else None
+        return formset
+
+    def get_plan(self, request):
+        """
+        Retourne le plan des lignes de la page (None sur la page d'ajout d'une réunion).
+        Il n'est établi qu'une fois par requête.
+        """
+        if not hasattr(request, 'plan_reunion'):
+            reunion = self.get_parent_object_from_request(request)
+            request.plan_reunion = PlanReunion(reunion) if reunion else None
+        return request.plan_reunion
+
+    def lignes_planifiees(self, plan):
+        """
+        Lignes de l'inline dans le plan de la page, ou None si l'inline
+        n'y figure pas (le formset exécute alors sa propre requête)
+        """
+        return None
+
+    def get_parent_object_from_request(self, request):
+        """
+        Retourne la réunion parente de la requête, ou None.
+        Elle n'est recherchée qu'une fois par requête.
+        """
+        if not hasattr(request, 'reunion_parente'):
+            resolved = resolve(request.path_info)
+            request.reunion_parente = None
+            if resolved.kwargs:
+                request.reunion_parente = self.parent_model.objects.get(pk=resolved.kwargs['object_id'])
+        return request.reunion_parente
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        champ = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        if db_field.remote_field.model is self.parent_model:
+            # Clé de la réunion parente : remplacée par un champ caché dans le formset,
+            # ses choix ne sont jamais affichés
+            return champ
+        if isinstance(champ.widget, AutocompleteSelect):
+            # Choix chargés à la demande par l'autocomplétion
+            return champ
+        # Les choix sont évalués une seule fois pour tous les formulaires du formset
+        return fige_choix(champ, db_field)
+
+
 # Cas (inline) pour affichage dans la page réunion
-class CasSocialInline(admin.TabularInline):
+class CasSocialInline(ReunionInlineMixin, admin.TabularInline):
     model = Cas
     # extra = 0
     max_num = 0
@@ -315,10 +498,13 @@ class CasSocialInline(admin.TabularInline):
         'montant_estime',
         'montant_alloue',
     )
-    readonly_fields = ('nom', 'prenoms', 'est_urgent', 'nature_cas', 'montant_estime')
+    # soumis_par en lecture seule : une liste de tous les membres par ligne
+    # ferait l'essentiel du poids de la page (il reste modifiable sur la page du cas)
+    readonly_fields = ('nom', 'prenoms', 'est_urgent', 'soumis_par', 'nature_cas', 'montant_estime')
     show_change_link = True
     verbose_name = 'social'
     verbose_name_plural = 'social'
+    bilan_reunion = None
     formfield_overrides = {
         models.DecimalField: {'widget': TextInput(attrs={'class': 'text-right'})},
     }
@@ -327,25 +513,29 @@ class CasSocialInline(admin.TabularInline):
     def get_queryset(self, request):
         return super().get_queryset(request)\
             .filter(classification='S')\
-            .annotate(_natures=StringAgg("nature__libelle", ", "))\
             .order_by("-urgence")
 
+    def lignes_planifiees(self, plan):
+        return plan.cas['S']
+
     def nature_cas(self, obj):
-        return obj._natures
+        # Libellés attachés par le plan de la page (voir attache_natures)
+        return getattr(obj, '_natures', "")
     nature_cas.short_description = "Nature(s)"
 
+    def get_formset(self, request, obj=None, **kwargs):
+        # Le bilan de la réunion parente est calculé une seule fois
+        # pour l'estimation des montants de toutes les lignes
+        self.bilan_reunion = obj.bilan if obj else None
+        return super().get_formset(request, obj, **kwargs)
+
     def montant_estime(self, obj):
-        if obj.urgence:
-            estime = obj.montant_sollicite
-        else:
-            urgence_social = obj.reunion.total_urgence_social()
-            cotis_dispo = obj.reunion.cotisations_social() - urgence_social
-            sollicite = obj.reunion.sollicite_social() - urgence_social
-            estime = obj.montant_sollicite * cotis_dispo // sollicite if sollicite != 0 else 0
+        bilan = self.bilan_reunion if self.bilan_reunion else obj.reunion.bilan
+        estime = bilan.montant_estime('S', obj.montant_sollicite, obj.urgence)
         return formatte_nombre(estime)
     montant_estime.short_description = "Montant estimé"
 
-class CasMissionInline(admin.TabularInline):
+class CasMissionInline(ReunionInlineMixin, admin.TabularInline):
     model = Cas
     # extra = 0
     max_num = 0
@@ -360,10 +550,13 @@ class CasMissionInline(admin.TabularInline):
         'montant_estime',
         'montant_alloue',
     )
-    readonly_fields = ('nom', 'prenoms', 'est_urgent', 'nature_cas', 'montant_estime')
+    # soumis_par en lecture seule : une liste de tous les membres par ligne
+    # ferait l'essentiel du poids de la page (il reste modifiable sur la page du cas)
+    readonly_fields = ('nom', 'prenoms', 'est_urgent', 'soumis_par', 'nature_cas', 'montant_estime')
     show_change_link = True
     verbose_name = 'mission'
     verbose_name_plural = 'mission'
+    bilan_reunion = None
     formfield_overrides = {
         models.DecimalField: {'widget': TextInput(attrs={'class': 'text-right'})},
     }
@@ -372,35 +565,57 @@ class CasMissionInline(admin.TabularInline):
     def get_queryset(self, request):
         return super().get_queryset(request)\
             .filter(classification='M')\
-            .annotate(
-                _natures=StringAgg("nature__libelle", ", "),
-            )\
             .order_by("-urgence")
 
+    def lignes_planifiees(self, plan):
+        return plan.cas['M']
+
     def nature_cas(self, obj):
-        return obj._natures
+        # Libellés attachés par le plan de la page (voir attache_natures)
+        return getattr(obj, '_natures', "")
     nature_cas.short_description = "Nature(s)"
 
+    def get_formset(self, request, obj=None, **kwargs):
+        # Le bilan de la réunion parente est calculé une seule fois
+        # pour l'estimation des montants de toutes les lignes
+        self.bilan_reunion = obj.bilan if obj else None
+        return super().get_formset(request, obj, **kwargs)
+
     def montant_estime(self, obj):
-        if obj.urgence:
-            estime = obj.montant_sollicite
-        else:
-            urgence_mission = obj.reunion.total_urgence_mission()
-            cotis_dispo = obj.reunion.cotisations_mission() - urgence_mission
-            sollicite = obj.reunion.sollicite_mission() - urgence_mission
-            estime = obj.montant_sollicite * cotis_dispo // sollicite if sollicite != 0 else 0
+        bilan = self.bilan_reunion if self.bilan_reunion else obj.reunion.bilan
+        estime = bilan.montant_estime('M', obj.montant_sollicite, obj.urgence)
         return formatte_nombre(estime)
     montant_estime.short_description = "Montant estimé"
 
-class CotisationInline(admin.TabularInline):
+class CotisationInline(ReunionInlineMixin, admin.TabularInline):
     model = Cotisation
     fields = ('membre', 'montant_social', 'social_libere', 'montant_mission', 'mission_libere',)
     max_num = 0
     can_delete = False
     readonly_fields = ('membre',)
 
-class CotisationNonLibereInline(admin.TabularInline):
-    model = VueCotisationNonLiberee
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('membre')
+
+    def lignes_planifiees(self, plan):
+        return plan.cotisations
+
+class CotisationNonLibereFormSet(FormSetPlanifie):
+    @classmethod
+    def get_default_prefix(cls):
+        # Préfixe utilisé par les onglets Baton (voir ReunionAdmin.fieldsets)
+        return 'cotisations_nl'
+
+class CotisationNonLibereInline(ReunionInlineMixin, admin.TabularInline):
+    """
+    Cotisations non libérées et leurs restes à affecter.
+    Les restes sont lus dans les soldes enregistrés sur les cotisations,
+    sans recalcul depuis les affectations.
+    """
+    model = Cotisation
+    formset = CotisationNonLibereFormSet
+    verbose_name = "cotisation du mois non libérée"
+    verbose_name_plural = "cotisations du mois non libérées"
     fields = (
         'membre',
         'montant_social_fmt',
@@ -423,6 +638,14 @@ class CotisationNonLibereInline(admin.TabularInline):
         'reste_mission_fmt',
     )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request)\
+            .non_liberees()\
+            .select_related('membre')
+
+    def lignes_planifiees(self, plan):
+        return plan.cotisations_non_liberees
+
     def montant_social_fmt(self, obj):
         return formatte_nombre(obj.montant_social)
     montant_social_fmt.short_description = "Montant social"
@@ -432,13 +655,13 @@ class CotisationNonLibereInline(admin.TabularInline):
     montant_mission_fmt.short_description = "Montant mission"
 
     def reste_social_fmt(self, obj):
-        reste = obj.reste_cotis_social
+        reste = obj.solde_social
         couleur = 'red' if reste and reste < 0 else None
         return formatte_nombre(reste, couleur, gras=True)
     reste_social_fmt.short_description = "Reste social"
 
     def reste_mission_fmt(self, obj):
-        reste = obj.reste_cotis_mission
+        reste = obj.solde_mission
         couleur = 'red' if reste and reste < 0 else None
         return formatte_nombre(reste, couleur, gras=True)
     reste_mission_fmt.short_description = "Reste mission"
@@ -449,7 +672,7 @@ class CotisationNonLibereInline(admin.TabularInline):
     def has_change_permission(self, request, obj=None):
         return False
 
-class AffectationNonLibereInline(admin.TabularInline):
+class AffectationNonLibereInline(ReunionInlineMixin, admin.TabularInline):
     model = AffectationNonLibere
     extra = 0
     # form = AffectationNonLibereForm
@@ -463,9 +686,14 @@ class AffectationNonLibereInline(admin.TabularInline):
         'montant_alloue',
     )
     readonly_fields = ('classification', 'montant_alloue')
+    autocomplete_fields = ('collecteur',)
 
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('cas')
+        # Le libellé de chaque ligne est le membre de la cotisation
+        return super().get_queryset(request).select_related('cas', 'cotisation__membre', 'collecteur')
+
+    def lignes_planifiees(self, plan):
+        return plan.affectations
 
     def classification(self, obj):
         return obj.cas.get_classification_display()
@@ -475,43 +703,60 @@ class AffectationNonLibereInline(admin.TabularInline):
         return formatte_nombre(obj.cas.montant_alloue)
     montant_alloue.short_description = "Montant alloué"
 
-    def get_parent_object_from_request(self, request):
-        """
-        Returns the parent object from the request or None.
-
-        Note that this only works for Inlines, because the `parent_model`
-        is not available in the regular admin.ModelAdmin as an attribute.
-        """
-        resolved = resolve(request.path_info)
-        if resolved.kwargs:
-            return self.parent_model.objects.get(pk=resolved.kwargs['object_id'])
-        return None
-
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
-        if db_field.name == "cotisation":
+        plan = self.get_plan(request)
+        if db_field.name == "cotisation" and plan:
+            # Une liste des cotisations non libérées (une par membre) à chaque ligne
+            # ferait l'essentiel du poids de la page : elles sont proposées par
+            # l'autocomplétion de la réunion (ReunionAdmin.cotisations_view)
             return CotisationChoiceField(
-                queryset=Cotisation.objects.filter(
-                   Q(social_libere=False) | Q(mission_libere=False),
-                    reunion=self.get_parent_object_from_request(request)
-                )
+                queryset=Cotisation.objects\
+                    .filter(reunion=plan.reunion)\
+                    .non_liberees()\
+                    .select_related('membre'),
+                widget=AutocompletePlanifie(
+                    db_field.remote_field, self.admin_site,
+                    [affectation.cotisation for affectation in plan.affectations],
+                    url=reverse('admin:blog_reunion_cotisations', args=[plan.reunion.pk]),
+                    using=kwargs.get('using'),
+                ),
+            )
+        elif db_field.name == "cotisation":
+            champ = CotisationChoiceField(
+                queryset=Cotisation.objects\
+                    .filter(reunion=self.get_parent_object_from_request(request))\
+                    .non_liberees()\
+                    .select_related('membre')
             )
-        
-        if db_field.name == "cas":
-            return CasChoiceField(
+            objets = None
+        elif db_field.name == "cas":
+            champ = CasChoiceField(
                 queryset=Cas.objects.filter(
                     reunion=self.get_parent_object_from_request(request)
-                )
+                ).select_related('beneficiaire')
+            )
+            objets = plan.tous_cas if plan else None
+        elif db_field.name == "collecteur" and plan:
+            # Collecteurs des lignes lus dans les affectations déjà chargées
+            kwargs['widget'] = AutocompletePlanifie(
+                db_field.remote_field, self.admin_site,
+                [affectation.collecteur for affectation in plan.affectations],
+                using=kwargs.get('using'),
             )
-            # kwargs["queryset"] = Cas.objects.filter(
-            #     reunion=self.get_parent_object_from_request(request)
-            # )
-        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+            return super().formfield_for_foreignkey(db_field, request, **kwargs)
+        else:
+            return super().formfield_for_foreignkey(db_field, request, **kwargs)
+        if objets is not None:
+            # Choix lus dans les lignes déjà chargées pour la page
+            return choix_planifies(champ, objets)
+        # Les choix sont évalués une seule fois pour tous les formulaires du formset
+        return fige_choix(champ, db_field)
 
 
 # Réunion
 @admin.register(Reunion)
 class ReunionAdmin(admin.ModelAdmin):
-    list_display = ('__str__', 'nb_cas', 'total_sollicite',)
+    list_display = ('__str__', 'nb_cas', 'total_sollicite', 'disponible_social', 'disponible_mission',)
     readonly_fields = (
         'nb_cas',
         'total_sollicite',
@@ -555,69 +800,208 @@ class ReunionAdmin(admin.ModelAdmin):
         # models.TextField: {'widget': TinyMCE()},
     }
 
+    actions = ('recalcule_reunions', 'exporte_xlsx', 'exporte_html')
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if not change and taches.asynchrone():
+            messages.info(request, "Les cotisations des membres sont en cours de génération (voir les tâches).")
+
+    def recalcule_reunions(self, request, queryset):
+        """
+        Recalcule en arrière-plan les soldes des cotisations et les statistiques
+        des réunions sélectionnées (une tâche par réunion)
+        """
+        nombre = 0
+        for pk in queryset.values_list('pk', flat=True):
+            taches.planifie('recalcule_reunions', cle=f"recalcule_reunion:{pk}", reunions=[pk])
+            nombre += 1
+        if taches.asynchrone():
+            self.message_user(request, f"Recalcul de {nombre} réunion(s) planifié (voir les tâches).")
+        else:
+            self.message_user(request, f"{nombre} réunion(s) recalculée(s).")
+    recalcule_reunions.short_description = "Recalculer les soldes et les statistiques"
+
+    def exporte_xlsx(self, request, queryset):
+        return reponse_rapport('xlsx', queryset)
+    exporte_xlsx.short_description = "Exporter le rapport financier (XLSX)"
+
+    def exporte_html(self, request, queryset):
+        return reponse_rapport('html', queryset)
+    exporte_html.short_description = "Afficher le rapport financier imprimable"
+
+    def get_urls(self):
+        urls = [
+            path(
+                'rapport/<str:format>/',
+                self.admin_site.admin_view(self.rapport_view),
+                name='blog_reunion_rapport',
+            ),
+            path(
+                '<int:object_id>/cotisations/',
+                self.admin_site.admin_view(self.cotisations_view),
+                name='blog_reunion_cotisations',
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def cotisations_view(self, request, object_id):
+        """
+        Cotisations non libérées de la réunion dont le membre correspond au terme
+        recherché (paramètre term), pour l'autocomplétion de la cotisation des
+        affectations ; réponse au format de l'autocomplétion de l'administration
+        """
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        cotisations = Cotisation.objects\
+            .filter(reunion_id=object_id)\
+            .non_liberees()\
+            .select_related('membre')\
+            .order_by('membre__last_name', 'membre__first_name', 'pk')
+        terme = request.GET.get('term', '')
+        if terme:
+            # Recherche de l'administration des utilisateurs (plein texte)
+            membres, _ = self.admin_site._registry[ProvUser].get_search_results(
+                request, ProvUser.objects.all(), terme,
+            )
+            cotisations = cotisations.filter(membre__in=membres)
+        page = Paginator(cotisations, 20).get_page(request.GET.get('page'))
+        champ = CotisationChoiceField(queryset=cotisations)
+        return JsonResponse({
+            'results': [
+                {'id': str(cotisation.pk), 'text': str(champ.label_from_instance(cotisation))}
+                for cotisation in page.object_list
+            ],
+            'pagination': {'more': page.has_next()},
+        })
+
+    def rapport_view(self, request, format):
+        """
+        Rapport financier des réunions au format fourni (csv, xlsx ou html), pour
+        les réunions d'identifiants reunion (paramètre répétable) ou de la période
+        de debut à fin (dates AAAA-MM-JJ, bornes incluses), ou pour toutes les réunions.
+        En CSV, le paramètre rapport choisit le rapport (synthese, cas ou cotisations).
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        rapport = request.GET.get('rapport', 'synthese')
+        if format not in FORMATS or rapport not in RAPPORTS:
+            raise Http404("Rapport inconnu")
+
+        reunions = Reunion.objects.all()
+        nom = ["rapport"]
+        titre = "Rapport financier"
+        try:
+            ids = [int(pk) for pk in request.GET.getlist('reunion')]
+            debut, fin = (parse_date(request.GET.get(borne, '')) for borne in ('debut', 'fin'))
+        except ValueError:
+            raise Http404("Paramètres invalides")
+        if ids:
+            reunions = reunions.filter(pk__in=ids)
+            if len(ids) == 1:
+                nom.append(f"reunion_{ids[0]}")
+        if debut:
+            reunions = reunions.filter(date_reunion__gte=debut)
+            nom.append(debut.isoformat())
+            titre += f" du {debut.strftime('%d/%m/%Y')}"
+        if fin:
+            reunions = reunions.filter(date_reunion__lte=fin)
+            nom.append(fin.isoformat())
+            titre += f" au {fin.strftime('%d/%m/%Y')}"
+        return reponse_rapport(format, reunions, nom="_".join(nom), rapport=rapport, titre=titre)
+
     def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        queryset = queryset.annotate(
-            _nb_cas=Count("cas_reunion"),
-            _total_sollicite=Sum("cas_reunion__montant_sollicite"),
-            _total_soll_social=Sum("cas_reunion__montant_sollicite", filter=Q(cas_reunion__classification='S')),
-            _total_soll_mission=Sum("cas_reunion__montant_sollicite", filter=Q(cas_reunion__classification='M')),
-        )
-        return queryset
+        # Les statistiques sont lues dans leur table (une jointure) plutôt qu'agrégées
+        # sur l'ensemble des cas à chaque affichage
+        return super().get_queryset(request).select_related('membre_hote', 'statistiques')
+
+    @staticmethod
+    def statistiques(obj):
+        """
+        Statistiques de la réunion (nulles si elles n'ont pas encore été calculées)
+        """
+        try:
+            return obj.statistiques
+        except StatistiquesReunion.DoesNotExist:
+            return StatistiquesReunion(reunion=obj)
 
     def nb_cas(self, obj):
-        return formatte_nombre(obj._nb_cas)
+        return formatte_nombre(self.statistiques(obj).nb_cas)
     nb_cas.short_description = "Nombre de cas"
-    nb_cas.admin_order_field = "_nb_cas"
+    nb_cas.admin_order_field = "statistiques__nb_cas"
 
     def total_sollicite(self, obj):
-        return formatte_nombre(obj._total_sollicite)
+        return formatte_nombre(self.statistiques(obj).sollicite_total)
     total_sollicite.short_description = "Total sollicité"
-    total_sollicite.admin_order_field = "_total_sollicite"
+    total_sollicite.admin_order_field = "statistiques__sollicite_total"
 
     def total_soll_social(self, obj):
-        return formatte_nombre(obj._total_soll_social)
+        return formatte_nombre(self.statistiques(obj).sollicite_social)
     total_soll_social.short_description = "Sollicité social"
-    total_soll_social.admin_order_field = "_total_soll_social"
+    total_soll_social.admin_order_field = "statistiques__sollicite_social"
 
     def total_soll_mission(self, obj):
-        return formatte_nombre(obj._total_soll_mission)
+        return formatte_nombre(self.statistiques(obj).sollicite_mission)
     total_soll_mission.short_description = "Sollicité mission"
-    total_soll_mission.admin_order_field = "_total_soll_mission"
+    total_soll_mission.admin_order_field = "statistiques__sollicite_mission"
 
     def cotis_social(self, obj):
-        return formatte_nombre(obj.cotisations_social())
+        return formatte_nombre(self.statistiques(obj).cotisations_social)
     cotis_social.short_description = "Cotisations social"
+    cotis_social.admin_order_field = "statistiques__cotisations_social"
 
     def cotis_mission(self, obj):
-        return formatte_nombre(obj.cotisations_mission())
+        return formatte_nombre(self.statistiques(obj).cotisations_mission)
     cotis_mission.short_description = "Cotisations mission"
+    cotis_mission.admin_order_field = "statistiques__cotisations_mission"
 
     def disponible_social(self, obj):
-        affecte = obj.cas_reunion\
-            .filter(classification='S')\
-            .filter(urgence=False)\
-            .aggregate(total=Sum('montant_alloue'))
-        alloue = affecte['total'] if affecte['total'] else 0
-        cotis = obj.cotisations_social() if obj.cotisations_social() else 0
-        urgence = obj.total_urgence_social() if obj.total_urgence_social() else 0
-        disponible = cotis - urgence - alloue
+        disponible = self.statistiques(obj).reliquat_social
         couleur = 'green' if disponible >= 0 else 'red'
         return formatte_nombre(disponible, couleur, gras=True)
     disponible_social.short_description = "Reliquat social"
+    disponible_social.admin_order_field = "statistiques__reliquat_social"
 
     def disponible_mission(self, obj):
-        affecte = obj.cas_reunion\
-            .filter(classification='M')\
-            .filter(urgence=False)\
-            .aggregate(total=Sum('montant_alloue'))
-        alloue = affecte['total'] if affecte['total'] else 0
-        cotis = obj.cotisations_mission() if obj.cotisations_mission() else 0
-        urgence = obj.total_urgence_mission() if obj.total_urgence_mission() else 0
-        disponible = cotis - urgence - alloue
+        disponible = self.statistiques(obj).reliquat_mission
         couleur = 'green' if disponible >= 0 else 'red'
         return formatte_nombre(disponible, couleur, gras=True)
     disponible_mission.short_description = "Reliquat mission"
+    disponible_mission.admin_order_field = "statistiques__reliquat_mission"
 
     class Media:
         css = { "all" : ("admin/css/hide_admin_original.css",) }
+
+
+# Tâches en arrière-plan
+@admin.register(Tache)
+class TacheAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'nom', 'etat', 'barre_progression', 'message', 'tentatives', 'cree_le', 'termine_le')
+    list_filter = ('etat', 'nom')
+    search_fields = ('cle',)
+    readonly_fields = (
+        'nom', 'cle', 'arguments', 'etat', 'progression', 'message', 'tentatives', 'tentatives_max',
+        'resultat', 'erreur', 'travailleur', 'cree_le', 'executer_apres', 'debute_le', 'fin_bail', 'termine_le',
+    )
+    actions = ('relance',)
+
+    def has_add_permission(self, request):
+        # Les tâches sont planifiées par l'application
+        return False
+
+    def barre_progression(self, obj):
+        return format_html('<progress value="{}" max="100"></progress> {} %', obj.progression, obj.progression)
+    barre_progression.short_description = "Progression"
+    barre_progression.admin_order_field = "progression"
+
+    def relance(self, request, queryset):
+        """
+        Remet en attente les tâches sélectionnées qui ne sont pas en cours
+        """
+        nombre = 0
+        for tache in queryset.exclude(etat=Tache.EN_COURS):
+            tache.remet_en_attente()
+            tache.save()
+            nombre += 1
+        self.message_user(request, f"{nombre} tâche(s) remise(s) en attente.")
+    relance.short_description = "Relancer les tâches sélectionnées"
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class BlogConfig(AppConfig):
     name = 'blog'
     verbose_name = 'Gestion des cas'
+
+    def ready(self):
+        from .signals import connecte_signaux
+        connecte_signaux()
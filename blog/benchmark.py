@@ -0,0 +1,189 @@
+"""
+Mesure des pages de l'interface d'administration
+
+Un jeu de données synthétique est généré à l'échelle choisie, puis chaque page
+(liste et fiche) des réunions, cas, membres et bénéficiaires est affichée :
+le nombre de requêtes SQL, la durée et le pic de mémoire sont relevés.
+Les mesures de référence sont conservées dans benchmarks/references.json ;
+les tests vérifient que le nombre de requêtes d'aucune page ne les dépasse.
+"""
+import json
+import os
+import time
+import tracemalloc
+
+from django.core.cache import cache
+from django.db import connection, connections, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from .generateur import GenerateurDonnees
+from .models import ProvUser, Reunion, Beneficiaire, Cas
+from .sauvegarde import EcritureBase
+
+
+FICHIER_REFERENCES = os.path.join(os.path.dirname(__file__), "benchmarks", "references.json")
+
+# Volumes de données de chaque échelle
+ECHELLES = {
+    'test': {'reunions': 3, 'membres': 10, 'beneficiaires': 20, 'cas': 30, 'affectations': 4},
+    'petite': {'reunions': 10, 'membres': 50, 'beneficiaires': 200, 'cas': 300, 'affectations': 10},
+    'moyenne': {'reunions': 100, 'membres': 500, 'beneficiaires': 2000, 'cas': 3000, 'affectations': 20},
+    'grande': {'reunions': 1000, 'membres': 5000, 'beneficiaires': 8000, 'cas': 12000, 'affectations': 20},
+}
+
+
+def genere_jeu(reunions, membres, beneficiaires, cas, affectations, graine=0):
+    """
+    Génère un jeu de données synthétique cohérent (voir generateur.py).
+    Le nombre d'affectations est donné par réunion.
+    Retourne le super-utilisateur créé pour afficher les pages.
+    """
+    admin = ProvUser.objects.create_superuser(
+        username=f"bench{graine}", email="bench@providence.ci", password=None,
+        first_name="Bench", last_name="Admin",
+    )
+    GenerateurDonnees(EcritureBase(), graine=graine).genere(
+        membres=membres,
+        reunions=reunions,
+        beneficiaires=beneficiaires,
+        cas_par_reunion=max(1, cas // max(1, reunions)),
+        affectations_par_reunion=affectations,
+    )
+    return admin
+
+
+def pages_admin():
+    """
+    Retourne les pages à mesurer sous forme de dictionnaire {nom: url}
+    """
+    reunion = Reunion.objects.order_by('-date_reunion').first()
+    cas = Cas.objects.filter(reunion=reunion).order_by('pk').first()
+    membre = ProvUser.objects.filter(is_superuser=False).order_by('pk').first()
+    beneficiaire = Beneficiaire.objects.order_by('pk').first()
+    pages = {
+        'reunion_liste': "/admin/blog/reunion/",
+        'reunion_fiche': f"/admin/blog/reunion/{reunion.pk}/change/",
+        'cas_liste': f"/admin/blog/cas/?reunion={reunion.pk}",
+        'cas_fiche': f"/admin/blog/cas/{cas.pk}/change/",
+        'membre_liste': "/admin/blog/membre/",
+        'membre_fiche': f"/admin/blog/membre/{membre.pk}/change/",
+        'beneficiaire_liste': "/admin/blog/beneficiaire/",
+        'beneficiaire_fiche': f"/admin/blog/beneficiaire/{beneficiaire.pk}/change/",
+    }
+    return pages
+
+
+def mesure_page(client, url):
+    """
+    Affiche une page, cache vidé, et retourne ses mesures :
+    nombre de requêtes, durée (ms) et pic de mémoire (Ko).
+    La mémoire est relevée lors d'un second affichage, le suivi des allocations
+    ralentissant l'exécution.
+    """
+    cache.clear()
+    # Le journal des requêtes est limité : le vider pour que le décompte soit exact
+    reset_queries()
+    debut = time.perf_counter()
+    with CaptureQueriesContext(connection) as requetes:
+        reponse = client.get(url)
+    duree = (time.perf_counter() - debut) * 1000
+    if reponse.status_code != 200:
+        raise AssertionError(f"{url} : code de retour {reponse.status_code}")
+
+    cache.clear()
+    tracemalloc.start()
+    client.get(url)
+    _, pic = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'requetes': len(requetes),
+        'duree_ms': round(duree, 1),
+        'memoire_ko': pic // 1024,
+    }
+
+
+def mesure_pages(admin, pages=None):
+    """
+    Mesure toutes les pages d'administration (ou celles fournies)
+    """
+    client = Client()
+    client.force_login(admin)
+    pages = pages or pages_admin()
+    # Le stockage des fichiers statiques de production exige un collectstatic préalable
+    with override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage'):
+        return {nom: mesure_page(client, url) for nom, url in pages.items()}
+
+
+def centile(valeurs, rang):
+    """
+    Centile des valeurs fournies (méthode du rang le plus proche)
+    """
+    valeurs = sorted(valeurs)
+    indice = max(0, -(-rang * len(valeurs) // 100) - 1)
+    return valeurs[indice]
+
+
+def mesure_latences(admin, pages, repetitions, conn_max_age):
+    """
+    Affiche chaque page le nombre de fois demandé, avec la durée de vie des connexions
+    fournie (0 : une connexion par requête), et retourne les latences médiane
+    et du 99e centile (ms) de chaque page.
+    Doit être appelée hors transaction, pour que les connexions puissent être fermées.
+    """
+    connexion = connections['default']
+    conn_max_age_initial = connexion.settings_dict['CONN_MAX_AGE']
+    connexion.settings_dict['CONN_MAX_AGE'] = conn_max_age
+    connexion.close()
+    client = Client()
+    client.force_login(admin)
+    resultats = {}
+    try:
+        with override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage'):
+            for nom, url in pages.items():
+                client.get(url)  # Préchauffage (cache, gabarits)
+                durees = []
+                for _ in range(repetitions):
+                    debut = time.perf_counter()
+                    reponse = client.get(url)
+                    durees.append((time.perf_counter() - debut) * 1000)
+                    if reponse.status_code != 200:
+                        raise AssertionError(f"{url} : code de retour {reponse.status_code}")
+                resultats[nom] = {'p50_ms': round(centile(durees, 50), 1), 'p99_ms': round(centile(durees, 99), 1)}
+    finally:
+        connexion.close()
+        connexion.settings_dict['CONN_MAX_AGE'] = conn_max_age_initial
+    return resultats
+
+
+def charge_references():
+    """
+    Mesures de référence, par échelle puis par page
+    """
+    if not os.path.exists(FICHIER_REFERENCES):
+        return {}
+    with open(FICHIER_REFERENCES, "r", encoding="utf-8") as fichier:
+        return json.load(fichier)
+
+
+def enregistre_references(echelle, mesures):
+    """
+    Enregistre les mesures comme nouvelles références de l'échelle
+    """
+    references = charge_references()
+    references[echelle] = mesures
+    os.makedirs(os.path.dirname(FICHIER_REFERENCES), exist_ok=True)
+    with open(FICHIER_REFERENCES, "w", encoding="utf-8") as fichier:
+        json.dump(references, fichier, indent=4, sort_keys=True)
+        fichier.write("\n")
+
+
+def regressions(mesures, references):
+    """
+    Liste des pages dont le nombre de requêtes dépasse la référence
+    """
+    return [
+        (page, mesure['requetes'], references[page]['requetes'])
+        for page, mesure in sorted(mesures.items())
+        if page in references and mesure['requetes'] > references[page]['requetes']
+    ]
@@ -0,0 +1,146 @@
+"""
+Mise en cache des données de l'interface d'administration
+
+Chaque modèle surveillé possède un numéro de version conservé dans le cache.
+Les clés des données calculées incluent les versions des modèles dont elles
+dépendent : incrémenter la version d'un modèle (à chaque enregistrement ou
+suppression, via les signaux) rend donc obsolètes toutes les données qui
+en dépendent, sans avoir à les rechercher.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .transactions import a_la_validation
+
+
+PREFIXE = "providence"
+
+
+def cle_version(modele):
+    """
+    Clé de cache de la version d'un modèle (un modèle proxy partage
+    la version de son modèle concret)
+    """
+    return f"{PREFIXE}:version:{modele._meta.concrete_model._meta.label_lower}"
+
+
+def versions(*modeles):
+    """
+    Retourne les versions courantes des modèles fournis
+    """
+    cles = [cle_version(modele) for modele in modeles]
+    trouvees = cache.get_many(cles)
+    resultat = []
+    for cle in cles:
+        version = trouvees.get(cle)
+        if version is None:
+            # Version initiale basée sur l'heure pour ne pas réutiliser
+            # une version déjà attribuée avant une éviction du cache
+            cache.add(cle, int(time.time() * 1000), None)
+            version = cache.get(cle)
+        resultat.append(version)
+    return resultat
+
+
+def incremente_versions(modeles):
+    """
+    Incrémente les versions des modèles fournis
+    """
+    for modele in modeles:
+        cle = cle_version(modele)
+        try:
+            cache.incr(cle)
+        except ValueError:
+            # La version n'existe pas (encore) dans le cache
+            cache.set(cle, int(time.time() * 1000), None)
+
+
+def invalide_modele(modele, using=DEFAULT_DB_ALIAS):
+    """
+    Incrémente la version d'un modèle : les données qui en dépendent sont recalculées.
+    L'incrémentation a lieu à la validation de la transaction en cours : une donnée
+    calculée avant la validation, à partir des lignes précédentes, serait sinon
+    conservée sous la nouvelle version.
+    """
+    a_la_validation("cache", incremente_versions, {modele}, using=using)
+
+
+def cle_donnee(nom, modeles, *parametres):
+    """
+    Clé de cache d'une donnée calculée, dépendant des versions des modèles fournis
+    """
+    version = "-".join(str(v) for v in versions(*modeles))
+    suffixe = ":".join(str(parametre) for parametre in parametres)
+    return f"{PREFIXE}:{nom}:{suffixe}:{version}"
+
+
+def en_cache(nom, modeles, calcul, *parametres):
+    """
+    Lecture au travers du cache : retourne la donnée si elle est présente
+    pour les versions courantes des modèles, sinon la calcule et la conserve
+    """
+    cle = cle_donnee(nom, modeles, *parametres)
+    donnee = cache.get(cle)
+    if donnee is None:
+        donnee = calcul(*parametres)
+        cache.set(cle, donnee)
+    return donnee
+
+
+def invalide_modele_recepteur(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Récepteur des signaux post_save / post_delete des modèles surveillés
+    """
+    invalide_modele(sender, using=using)
+
+
+def choix_reunions():
+    """
+    Retourne la liste des réunions sous forme de tuples (identifiant, libellé),
+    de la plus récente à la plus ancienne.
+    La liste est construite en une seule requête puis conservée en cache
+    jusqu'à la modification d'une réunion ou d'un membre.
+    """
+    from .models import ProvUser, Reunion
+
+    def calcul():
+        reunions = Reunion.objects.values_list(
+            'pk',
+            'date_reunion',
+            'lieu_reunion',
+            'membre_hote__first_name',
+            'membre_hote__last_name',
+        )
+        return [
+            (str(pk), Reunion.libelle(date_reunion, f"{prenom} {nom}", lieu_reunion))
+            for pk, date_reunion, lieu_reunion, prenom, nom in reunions
+        ]
+
+    return en_cache("choix_reunions", (Reunion, ProvUser), calcul)
+
+
+def reunion_recente():
+    """
+    Identifiant de la réunion la plus récente (None s'il n'y a aucune réunion)
+    """
+    choix = choix_reunions()
+    return choix[0][0] if choix else None
+
+
+def choix_membres():
+    """
+    Retourne la liste des membres (personnes physiques) sous forme de tuples
+    (identifiant, nom), conservée en cache jusqu'à la modification d'un membre
+    """
+    from .models import Membre
+
+    def calcul():
+        membres = Membre.objects\
+            .filter(personne_physique=True)\
+            .values_list('pk', 'first_name', 'last_name')
+        return [(pk, f"{prenom} {nom}") for pk, prenom, nom in membres]
+
+    return en_cache("choix_membres", (Membre,), calcul)
+
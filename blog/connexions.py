@@ -0,0 +1,44 @@
+"""
+Vérification des connexions persistantes à la base de données
+
+Avec des connexions persistantes (CONN_MAX_AGE > 0), une connexion restée
+inutilisée peut avoir été fermée par le serveur ou par le réseau : la première
+requête SQL de la requête HTTP suivante échouerait alors. Au début de chaque
+requête HTTP, une connexion inutilisée depuis plus de DB_HEALTH_CHECK_DELAY
+secondes est donc vérifiée (requête triviale) et fermée si elle n'est plus
+utilisable ; Django en ouvre une nouvelle à la première requête SQL.
+"""
+import time
+
+from django.conf import settings
+from django.db import connections
+
+
+def verifie_connexions(**kwargs):
+    """
+    Récepteur du signal request_started : ferme les connexions persistantes
+    devenues inutilisables
+    """
+    delai = getattr(settings, 'DB_HEALTH_CHECK_DELAY', -1)
+    if delai < 0:
+        return
+    maintenant = time.monotonic()
+    for connexion in connections.all():
+        if connexion.connection is None or connexion.in_atomic_block:
+            continue
+        derniere_utilisation = getattr(connexion, 'derniere_utilisation', None)
+        if derniere_utilisation is not None and maintenant - derniere_utilisation < delai:
+            continue
+        if not connexion.is_usable():
+            connexion.close()
+
+
+def memorise_utilisation(**kwargs):
+    """
+    Récepteur du signal request_finished : date la dernière utilisation
+    des connexions conservées
+    """
+    maintenant = time.monotonic()
+    for connexion in connections.all():
+        if connexion.connection is not None:
+            connexion.derniere_utilisation = maintenant
@@ -0,0 +1,43 @@
+"""
+Formatage des montants pour l'affichage dans l'interface
+
+Les montants sont formatés selon les règles françaises (chiffres groupés
+par milliers, virgule décimale) sans passer par le module locale : aucun
+appel à locale.setlocale, dont l'effet est global au processus et qui n'est
+pas sûr en présence de plusieurs threads.
+"""
+from functools import lru_cache
+
+from django.utils.html import format_html
+
+
+# Séparateurs de la locale fr_FR (glibc) : espace fine insécable et virgule
+SEPARATEUR_MILLIERS = "\u202f"
+SEPARATEUR_DECIMAL = ","
+
+# Conversion du format anglo-saxon produit par format() vers le format français
+_CONVERSION = str.maketrans({",": SEPARATEUR_MILLIERS, ".": SEPARATEUR_DECIMAL})
+
+
+# typed=True : 1 et 1.0 (ou Decimal) n'ont pas le même format et ne
+# doivent pas partager une entrée du cache
+@lru_cache(maxsize=4096, typed=True)
+def formatte_montant(valeur):
+    """
+    Formatte un nombre à la française, comme f'{valeur:n}' avec la locale fr_FR
+    (les nombres non entiers suivent le format général 'g')
+    """
+    if isinstance(valeur, int):
+        return format(valeur, ",").translate(_CONVERSION)
+    return format(valeur, ",g").translate(_CONVERSION)
+
+
+@lru_cache(maxsize=4096, typed=True)
+def formatte_nombre(valeur, couleur=None, gras=False):
+    """
+    Formatte des valeurs de montant pour un affichage correct dans l'interface
+    """
+    style_couleur = f'color: {couleur};' if couleur else ''
+    style_gras = f'font-weight: bold;' if gras else ''
+    montant = formatte_montant(valeur) if valeur is not None else '-'
+    return format_html(f'<div style="{style_gras}{style_couleur}text-align: right;">{montant}</div>')
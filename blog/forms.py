@@ -1,9 +1,10 @@
-import locale
-from sys import platform
 from django import forms
 from django.forms import ModelForm
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm
 from django.db.models import Q
+from .cache import choix_membres, choix_reunions
+from .formatage import formatte_montant
+from .referentiel import natures
 from .models import (
     ProvUser,
     Cas,
@@ -45,15 +46,25 @@ class CasCreationForm(ModelForm):
             'urgence',
         )
 
+    def __init__(self, *args, **kwargs):
+        super(CasCreationForm, self).__init__(*args, **kwargs)
+        # Listes de choix lues dans le cache (sans requête tant qu'elles sont à jour)
+        self.fields['soumis_par'].choices = [('', self.fields['soumis_par'].empty_label)] + choix_membres()
+        self.fields['reunion'].choices = [('', self.fields['reunion'].empty_label)] + choix_reunions()
+
 class CasChangeForm(ModelForm):
     """
     Formulaire utilisé pour la modification d'un Cas
     """
     def __init__(self, *args, **kwargs):
         super(CasChangeForm, self).__init__(*args, **kwargs)
+        # Le queryset ne sert qu'à la validation : les choix sont lus en mémoire
         self.fields['nature'].queryset = NatureBesoin.objects.filter(
             classification=self.instance.classification,
         )
+        self.fields['nature'].choices = natures.choix(classification=self.instance.classification)
+        if 'reunion' in self.fields:
+            self.fields['reunion'].choices = [('', self.fields['reunion'].empty_label)] + choix_reunions()
     # class Meta:
     #     model = Cas
     #     fields = ('',)
@@ -99,14 +110,6 @@ class CasChoiceField(forms.ModelChoiceField):
     - le montant alloué
     """
     def label_from_instance(self, obj):
-        # Affecter une localisation si nécessaire
-        if not bool(locale.getlocale()[0]):
-            if platform == "linux" or platform == "linux2":
-                locale.setlocale(locale.LC_ALL, 'fr_FR')
-            elif platform == "darwin":
-                locale.setlocale(locale.LC_ALL, 'fr_FR')
-            elif platform == "win32":
-                locale.setlocale(locale.LC_ALL, 'French_France.1252')
-        montant = f'{obj.montant_alloue:n}' if obj.montant_alloue is not None else ''
+        montant = formatte_montant(obj.montant_alloue) if obj.montant_alloue is not None else ''
         return f'{obj.beneficiaire} ({obj.classification} : {montant})'
 
@@ -0,0 +1,225 @@
+"""
+Génération de jeux de données synthétiques pour les tests de charge
+
+Les données sont produites au fil de l'eau, réunion par réunion, dans l'ordre
+des dépendances (membres, bénéficiaires, puis pour chaque réunion : présences,
+cotisations, cas, natures et affectations). Les identifiants sont attribués
+par le générateur, ce qui permet d'écrire les objets par lots sans relire la
+base : soit directement en base (bulk_create), soit dans un fichier NDJSON
+(un objet sérialisé par ligne, au format des fixtures Django).
+La mémoire utilisée ne dépend pas du volume généré.
+"""
+import random
+from collections import OrderedDict
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db.models import Max
+
+from .models import (
+    ProvUser,
+    Reunion,
+    Beneficiaire,
+    NatureBesoin,
+    Cas,
+    Cotisation,
+    AffectationNonLibere,
+)
+
+
+Presence = Reunion.liste_presence.through
+NatureCas = Cas.nature.through
+
+# Ordre d'écriture des modèles (dépendances des clés étrangères)
+MODELES = (ProvUser, Beneficiaire, Reunion, Presence, Cotisation, Cas, NatureCas, AffectationNonLibere)
+
+
+def attributs_beneficiaire(pk):
+    """
+    Attributs d'un bénéficiaire, déduits de son identifiant : les cas peuvent
+    ainsi recopier les attributs de leur bénéficiaire sans les conserver en mémoire
+    """
+    melange = (pk * 2654435761) % 2 ** 32
+    return {
+        'nom': f"Nom{pk}",
+        'prenoms': f"Prénoms{pk}",
+        'sexe': 'FM'[melange % 2],
+        'situation_matrimoniale': 'CMDV'[melange // 2 % 4],
+        'nb_enfants': melange // 8 % 9,
+    }
+
+
+class GenerateurDonnees:
+    """
+    Générateur de données synthétiques référentiellement cohérentes
+    """
+    def __init__(self, ecriture, graine=0, taille_lot=1000, using='default'):
+        self.ecriture = ecriture
+        self.aleatoire = random.Random(graine)
+        self.taille_lot = taille_lot
+        self.using = using
+        self.tampons = OrderedDict((modele, []) for modele in MODELES)
+        self.nombres = OrderedDict((modele._meta.label_lower, 0) for modele in MODELES)
+        self.prochains_pk = {}
+
+    def pk(self, modele):
+        """
+        Attribue l'identifiant suivant du modèle (à partir du plus grand existant)
+        """
+        if modele not in self.prochains_pk:
+            maximum = modele.objects.using(self.using).aggregate(maximum=Max('pk'))['maximum']
+            self.prochains_pk[modele] = (maximum or 0) + 1
+        pk = self.prochains_pk[modele]
+        self.prochains_pk[modele] += 1
+        return pk
+
+    def ajoute(self, objet):
+        """
+        Place un objet dans le tampon de son modèle ; les tampons sont écrits
+        dans l'ordre des dépendances dès que l'un d'eux est plein
+        """
+        tampon = self.tampons[type(objet)]
+        tampon.append(objet)
+        if len(tampon) >= self.taille_lot:
+            self.vide_tampons()
+
+    def vide_tampons(self):
+        for modele, tampon in self.tampons.items():
+            if tampon:
+                self.ecriture.ecrit(modele, tampon)
+                self.nombres[modele._meta.label_lower] += len(tampon)
+                self.tampons[modele] = []
+
+    def genere(self, membres, reunions, beneficiaires, cas_par_reunion, affectations_par_reunion,
+               taux_presence=0.6, taux_liberation=0.7, taux_urgence=0.1):
+        """
+        Génère le jeu de données complet et retourne le nombre d'objets écrits par modèle
+        """
+        aleatoire = self.aleatoire
+
+        # Membres
+        cotisants = []
+        ids_membres = []
+        for _ in range(membres):
+            pk = self.pk(ProvUser)
+            membre = ProvUser(
+                pk=pk,
+                username=f"membre{pk}",
+                password=make_password(None),  # Mot de passe inutilisable, sans hachage coûteux
+                first_name=f"Prénom{pk}",
+                last_name=f"Nom{pk}",
+                email=f"membre{pk}@providence.ci",
+                is_staff=True,
+                sexe=aleatoire.choice('FM'),
+                cotisation_social=aleatoire.choice((0, 5000, 10000, 20000)),
+                cotisation_mission=aleatoire.choice((0, 5000, 10000)),
+                peut_cotiser=aleatoire.random() < 0.9,
+            )
+            ids_membres.append(membre.pk)
+            if membre.peut_cotiser:
+                cotisants.append((membre.pk, membre.cotisation_social, membre.cotisation_mission))
+            self.ajoute(membre)
+
+        # Bénéficiaires
+        ids_beneficiaires = []
+        for _ in range(beneficiaires):
+            pk = self.pk(Beneficiaire)
+            beneficiaire = Beneficiaire(pk=pk, **attributs_beneficiaire(pk))
+            ids_beneficiaires.append(beneficiaire.pk)
+            self.ajoute(beneficiaire)
+
+        natures = {
+            classification: list(
+                NatureBesoin.objects.using(self.using)
+                    .filter(classification=classification)
+                    .values_list('pk', flat=True)
+            )
+            for classification in ('S', 'M')
+        }
+
+        # Réunions, avec leurs présences, cotisations, cas et affectations
+        debut = date(2000, 1, 1)
+        for i in range(reunions):
+            reunion = Reunion(
+                pk=self.pk(Reunion),
+                membre_hote_id=aleatoire.choice(ids_membres),
+                date_reunion=debut + timedelta(days=30 * i),
+                lieu_reunion=f"Lieu{i % 50}",
+            )
+            self.ajoute(reunion)
+
+            for membre in ids_membres:
+                if aleatoire.random() < taux_presence:
+                    self.ajoute(Presence(pk=self.pk(Presence), reunion_id=reunion.pk, provuser_id=membre))
+
+            cotisations = []
+            for membre, social, mission in cotisants:
+                cotisation = Cotisation(
+                    pk=self.pk(Cotisation),
+                    membre_id=membre,
+                    reunion_id=reunion.pk,
+                    montant_social=social or 0,
+                    social_libere=aleatoire.random() < taux_liberation,
+                    montant_mission=mission or 0,
+                    mission_libere=aleatoire.random() < taux_liberation,
+                )
+                cotisation.solde_social = 0 if cotisation.social_libere else cotisation.montant_social
+                cotisation.solde_mission = 0 if cotisation.mission_libere else cotisation.montant_mission
+                cotisations.append(cotisation)
+
+            liste_cas = []
+            for beneficiaire in aleatoire.sample(ids_beneficiaires, min(cas_par_reunion, len(ids_beneficiaires))):
+                classification = aleatoire.choice('SM')
+                urgence = aleatoire.random() < taux_urgence
+                montant = aleatoire.randint(1, 50) * 5000
+                cas = Cas(
+                    pk=self.pk(Cas),
+                    reunion_id=reunion.pk,
+                    beneficiaire_id=beneficiaire,
+                    soumis_par_id=aleatoire.choice(ids_membres),
+                    # Attributs recopiés du bénéficiaire (voir Cas.save)
+                    **attributs_beneficiaire(beneficiaire),
+                    classification=classification,
+                    urgence=urgence,
+                    montant_sollicite=montant,
+                    montant_alloue=montant if urgence else aleatoire.randint(0, montant // 5000) * 5000,
+                )
+                liste_cas.append(cas)
+
+            # Les affectations portent sur les cotisations non libérées et diminuent leurs soldes
+            non_liberees = [c for c in cotisations if not (c.social_libere and c.mission_libere)]
+            affectations = []
+            if non_liberees and liste_cas:
+                for _ in range(affectations_par_reunion):
+                    cotisation = aleatoire.choice(non_liberees)
+                    cas = aleatoire.choice(liste_cas)
+                    somme = aleatoire.randint(1, 10) * 1000
+                    if cas.classification == 'S':
+                        cotisation.solde_social -= somme
+                    else:
+                        cotisation.solde_mission -= somme
+                    affectations.append(AffectationNonLibere(
+                        pk=self.pk(AffectationNonLibere),
+                        reunion_id=reunion.pk,
+                        cotisation_id=cotisation.pk,
+                        collecteur_id=aleatoire.choice(ids_membres),
+                        somme=somme,
+                        cas_id=cas.pk,
+                    ))
+
+            for cotisation in cotisations:
+                self.ajoute(cotisation)
+            for cas in liste_cas:
+                self.ajoute(cas)
+                if natures[cas.classification]:
+                    self.ajoute(NatureCas(
+                        pk=self.pk(NatureCas),
+                        cas_id=cas.pk,
+                        naturebesoin_id=aleatoire.choice(natures[cas.classification]),
+                    ))
+            for affectation in affectations:
+                self.ajoute(affectation)
+
+        self.vide_tampons()
+        self.ecriture.termine(MODELES)
+        return self.nombres
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from blog.benchmark import (
+    ECHELLES,
+    genere_jeu,
+    mesure_pages,
+    charge_references,
+    enregistre_references,
+    regressions,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le nombre de requêtes, la durée et la mémoire de chaque page d'administration "
+        "sur un jeu de données synthétique (annulé en fin de mesure)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--echelle', choices=sorted(ECHELLES), default='petite', help="volume du jeu de données")
+        parser.add_argument('--graine', type=int, default=0, help="graine du générateur aléatoire")
+        parser.add_argument(
+            '--enregistrer',
+            action='store_true',
+            help="enregistre les mesures comme références de l'échelle",
+        )
+
+    def handle(self, *args, **options):
+        echelle = options['echelle']
+        with transaction.atomic():
+            self.stdout.write(f"Génération du jeu de données ({echelle})...")
+            admin = genere_jeu(graine=options['graine'], **ECHELLES[echelle])
+            mesures = mesure_pages(admin)
+            # Le jeu de données n'est pas conservé
+            transaction.set_rollback(True)
+
+        for page, mesure in sorted(mesures.items()):
+            self.stdout.write(
+                f"{page:20} {mesure['requetes']:6} requêtes {mesure['duree_ms']:10.1f} ms {mesure['memoire_ko']:8} Ko"
+            )
+
+        if options['enregistrer']:
+            enregistre_references(echelle, mesures)
+            self.stdout.write(self.style.SUCCESS("Références enregistrées"))
+            return
+
+        references = charge_references().get(echelle, {})
+        erreurs = regressions(mesures, references)
+        for page, requetes, reference in erreurs:
+            self.stderr.write(self.style.ERROR(f"{page} : {requetes} requêtes (référence : {reference})"))
+        if erreurs:
+            raise CommandError(f"{len(erreurs)} page(s) en régression")
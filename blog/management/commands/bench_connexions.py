@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.benchmark import mesure_latences, pages_admin
+from blog.models import ProvUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure les latences médiane et du 99e centile de chaque page d'administration, "
+        "avec une connexion à la base par requête puis avec des connexions persistantes. "
+        "Avec DB_POOL=pgbouncer, le premier mode mesure les connexions au pooler local."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repetitions', type=int, default=50, help="nombre d'affichages de chaque page")
+        parser.add_argument('--utilisateur', help="super-utilisateur affichant les pages (par défaut : le premier)")
+        parser.add_argument(
+            '--conn-max-age',
+            type=int,
+            default=600,
+            help="durée de vie des connexions persistantes (secondes)",
+        )
+
+    def handle(self, *args, **options):
+        administrateurs = ProvUser.objects.filter(is_superuser=True).order_by('pk')
+        if options['utilisateur']:
+            administrateurs = administrateurs.filter(username=options['utilisateur'])
+        admin = administrateurs.first()
+        if admin is None:
+            raise CommandError("Aucun super-utilisateur pour afficher les pages")
+        pages = pages_admin()
+
+        sans_persistance = "pgbouncer" if settings.DB_POOL == 'pgbouncer' else "sans persistance"
+        modes = ((sans_persistance, 0), ("persistantes", options['conn_max_age']))
+        mesures = {
+            mode: mesure_latences(admin, pages, options['repetitions'], conn_max_age)
+            for mode, conn_max_age in modes
+        }
+
+        self.stdout.write(f"{'page':20} " + " ".join(f"{mode + ' p50/p99 (ms)':>36}" for mode, _ in modes))
+        for page in sorted(pages):
+            colonnes = " ".join(
+                f"{mesures[mode][page]['p50_ms']:>17.1f} {mesures[mode][page]['p99_ms']:>18.1f}"
+                for mode, _ in modes
+            )
+            self.stdout.write(f"{page:20} {colonnes}")
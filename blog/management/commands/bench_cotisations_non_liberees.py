@@ -0,0 +1,63 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from blog.models import Cotisation, VueCotisationNonLiberee
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare les temps d'obtention des restes de cotisations non libérées : "
+        "soldes enregistrés, requête ORM portable et vue PostgreSQL v_cotisation_non_liberee"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reunion', type=int, help="identifiant de la réunion (par défaut : toutes)")
+        parser.add_argument('--repetitions', type=int, default=20, help="nombre d'exécutions de chaque requête")
+
+    def handle(self, *args, **options):
+        champs = ('pk', 'reste_cotis_social', 'reste_cotis_mission')
+        soldes = Cotisation.objects.non_liberees()
+        orm = Cotisation.objects.non_liberees().avec_restes()
+        vue = VueCotisationNonLiberee.objects.all()
+        if options['reunion']:
+            soldes = soldes.filter(reunion_id=options['reunion'])
+            orm = orm.filter(reunion_id=options['reunion'])
+            vue = vue.filter(reunion_id=options['reunion'])
+
+        resultat_soldes = self.mesure(
+            "Soldes", soldes.values_list('pk', 'solde_social', 'solde_mission'), options['repetitions']
+        )
+        resultat_orm = self.mesure("ORM", orm.values_list(*champs), options['repetitions'])
+        self.compare(resultat_soldes, resultat_orm)
+
+        if connection.vendor != 'postgresql':
+            self.stdout.write(f"Vue : non disponible sur la base {connection.vendor}")
+            return
+
+        resultat_vue = self.mesure("Vue", vue.values_list(*champs), options['repetitions'])
+        self.compare(resultat_orm, resultat_vue)
+
+    def compare(self, lignes, lignes_reference):
+        if sorted(lignes) != sorted(lignes_reference):
+            self.stderr.write(self.style.ERROR("Les deux calculs donnent des résultats différents"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Les deux calculs donnent des résultats identiques"))
+
+    def mesure(self, nom, queryset, repetitions):
+        """
+        Exécute la requête plusieurs fois et affiche les durées (en millisecondes)
+        """
+        durees = []
+        for _ in range(repetitions):
+            debut = time.perf_counter()
+            lignes = list(queryset.all())
+            durees.append((time.perf_counter() - debut) * 1000)
+        self.stdout.write(
+            f"{nom} : {len(lignes)} lignes, "
+            f"médiane {statistics.median(durees):.2f} ms, "
+            f"min {min(durees):.2f} ms, max {max(durees):.2f} ms"
+        )
+        return lignes
@@ -0,0 +1,76 @@
+import locale
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.html import format_html
+
+from blog.formatage import formatte_montant, formatte_nombre
+from blog.models import Cas, Cotisation
+
+
+def formatte_nombre_locale(valeur, couleur=None, gras=False):
+    """
+    Ancien formatage basé sur le module locale (référence pour la comparaison)
+    """
+    style_couleur = f'color: {couleur};' if couleur else ''
+    style_gras = f'font-weight: bold;' if gras else ''
+    montant = f'{valeur:n}' if valeur is not None else '-'
+    return format_html(f'<div style="{style_gras}{style_couleur}text-align: right;">{montant}</div>')
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare le formatage des montants par le module locale et par blog.formatage "
+        "sur les montants d'une page réunion"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reunion', type=int, help="réunion dont les montants sont formatés (par défaut : montants aléatoires)")
+        parser.add_argument('--pages', type=int, default=100, help="nombre d'affichages de la page simulés")
+
+    def handle(self, *args, **options):
+        montants = self.montants_page(options['reunion'])
+        self.stdout.write(f"{len(montants)} montants par page, {options['pages']} pages")
+
+        try:
+            locale.setlocale(locale.LC_NUMERIC, 'fr_FR.UTF-8')
+        except locale.Error:
+            self.stdout.write("Locale fr_FR.UTF-8 indisponible : la référence utilise la locale courante")
+        else:
+            # Montants absents (None) formatés comme dans l'administration
+            differences = [m for m in montants if formatte_nombre_locale(m) != formatte_nombre(m)]
+            if differences:
+                self.stderr.write(self.style.ERROR(f"{len(differences)} montant(s) formaté(s) différemment"))
+            else:
+                self.stdout.write(self.style.SUCCESS("Formatages identiques"))
+
+        duree_locale = self.mesure(formatte_nombre_locale, montants, options['pages'])
+        formatte_nombre.cache_clear()
+        formatte_montant.cache_clear()
+        duree = self.mesure(formatte_nombre, montants, options['pages'])
+        self.stdout.write(f"Module locale  : {duree_locale:.2f} ms par page")
+        self.stdout.write(f"blog.formatage : {duree:.2f} ms par page (x{duree_locale / duree:.1f})")
+
+    def montants_page(self, reunion):
+        """
+        Montants affichés sur une page réunion : ceux des cas et des cotisations,
+        ou à défaut un jeu aléatoire de taille comparable
+        """
+        if reunion:
+            montants = []
+            for ligne in Cas.objects.filter(reunion_id=reunion).values_list('montant_sollicite', 'montant_alloue'):
+                montants.extend(ligne)
+            for ligne in Cotisation.objects.filter(reunion_id=reunion).values_list(
+                    'montant_social', 'montant_mission', 'solde_social', 'solde_mission'):
+                montants.extend(ligne)
+            return montants
+        aleatoire = random.Random(0)
+        return [aleatoire.choice((0, 5000, 10000, 20000, aleatoire.randint(0, 2000000))) for _ in range(600)]
+
+    def mesure(self, fonction, montants, pages):
+        debut = time.perf_counter()
+        for _ in range(pages):
+            for montant in montants:
+                fonction(montant, 'green' if montant and montant > 0 else None, gras=True)
+        return (time.perf_counter() - debut) * 1000 / pages
@@ -0,0 +1,62 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+
+from blog import repartition
+from blog.models import BilanReunion, Cas, Cotisation, Reunion
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure la répartition en lot des cotisations de l'historique des réunions "
+        "(blog.repartition) et la compare aux bilans des réunions"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repetitions', type=int, default=20, help="nombre de calculs de la répartition")
+
+    def handle(self, *args, **options):
+        reunions = Reunion.objects.all()
+
+        debut = time.perf_counter()
+        repartitions = repartition.repartitions_reunions(reunions)
+        self.stdout.write(
+            f"{reunions.count()} réunions chargées et réparties en {(time.perf_counter() - debut) * 1000:.2f} ms"
+        )
+
+        # Calcul seul, sur les données déjà chargées (simulations)
+        cas = list(
+            Cas.objects
+                .order_by('reunion', 'pk')
+                .values_list('reunion_id', 'classification', 'montant_sollicite', 'urgence', 'montant_alloue')
+        )
+        cotisations = {}
+        for pk, social, mission in Cotisation.objects\
+                .order_by()\
+                .values('reunion_id')\
+                .annotate(social=Sum('montant_social'), mission=Sum('montant_mission'))\
+                .values_list('reunion_id', 'social', 'mission'):
+            cotisations[(pk, 'S')], cotisations[(pk, 'M')] = social, mission
+        durees = []
+        for _ in range(options['repetitions']):
+            debut = time.perf_counter()
+            repartition.repartit_lot(cas, cotisations)
+            durees.append((time.perf_counter() - debut) * 1000)
+        self.stdout.write(
+            f"Répartition de {len(cas)} cas : médiane {statistics.median(durees):.2f} ms, "
+            f"min {min(durees):.2f} ms, max {max(durees):.2f} ms"
+        )
+
+        differences = 0
+        for montants in BilanReunion.agrege_reunions(reunions):
+            bilan = BilanReunion(**montants)
+            for classification, disponible in (('S', bilan.disponible_social), ('M', bilan.disponible_mission)):
+                resultat = repartitions.get((montants['pk'], classification))
+                if (resultat.reliquat if resultat else 0) != disponible:
+                    differences += 1
+        if differences:
+            self.stderr.write(self.style.ERROR(f"{differences} reliquat(s) différent(s) de ceux des bilans"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Reliquats identiques à ceux des bilans"))
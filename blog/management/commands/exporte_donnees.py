@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.sauvegarde import exporte
+
+
+class Command(BaseCommand):
+    help = (
+        "Sauvegarde les données de Providence dans un fichier NDJSON (compressé si le nom "
+        "se termine par .gz), en flux et dans l'ordre des dépendances"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier', help="fichier de sauvegarde à produire")
+        parser.add_argument('--taille-lot', type=int, default=2000, help="nombre d'objets lus par requête")
+        parser.add_argument('--database', default='default', help="base de données source")
+
+    def handle(self, *args, **options):
+        debut = time.perf_counter()
+        nombres = exporte(options['fichier'], taille_lot=options['taille_lot'], using=options['database'])
+        duree = time.perf_counter() - debut
+
+        for modele, nombre in nombres.items():
+            self.stdout.write(f"{modele:35} {nombre:10}")
+        total = sum(nombres.values())
+        self.stdout.write(self.style.SUCCESS(f"{total} objets exportés en {duree:.1f} s"))
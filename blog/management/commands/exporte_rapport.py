@@ -0,0 +1,64 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from blog.models import Reunion
+from blog.rapports import FORMATS, RAPPORTS, TAILLE_LOT, contenu_rapport
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporte le rapport financier des réunions d'une période en CSV, XLSX ou HTML imprimable, "
+        "en flux (format déduit de l'extension du fichier)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier', help="fichier à produire (.csv, .xlsx ou .html)")
+        parser.add_argument('--debut', help="date de la première réunion (AAAA-MM-JJ)")
+        parser.add_argument('--fin', help="date de la dernière réunion (AAAA-MM-JJ)")
+        parser.add_argument(
+            '--reunion',
+            type=int,
+            action='append',
+            help="identifiant d'une réunion (option répétable, par défaut : toutes)",
+        )
+        parser.add_argument(
+            '--rapport',
+            choices=list(RAPPORTS),
+            default='synthese',
+            help="rapport exporté en CSV (les autres formats comportent tous les rapports)",
+        )
+        parser.add_argument('--taille-lot', type=int, default=TAILLE_LOT, help="nombre de lignes lues par requête")
+        parser.add_argument('--database', default='default', help="base de données source")
+
+    def handle(self, *args, **options):
+        format = os.path.splitext(options['fichier'])[1].lstrip('.').lower()
+        if format not in FORMATS:
+            raise CommandError(f"Format inconnu : {format} (formats possibles : {', '.join(FORMATS)})")
+
+        reunions = Reunion.objects.using(options['database'])
+        if options['reunion']:
+            reunions = reunions.filter(pk__in=options['reunion'])
+        titre = "Rapport financier"
+        for option, lookup, libelle in (('debut', 'gte', 'du'), ('fin', 'lte', 'au')):
+            if options[option]:
+                try:
+                    borne = parse_date(options[option])
+                except ValueError:
+                    borne = None
+                if borne is None:
+                    raise CommandError(f"Date invalide : {options[option]}")
+                reunions = reunions.filter(**{f"date_reunion__{lookup}": borne})
+                titre += f" {libelle} {borne.strftime('%d/%m/%Y')}"
+
+        debut = time.perf_counter()
+        contenu = contenu_rapport(
+            format, reunions, rapport=options['rapport'], titre=titre, taille_lot=options['taille_lot'],
+        )
+        with open(options['fichier'], 'wb') as fichier:
+            for morceau in contenu:
+                fichier.write(morceau if isinstance(morceau, bytes) else morceau.encode())
+        duree = time.perf_counter() - debut
+        self.stdout.write(self.style.SUCCESS(f"Rapport exporté dans {options['fichier']} en {duree:.1f} s"))
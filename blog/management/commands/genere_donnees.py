@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.generateur import GenerateurDonnees
+from blog.sauvegarde import EcritureBase, EcritureNdjson
+
+
+class Command(BaseCommand):
+    help = (
+        "Génère un jeu de données synthétique pour les tests de charge : membres, bénéficiaires, "
+        "réunions avec présences, cotisations, cas et affectations. Les données sont écrites "
+        "en base par lots, ou dans un fichier NDJSON avec --sortie."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--membres', type=int, default=500)
+        parser.add_argument('--reunions', type=int, default=100)
+        parser.add_argument('--beneficiaires', type=int, default=2000)
+        parser.add_argument('--cas-par-reunion', type=int, default=30)
+        parser.add_argument('--affectations-par-reunion', type=int, default=20)
+        parser.add_argument('--taux-presence', type=float, default=0.6, help="probabilité de présence d'un membre")
+        parser.add_argument('--taux-liberation', type=float, default=0.7, help="probabilité qu'un montant soit libéré")
+        parser.add_argument('--taux-urgence', type=float, default=0.1, help="probabilité qu'un cas soit urgent")
+        parser.add_argument('--graine', type=int, default=0, help="graine du générateur aléatoire")
+        parser.add_argument('--taille-lot', type=int, default=2000, help="nombre d'objets écrits par lot")
+        parser.add_argument(
+            '--sortie',
+            help="fichier NDJSON à produire au lieu d'écrire en base (compressé si le nom se termine par .gz)",
+        )
+        parser.add_argument('--database', default='default', help="base de données cible")
+
+    def handle(self, *args, **options):
+        if options['sortie']:
+            ecriture = EcritureNdjson(options['sortie'])
+        else:
+            ecriture = EcritureBase(using=options['database'])
+        generateur = GenerateurDonnees(
+            ecriture,
+            graine=options['graine'],
+            taille_lot=options['taille_lot'],
+            using=options['database'],
+        )
+
+        debut = time.perf_counter()
+        nombres = generateur.genere(
+            membres=options['membres'],
+            reunions=options['reunions'],
+            beneficiaires=options['beneficiaires'],
+            cas_par_reunion=options['cas_par_reunion'],
+            affectations_par_reunion=options['affectations_par_reunion'],
+            taux_presence=options['taux_presence'],
+            taux_liberation=options['taux_liberation'],
+            taux_urgence=options['taux_urgence'],
+        )
+        duree = time.perf_counter() - debut
+
+        for modele, nombre in nombres.items():
+            self.stdout.write(f"{modele:35} {nombre:10}")
+        total = sum(nombres.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} objets générés en {duree:.1f} s ({total / max(duree, 1e-9):.0f} objets/s)"
+        ))
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.models import ProvUser, Reunion
+from blog.saisie import cree_cas
+from blog.sauvegarde import lit_objets, ouvre_fichier
+
+
+class Command(BaseCommand):
+    help = (
+        "Saisit en masse les cas d'une réunion depuis un fichier JSON (tableau ou NDJSON) : "
+        "un objet par cas, avec l'identifiant du bénéficiaire, la classification, l'urgence, "
+        "les montants et les identifiants des natures. Les bénéficiaires ayant déjà un cas "
+        "pour la réunion sont ignorés."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier', help="fichier des cas (compressé si le nom se termine par .gz)")
+        parser.add_argument('--reunion', type=int, help="identifiant de la réunion (par défaut : la plus récente)")
+        parser.add_argument('--soumis-par', help="identifiant de connexion du membre qui soumet les cas")
+        parser.add_argument('--database', default='default', help="base de données cible")
+
+    def handle(self, *args, **options):
+        using = options['database']
+        reunions = Reunion.objects.using(using)
+        if options['reunion']:
+            reunion = reunions.filter(pk=options['reunion']).first()
+        else:
+            reunion = reunions.order_by('-date_reunion').first()
+        if reunion is None:
+            raise CommandError("Réunion introuvable")
+        soumis_par = None
+        if options['soumis_par']:
+            soumis_par = ProvUser.objects.using(using).filter(username=options['soumis_par']).first()
+            if soumis_par is None:
+                raise CommandError(f"Membre introuvable : {options['soumis_par']}")
+
+        debut = time.perf_counter()
+        with ouvre_fichier(options['fichier'], 'r') as fichier:
+            try:
+                crees, ignores = cree_cas(lit_objets(fichier), reunion, soumis_par=soumis_par, using=using)
+            except ValueError as erreur:
+                raise CommandError(erreur)
+        duree = time.perf_counter() - debut
+
+        if ignores:
+            self.stdout.write(f"{ignores} cas déjà existant(s) ignoré(s)")
+        self.stdout.write(self.style.SUCCESS(f"{len(crees)} cas créé(s) pour la réunion {reunion} en {duree:.2f} s"))
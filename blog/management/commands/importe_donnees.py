@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.sauvegarde import importe
+
+
+class Command(BaseCommand):
+    help = (
+        "Restaure une sauvegarde NDJSON (exporte_donnees) ou un fichier produit par dumpdata "
+        "(tableau JSON, comme prov_local_fixture.json), en flux et par insertions en masse"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier', help="fichier de sauvegarde (compressé si le nom se termine par .gz)")
+        parser.add_argument('--taille-lot', type=int, default=2000, help="nombre d'objets insérés par transaction")
+        parser.add_argument(
+            '--ignorer-conflits',
+            action='store_true',
+            help="ignore les objets dont l'identifiant existe déjà au lieu d'échouer",
+        )
+        parser.add_argument('--database', default='default', help="base de données cible")
+
+    def handle(self, *args, **options):
+        debut = time.perf_counter()
+        nombres, ignores = importe(
+            options['fichier'],
+            taille_lot=options['taille_lot'],
+            using=options['database'],
+            ignorer_conflits=options['ignorer_conflits'],
+        )
+        duree = time.perf_counter() - debut
+
+        for modele, nombre in nombres.items():
+            self.stdout.write(f"{modele:35} {nombre:10}")
+        if ignores:
+            self.stdout.write(f"{ignores} objet(s) de modèles non sauvegardés ignoré(s)")
+        total = sum(nombres.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} objets importés en {duree:.1f} s ({total / max(duree, 1e-9):.0f} objets/s)"
+        ))
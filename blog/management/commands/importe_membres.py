@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.cache import invalide_modele
+from blog.membres import importe_fichier_membres
+from blog.models import Communaute, ProvUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Importe en masse des membres depuis un fichier JSON au format de liste_membres.json "
+        "(tableau ou NDJSON). Les membres déjà existants (même identifiant de connexion) sont ignorés."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier', help="fichier des membres (compressé si le nom se termine par .gz)")
+        parser.add_argument(
+            '--mot-de-passe',
+            help="mot de passe initial commun (par défaut : mots de passe inutilisables, à réinitialiser)",
+        )
+        parser.add_argument('--taille-lot', type=int, default=500, help="nombre de membres insérés par requête")
+        parser.add_argument('--database', default='default', help="base de données cible")
+
+    def handle(self, *args, **options):
+        debut = time.perf_counter()
+        crees, ignores = importe_fichier_membres(
+            options['fichier'],
+            ProvUser,
+            Communaute,
+            mot_de_passe=options['mot_de_passe'],
+            using=options['database'],
+            taille_lot=options['taille_lot'],
+        )
+        # Les insertions en masse n'émettent pas de signal
+        invalide_modele(ProvUser)
+        duree = time.perf_counter() - debut
+
+        if ignores:
+            self.stdout.write(f"{ignores} membre(s) déjà existant(s) ignoré(s)")
+        self.stdout.write(self.style.SUCCESS(f"{crees} membre(s) importé(s) en {duree:.2f} s"))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.models import Cotisation
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule les soldes (restes à affecter) enregistrés sur les cotisations, "
+        "ou vérifie qu'ils correspondent aux affectations"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reunion', type=int, help="identifiant de la réunion (par défaut : toutes)")
+        parser.add_argument(
+            '--verifier',
+            action='store_true',
+            help="vérifie les soldes sans les modifier (erreur si des soldes sont erronés)",
+        )
+
+    def handle(self, *args, **options):
+        cotisations = Cotisation.objects.all()
+        if options['reunion']:
+            cotisations = cotisations.filter(reunion_id=options['reunion'])
+
+        if not options['verifier']:
+            nombre = cotisations.recalcule_soldes()
+            self.stdout.write(self.style.SUCCESS(f"{nombre} cotisation(s) recalculée(s)"))
+            return
+
+        erreurs = cotisations.soldes_errones().values_list(
+            'pk', 'solde_social', 'reste_cotis_social', 'solde_mission', 'reste_cotis_mission',
+        )
+        nombre = 0
+        for pk, solde_social, reste_social, solde_mission, reste_mission in erreurs:
+            nombre += 1
+            self.stdout.write(
+                f"Cotisation {pk} : social {solde_social} au lieu de {reste_social}, "
+                f"mission {solde_mission} au lieu de {reste_mission}"
+            )
+        if nombre:
+            raise CommandError(f"{nombre} cotisation(s) avec des soldes erronés")
+        self.stdout.write(self.style.SUCCESS("Tous les soldes sont à jour"))
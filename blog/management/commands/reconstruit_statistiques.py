@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import StatistiquesReunion
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule la table des statistiques des réunions (après un traitement en masse "
+        "ou une modification directe de la base)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reunion',
+            type=int,
+            action='append',
+            help="identifiant d'une réunion (option répétable, par défaut : toutes)",
+        )
+        parser.add_argument('--taille-lot', type=int, default=500, help="nombre de réunions traitées par requête")
+
+    def handle(self, *args, **options):
+        nombre = StatistiquesReunion.actualise(options['reunion'], taille_lot=options['taille_lot'])
+        self.stdout.write(self.style.SUCCESS(f"Statistiques de {nombre} réunion(s) recalculées"))
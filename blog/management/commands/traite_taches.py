@@ -0,0 +1,58 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from blog.taches import identifiant_travailleur, traite_suivante
+
+
+class Command(BaseCommand):
+    help = (
+        "Exécute les tâches en arrière-plan planifiées en base de données (voir blog/taches.py). "
+        "Plusieurs travailleurs peuvent être lancés simultanément."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--une-fois',
+            action='store_true',
+            help="exécute les tâches disponibles puis s'arrête",
+        )
+        parser.add_argument(
+            '--intervalle',
+            type=float,
+            default=5,
+            help="délai en secondes avant de rechercher de nouvelles tâches quand il n'y en a plus",
+        )
+        parser.add_argument('--database', default='default', help="base de données des tâches")
+
+    def handle(self, *args, **options):
+        travailleur = identifiant_travailleur()
+        self.arret = False
+        # La tâche en cours est terminée avant l'arrêt
+        signal.signal(signal.SIGTERM, self.demande_arret)
+        signal.signal(signal.SIGINT, self.demande_arret)
+
+        self.stdout.write(f"Travailleur {travailleur} démarré")
+        if not settings.CACHE_PARTAGE:
+            self.stderr.write(
+                "Attention : cache propre au processus (CACHE_URL locmem://), les invalidations "
+                "faites par les tâches ne seront pas vues par les workers web"
+            )
+        nombre = 0
+        while not self.arret:
+            close_old_connections()
+            tache = traite_suivante(travailleur, using=options['database'])
+            if tache is not None:
+                nombre += 1
+                self.stdout.write(f"Tâche {tache} exécutée")
+            elif options['une_fois']:
+                break
+            else:
+                time.sleep(options['intervalle'])
+        self.stdout.write(self.style.SUCCESS(f"{nombre} tâche(s) exécutée(s)"))
+
+    def demande_arret(self, signum, frame):
+        self.arret = True
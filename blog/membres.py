@@ -0,0 +1,94 @@
+"""
+Import en masse des membres de Providence
+
+Les membres sont décrits par des dictionnaires au format de
+migrations/liste_membres.json. Les communautés sont indexées par nom en une
+seule requête, le mot de passe initial commun n'est haché qu'une fois
+(ou les mots de passe de chaque membre sont rendus inutilisables, ce qui
+impose leur réinitialisation) et les membres sont insérés par lots, dans une
+seule transaction : un import interrompu n'en laisse aucune partie enregistrée.
+"""
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from .sauvegarde import lit_objets, ouvre_fichier
+
+
+def attributs_membre(donnee, communautes):
+    """
+    Attributs d'un membre à partir de sa description ; communautes est
+    le dictionnaire {nom: identifiant} des communautés
+    """
+    return {
+        'username': donnee["username"],
+        'first_name': donnee["prenoms"],
+        'last_name': donnee["nom"],
+        'email': donnee["email"],
+        'is_staff': True,
+        'is_active': True,
+        'is_superuser': donnee["superuser"],
+        'sexe': donnee["sexe"],
+        'telephone1': donnee["tel1"],
+        'telephone2': donnee["tel2"],
+        'adresse': donnee["adresse"],
+        'communaute_id': communautes.get(donnee["communaute"]),
+        'eglise_locale': donnee["eglise_locale"],
+        'activite': donnee["activite"],
+        'profession': donnee["profession"],
+        'cotisation_social': donnee["montant_social"],
+        'cotisation_mission': donnee["montant_mission"],
+        'personne_physique': donnee["personne"],
+        'peut_cotiser': donnee["cotisation"],
+    }
+
+
+def importe_membres(donnees, ProvUser, Communaute, mot_de_passe=None, using='default', taille_lot=500):
+    """
+    Crée les membres décrits par l'itérable donnees, par lots, en une seule transaction.
+    Sans mot de passe, les mots de passe sont inutilisables et devront être réinitialisés.
+    Les membres dont l'identifiant de connexion existe déjà, ou figure plus haut
+    dans les données, sont ignorés.
+    Retourne le nombre de membres créés et le nombre de membres ignorés.
+    """
+    communautes = dict(Communaute.objects.using(using).values_list('nom', 'pk'))
+    if mot_de_passe is not None:
+        # Hachage unique : le hachage (PBKDF2) coûte plusieurs centaines de millisecondes
+        mot_de_passe = make_password(mot_de_passe)
+
+    crees = ignores = 0
+    donnees = iter(donnees)
+    with transaction.atomic(using=using):
+        lot = list(islice(donnees, taille_lot))
+        while lot:
+            # Les membres des lots précédents, déjà insérés dans la transaction, en font partie
+            existants = set(
+                ProvUser.objects.using(using)
+                    .filter(username__in=[donnee["username"] for donnee in lot])
+                    .values_list('username', flat=True)
+            )
+            membres = []
+            for donnee in lot:
+                if donnee["username"] in existants:
+                    continue
+                # Un identifiant présent plusieurs fois dans les données n'est créé qu'une fois
+                existants.add(donnee["username"])
+                membres.append(ProvUser(
+                    # Mot de passe inutilisable propre à chaque membre (chaîne aléatoire, sans hachage)
+                    password=mot_de_passe or make_password(None),
+                    **attributs_membre(donnee, communautes)
+                ))
+            ProvUser.objects.using(using).bulk_create(membres)
+            crees += len(membres)
+            ignores += len(lot) - len(membres)
+            lot = list(islice(donnees, taille_lot))
+    return crees, ignores
+
+
+def importe_fichier_membres(chemin, ProvUser, Communaute, **options):
+    """
+    Importe les membres d'un fichier JSON (tableau, comme liste_membres.json) ou NDJSON
+    """
+    with ouvre_fichier(chemin, 'r') as fichier:
+        return importe_membres(lit_objets(fichier), ProvUser, Communaute, **options)
@@ -1,9 +1,8 @@
 # Generated by Django 2.2.3 on 2020-04-26 22:00
 
 import json
-from django.db import migrations
-from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.auth.hashers import make_password
+from django.db import migrations
 
 
 # SQLs liés à la vue des cotisations non libérées
@@ -38,6 +37,23 @@ WHERE NOT (c.mission_libere AND c.social_libere);
 sql_supprime_vue = "DROP VIEW public.v_cotisation_non_liberee;"
 
 
+# La vue utilise une syntaxe propre à PostgreSQL : elle n'est créée que sur cette base.
+# Les autres bases utilisent le calcul équivalent de l'ORM (Cotisation.objects.non_liberees())
+def cree_vue(apps, schema_editor):
+    """
+    Fonction de création de la vue des cotisations non libérées
+    """
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(sql_vue_cotisation_non_liberee)
+
+def supprime_vue(apps, schema_editor):
+    """
+    Fonction de suppression de la vue des cotisations non libérées
+    """
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(sql_supprime_vue)
+
+
 # Migrations des natures de besoins
 def cree_natures(apps, schema_editor):
     """
@@ -118,26 +134,21 @@ def cree_membres(apps, schema_editor):
     with open(nom_fichier, "r", encoding="utf-8") as fichier:
         donnees = json.load(fichier)
 
-    # Ecriture dans la table des communautés
+    # Ecriture dans la table des membres : communautés indexées par nom en une
+    # requête, mot de passe initial commun haché une seule fois (PBKDF2 coûte
+    # plusieurs centaines de millisecondes par appel)
     ProvUser = apps.get_model("blog", "ProvUser")
     Communaute = apps.get_model("blog", "Communaute")
     db_alias = schema_editor.connection.alias
-    membres = [] # [ Communaute(nom=c["nom"], nom_long=c["nom_long"]) for c in donnees ]
-    for donnee_membre in donnees:
-        communaute = None
-        nom_communaute = donnee_membre["communaute"]
-        if nom_communaute:
-            try:
-                communaute = Communaute.objects.get(nom=nom_communaute)
-            except ObjectDoesNotExist:
-                pass
-
-        membres.append(ProvUser(
+    communautes = dict(Communaute.objects.using(db_alias).values_list('nom', 'pk'))
+    mot_de_passe = make_password("admin123")
+    membres = [
+        ProvUser(
             username=donnee_membre["username"],
             first_name=donnee_membre["prenoms"],
             last_name=donnee_membre["nom"],
             email=donnee_membre["email"],
-            password=make_password("admin123"),
+            password=mot_de_passe,
             is_staff=True,
             is_active=True,
             is_superuser=donnee_membre["superuser"],
@@ -145,7 +156,7 @@ def cree_membres(apps, schema_editor):
             telephone1=donnee_membre["tel1"],
             telephone2=donnee_membre["tel2"],
             adresse=donnee_membre["adresse"],
-            communaute=communaute,
+            communaute_id=communautes.get(donnee_membre["communaute"]),
             eglise_locale=donnee_membre["eglise_locale"],
             activite=donnee_membre["activite"],
             profession=donnee_membre["profession"],
@@ -153,9 +164,10 @@ def cree_membres(apps, schema_editor):
             cotisation_mission=donnee_membre["montant_mission"],
             personne_physique=donnee_membre["personne"],
             peut_cotiser=donnee_membre["cotisation"],
-        ))
-
-    ProvUser.objects.using(db_alias).bulk_create(membres)
+        )
+        for donnee_membre in donnees
+    ]
+    ProvUser.objects.using(db_alias).bulk_create(membres, batch_size=500)
 
 def supprime_membres(apps, schema_editor):
     """
@@ -181,7 +193,7 @@ class Migration(migrations.Migration):
     ]
 
     operations = [
-        migrations.RunSQL(sql_vue_cotisation_non_liberee, reverse_sql=sql_supprime_vue),
+        migrations.RunPython(cree_vue, supprime_vue),
         migrations.RunPython(cree_natures, supprime_natures),
         migrations.RunPython(cree_eglises, supprime_eglises),
         migrations.RunPython(cree_membres, supprime_membres),
@@ -0,0 +1,58 @@
+# Generated by Django 2.2.24 on 2026-10-18 19:27
+
+from django.db import migrations, models
+from django.db.models import Case, When, Value, F, Q, Sum, OuterRef, Subquery, ExpressionWrapper
+from django.db.models.functions import Coalesce
+
+
+def initialise_soldes(apps, schema_editor):
+    """
+    Fonction de calcul initial des soldes des cotisations
+    (reste non libéré diminué des sommes affectées aux cas de la classification)
+    """
+    Cotisation = apps.get_model("blog", "Cotisation")
+    AffectationNonLibere = apps.get_model("blog", "AffectationNonLibere")
+    db_alias = schema_editor.connection.alias
+
+    def reste(montant, libere, classification):
+        affecte = AffectationNonLibere.objects.using(db_alias)\
+            .filter(cotisation=OuterRef('pk'))\
+            .order_by()\
+            .values('cotisation')\
+            .annotate(total=Sum('somme', filter=Q(cas__classification=classification)))\
+            .values('total')
+        non_libere = Case(
+            When(**{libere: True}, then=Value(0)),
+            default=F(montant),
+            output_field=models.IntegerField(),
+        )
+        return ExpressionWrapper(
+            non_libere - Coalesce(Subquery(affecte, output_field=models.IntegerField()), Value(0)),
+            output_field=models.IntegerField(),
+        )
+
+    Cotisation.objects.using(db_alias).update(
+        solde_social=reste('montant_social', 'social_libere', 'S'),
+        solde_mission=reste('montant_mission', 'mission_libere', 'M'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_auto_20200510_2344'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cotisation',
+            name='solde_mission',
+            field=models.IntegerField(default=0, editable=False, verbose_name='reste mission'),
+        ),
+        migrations.AddField(
+            model_name='cotisation',
+            name='solde_social',
+            field=models.IntegerField(default=0, editable=False, verbose_name='reste social'),
+        ),
+        migrations.RunPython(initialise_soldes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 2.2.24 on 2026-10-18 19:41
+
+from django.db import migrations, models
+from django.db.models import Count, Sum, Q, OuterRef, Subquery
+import django.db.models.deletion
+
+
+def initialise_statistiques(apps, schema_editor):
+    """
+    Fonction de calcul initial des statistiques des réunions
+    """
+    Reunion = apps.get_model("blog", "Reunion")
+    Cotisation = apps.get_model("blog", "Cotisation")
+    StatistiquesReunion = apps.get_model("blog", "StatistiquesReunion")
+    db_alias = schema_editor.connection.alias
+
+    cotisations = Cotisation.objects.using(db_alias)\
+        .filter(reunion=OuterRef('pk'))\
+        .order_by()\
+        .values('reunion')
+    cas_social = Q(cas_reunion__classification='S')
+    cas_mission = Q(cas_reunion__classification='M')
+    urgent = Q(cas_reunion__urgence=True)
+    non_urgent = Q(cas_reunion__urgence=False)
+    bilans = Reunion.objects.using(db_alias)\
+        .order_by()\
+        .values('pk')\
+        .annotate(
+            nb_cas=Count('cas_reunion'),
+            sollicite_social=Sum('cas_reunion__montant_sollicite', filter=cas_social),
+            sollicite_mission=Sum('cas_reunion__montant_sollicite', filter=cas_mission),
+            urgence_social=Sum('cas_reunion__montant_sollicite', filter=cas_social & urgent),
+            urgence_mission=Sum('cas_reunion__montant_sollicite', filter=cas_mission & urgent),
+            alloue_social=Sum('cas_reunion__montant_alloue', filter=cas_social & non_urgent),
+            alloue_mission=Sum('cas_reunion__montant_alloue', filter=cas_mission & non_urgent),
+            cotisations_social=Subquery(cotisations.annotate(total=Sum('montant_social')).values('total')),
+            cotisations_mission=Subquery(cotisations.annotate(total=Sum('montant_mission')).values('total')),
+        )
+
+    statistiques = []
+    for bilan in bilans:
+        pk = bilan.pop('pk')
+        bilan = {champ: montant or 0 for champ, montant in bilan.items()}
+        statistiques.append(StatistiquesReunion(
+            reunion_id=pk,
+            sollicite_total=bilan['sollicite_social'] + bilan['sollicite_mission'],
+            reliquat_social=bilan['cotisations_social'] - bilan['urgence_social'] - bilan['alloue_social'],
+            reliquat_mission=bilan['cotisations_mission'] - bilan['urgence_mission'] - bilan['alloue_mission'],
+            **bilan,
+        ))
+    StatistiquesReunion.objects.using(db_alias).bulk_create(statistiques, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0004_soldes_cotisations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatistiquesReunion',
+            fields=[
+                ('reunion', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='statistiques', serialize=False, to='blog.Reunion', verbose_name='réunion')),
+                ('nb_cas', models.PositiveIntegerField(default=0, verbose_name='nombre de cas')),
+                ('sollicite_total', models.PositiveIntegerField(default=0, verbose_name='total sollicité')),
+                ('sollicite_social', models.PositiveIntegerField(default=0, verbose_name='sollicité social')),
+                ('sollicite_mission', models.PositiveIntegerField(default=0, verbose_name='sollicité mission')),
+                ('urgence_social', models.PositiveIntegerField(default=0, verbose_name='urgence social')),
+                ('urgence_mission', models.PositiveIntegerField(default=0, verbose_name='urgence mission')),
+                ('alloue_social', models.PositiveIntegerField(default=0, verbose_name='alloué social')),
+                ('alloue_mission', models.PositiveIntegerField(default=0, verbose_name='alloué mission')),
+                ('cotisations_social', models.PositiveIntegerField(default=0, verbose_name='cotisations social')),
+                ('cotisations_mission', models.PositiveIntegerField(default=0, verbose_name='cotisations mission')),
+                ('reliquat_social', models.IntegerField(default=0, verbose_name='reliquat social')),
+                ('reliquat_mission', models.IntegerField(default=0, verbose_name='reliquat mission')),
+            ],
+            options={
+                'verbose_name': 'statistiques de réunion',
+                'verbose_name_plural': 'statistiques de réunions',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='statistiquesreunion',
+            index=models.Index(fields=['nb_cas'], name='stats_reunion_nb_cas_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='statistiquesreunion',
+            index=models.Index(fields=['sollicite_total'], name='stats_reunion_sollicite_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='statistiquesreunion',
+            index=models.Index(fields=['reliquat_social'], name='stats_reunion_rel_social_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='statistiquesreunion',
+            index=models.Index(fields=['reliquat_mission'], name='stats_reunion_rel_mission_idx'),
+        ),
+        migrations.RunPython(initialise_statistiques, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.24 on 2026-10-18 19:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_statistiques_reunions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='affectationnonlibere',
+            name='cotisation',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='blog.Cotisation', verbose_name='cotisation de'),
+        ),
+        migrations.AlterField(
+            model_name='cas',
+            name='reunion',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='cas_reunion', to='blog.Reunion', verbose_name='réunion'),
+        ),
+        migrations.AlterField(
+            model_name='cotisation',
+            name='reunion',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='cotisations', to='blog.Reunion', verbose_name='réunion'),
+        ),
+        migrations.AddIndex(
+            model_name='affectationnonlibere',
+            index=models.Index(fields=['cotisation', 'cas'], name='affect_cotisation_cas_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cas',
+            index=models.Index(fields=['reunion', 'classification', 'urgence'], name='cas_reunion_classif_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cotisation',
+            index=models.Index(fields=['reunion', 'social_libere', 'mission_libere'], name='cotis_reunion_liberation_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cotisation',
+            index=models.Index(condition=models.Q(('mission_libere', True), ('social_libere', True), _negated=True), fields=['reunion'], name='cotis_non_liberee_idx'),
+        ),
+    ]
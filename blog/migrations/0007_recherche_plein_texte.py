@@ -0,0 +1,103 @@
+from django.db import migrations
+
+
+# Structures de la recherche plein texte (voir blog/recherche.py) :
+# index trigrammes sous PostgreSQL, tables FTS5 sous SQLite.
+# Les instructions sont recopiées ici, telles qu'à la création de la migration,
+# pour ne pas dépendre du code courant de l'application
+
+# Champs de recherche de chaque table
+champs_recherche = {
+    'blog_beneficiaire': ('nom', 'prenoms'),
+    'blog_cas': ('nom', 'prenoms'),
+    'blog_provuser': ('last_name', 'first_name', 'username', 'email'),
+}
+
+# Fonction de normalisation (PostgreSQL) : immuable pour pouvoir être indexée,
+# ce que n'est pas unaccent()
+sql_fonction_postgresql = """
+CREATE EXTENSION IF NOT EXISTS unaccent;
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE OR REPLACE FUNCTION providence_recherche(VARIADIC textes text[]) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    AS $$ SELECT lower(public.unaccent('public.unaccent'::regdictionary, array_to_string(textes, ' '))) $$;
+"""
+
+sql_supprime_fonction_postgresql = "DROP FUNCTION IF EXISTS providence_recherche(VARIADIC text[]);"
+
+
+def sql_creation(vendor):
+    """
+    Instructions SQL de création des structures de recherche pour la base fournie
+    """
+    instructions = []
+    if vendor == 'postgresql':
+        instructions.append(sql_fonction_postgresql)
+        for table, champs in champs_recherche.items():
+            colonnes = ", ".join(f'"{champ}"' for champ in champs)
+            instructions.append(
+                f'CREATE INDEX IF NOT EXISTS "{table}_recherche_idx" ON "{table}" '
+                f'USING gin (providence_recherche({colonnes}) gin_trgm_ops);'
+            )
+    elif vendor == 'sqlite':
+        for table, champs in champs_recherche.items():
+            fts = f"{table}_fts"
+            colonnes = ", ".join(champs)
+            nouvelles = ", ".join(f"new.{champ}" for champ in champs)
+            anciennes = ", ".join(f"old.{champ}" for champ in champs)
+            instructions += [
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({colonnes}, content='{table}', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2');",
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+                f"INSERT INTO {fts}(rowid, {colonnes}) VALUES (new.id, {nouvelles}); END;",
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {colonnes}) VALUES ('delete', old.id, {anciennes}); END;",
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {colonnes}) VALUES ('delete', old.id, {anciennes}); "
+                f"INSERT INTO {fts}(rowid, {colonnes}) VALUES (new.id, {nouvelles}); END;",
+                # Indexation des lignes existantes
+                f"INSERT INTO {fts}({fts}) VALUES ('rebuild');",
+            ]
+    return instructions
+
+
+def sql_suppression(vendor):
+    """
+    Instructions SQL de suppression des structures de recherche pour la base fournie
+    """
+    instructions = []
+    if vendor == 'postgresql':
+        instructions += [f'DROP INDEX IF EXISTS "{table}_recherche_idx";' for table in champs_recherche]
+        instructions.append(sql_supprime_fonction_postgresql)
+    elif vendor == 'sqlite':
+        for table in champs_recherche:
+            fts = f"{table}_fts"
+            instructions += [f"DROP TRIGGER IF EXISTS {fts}_{suffixe};" for suffixe in ('ai', 'ad', 'au')]
+            instructions.append(f"DROP TABLE IF EXISTS {fts};")
+    return instructions
+
+
+def cree_recherche(apps, schema_editor):
+    """
+    Fonction de création des structures de recherche
+    """
+    for instruction in sql_creation(schema_editor.connection.vendor):
+        schema_editor.execute(instruction, params=None)
+
+def supprime_recherche(apps, schema_editor):
+    """
+    Fonction de suppression des structures de recherche
+    """
+    for instruction in sql_suppression(schema_editor.connection.vendor):
+        schema_editor.execute(instruction, params=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_index_requetes_admin'),
+    ]
+
+    operations = [
+        migrations.RunPython(cree_recherche, supprime_recherche),
+    ]
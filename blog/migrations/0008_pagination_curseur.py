@@ -0,0 +1,25 @@
+# Generated by Django 2.2.24 on 2026-10-18 19:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_recherche_plein_texte'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reunion',
+            index=models.Index(fields=['date_reunion'], name='reunion_date_idx'),
+        ),
+        # Clé de pagination des bénéficiaires (nom, prénoms, identifiant), les valeurs
+        # nulles étant remplacées par la chaîne vide : index sur expressions, que
+        # Django ne sait pas déclarer (voir pagination.SansNull)
+        migrations.RunSQL(
+            "CREATE INDEX benef_cle_pagination_idx ON blog_beneficiaire "
+            "(COALESCE(nom, ''), COALESCE(prenoms, ''), id);",
+            "DROP INDEX benef_cle_pagination_idx;",
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 2.2.24 on 2026-10-18 20:06
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_pagination_curseur'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tache',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nom', models.CharField(max_length=64)),
+                ('cle', models.CharField(blank=True, max_length=191, null=True, unique=True, verbose_name='clé')),
+                ('arguments', models.TextField(default='{}')),
+                ('etat', models.CharField(choices=[('A', 'En attente'), ('C', 'En cours'), ('S', 'Terminée'), ('E', 'En échec')], default='A', max_length=1, verbose_name='état')),
+                ('progression', models.PositiveSmallIntegerField(default=0, verbose_name='progression (%)')),
+                ('message', models.CharField(blank=True, max_length=255)),
+                ('tentatives', models.PositiveSmallIntegerField(default=0)),
+                ('tentatives_max', models.PositiveSmallIntegerField(default=3, verbose_name='nombre maximal de tentatives')),
+                ('resultat', models.TextField(blank=True, verbose_name='résultat')),
+                ('erreur', models.TextField(blank=True)),
+                ('travailleur', models.CharField(blank=True, max_length=128)),
+                ('cree_le', models.DateTimeField(auto_now_add=True, verbose_name='créée le')),
+                ('executer_apres', models.DateTimeField(default=django.utils.timezone.now, verbose_name='exécuter après')),
+                ('debute_le', models.DateTimeField(blank=True, null=True, verbose_name='débutée le')),
+                ('fin_bail', models.DateTimeField(blank=True, null=True, verbose_name='fin du bail')),
+                ('termine_le', models.DateTimeField(blank=True, null=True, verbose_name='terminée le')),
+            ],
+            options={
+                'verbose_name': 'tâche',
+                'ordering': ('-cree_le',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='tache',
+            index=models.Index(fields=['etat', 'executer_apres'], name='tache_etat_execution_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.24 on 2026-10-18 21:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_taches'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cas',
+            index=models.Index(fields=['reunion', 'id'], name='cas_cle_pagination_idx'),
+        ),
+    ]
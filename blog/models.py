@@ -1,12 +1,20 @@
+import json
+from itertools import islice
+
 from django.contrib.auth.models import AbstractUser
-from django.db import models
-from django.db.models import Count, Sum, F, Q, Value
-from django.db.models.functions import Concat
+from django.db import models, transaction
+from django.db.models import Count, Sum, F, Q, Value, OuterRef, Subquery, Case, When, ExpressionWrapper
+from django.db.models.functions import Coalesce, Concat
 from django.conf import settings
+from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.html import format_html
 
 from tinymce import HTMLField
 
+from . import repartition, taches
+from .cache import en_cache, invalide_modele
+
 CHOIX_SEXE = (
     ('F', 'Féminin'),
     ('M', 'Masculin'),
@@ -18,6 +26,56 @@ CLASSIFICATION_CAS = (
 )
 
 
+class SuiviChampsMixin:
+    """
+    Mémorise les valeurs en base de certains champs (champs_suivis, noms de
+    colonnes) au chargement et à l'enregistrement d'un objet, pour que ses
+    signaux connaissent les valeurs remplacées sans relire l'objet
+    """
+    champs_suivis = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.memorise_valeurs()
+        return instance
+
+    def memorise_valeurs(self):
+        # Les champs différés ne sont pas connus
+        self._valeurs_base = {
+            champ: self.__dict__[champ] for champ in self.champs_suivis if champ in self.__dict__
+        }
+
+    def memorise_valeurs_precedentes(self, using):
+        """
+        Avant l'enregistrement : valeurs en base des champs suivis (_valeurs_precedentes,
+        vide pour un nouvel objet), relues seulement si l'objet n'a pas été chargé
+        """
+        valeurs = dict(getattr(self, '_valeurs_base', {}))
+        manquants = [champ for champ in self.champs_suivis if champ not in valeurs]
+        if manquants and self.pk is not None:
+            valeurs.update(
+                type(self)._base_manager.using(using).filter(pk=self.pk).values(*manquants).first() or {}
+            )
+        self._valeurs_precedentes = valeurs
+
+    def valeur_precedente(self, champ):
+        return getattr(self, '_valeurs_precedentes', {}).get(champ)
+
+    def champs_modifies(self, *champs):
+        """
+        Vrai si l'objet n'a pas été chargé depuis la base ou si un des champs a été modifié depuis
+        """
+        valeurs = getattr(self, '_valeurs_base', None)
+        return valeurs is None or any(
+            champ not in valeurs or valeurs[champ] != getattr(self, champ) for champ in champs
+        )
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.memorise_valeurs()
+
+
 class Communaute(models.Model):
     """
     Famille de communauté chrétienne
@@ -98,6 +156,114 @@ class Membre(ProvUser):
         return f"{self.first_name} {self.last_name}"
 
 
+class BilanReunion:
+    """
+    Bilan financier d'une réunion : montants sollicités, urgences, montants
+    alloués et cotisations, pour le social et pour la mission.
+    Tous les montants sont obtenus par une seule requête d'agrégation conditionnelle.
+    """
+    CHAMPS = (
+        'nb_cas',
+        'sollicite_social',
+        'sollicite_mission',
+        'urgence_social',
+        'urgence_mission',
+        'alloue_social',
+        'alloue_mission',
+        'cotisations_social',
+        'cotisations_mission',
+    )
+
+    def __init__(self, **montants):
+        for champ in self.CHAMPS:
+            setattr(self, champ, montants.get(champ))
+        self._reserves = {}
+
+    @classmethod
+    def calcule(cls, reunion):
+        """
+        Retourne le bilan de la réunion fournie, lu dans le cache tant que
+        ni les cas ni les cotisations n'ont été modifiés depuis son calcul
+        """
+        montants = en_cache("bilan_reunion", (Cas, Cotisation), cls.agrege, reunion.pk)
+        return cls(**montants)
+
+    @staticmethod
+    def agrege(pk_reunion):
+        """
+        Calcule les montants du bilan de la réunion fournie (une requête)
+        """
+        montants = BilanReunion.agrege_reunions(Reunion.objects.filter(pk=pk_reunion)).first()
+        return montants or {}
+
+    @staticmethod
+    def agrege_reunions(reunions):
+        """
+        Montants des bilans des réunions fournies (queryset), sous forme
+        de dictionnaires comportant l'identifiant de la réunion (une requête)
+        """
+        # Les sommes des cotisations sont obtenues par sous-requête pour éviter
+        # la multiplication des lignes due à la double jointure cas / cotisations
+        cotisations = Cotisation.objects\
+            .filter(reunion=OuterRef('pk'))\
+            .order_by()\
+            .values('reunion')
+        cas_social = Q(cas_reunion__classification='S')
+        cas_mission = Q(cas_reunion__classification='M')
+        urgent = Q(cas_reunion__urgence=True)
+        non_urgent = Q(cas_reunion__urgence=False)
+        return reunions\
+            .order_by()\
+            .values('pk')\
+            .annotate(
+                nb_cas=Count('cas_reunion'),
+                sollicite_social=Sum('cas_reunion__montant_sollicite', filter=cas_social),
+                sollicite_mission=Sum('cas_reunion__montant_sollicite', filter=cas_mission),
+                urgence_social=Sum('cas_reunion__montant_sollicite', filter=cas_social & urgent),
+                urgence_mission=Sum('cas_reunion__montant_sollicite', filter=cas_mission & urgent),
+                alloue_social=Sum('cas_reunion__montant_alloue', filter=cas_social & non_urgent),
+                alloue_mission=Sum('cas_reunion__montant_alloue', filter=cas_mission & non_urgent),
+                cotisations_social=Subquery(
+                    cotisations.annotate(total=Sum('montant_social')).values('total')
+                ),
+                cotisations_mission=Subquery(
+                    cotisations.annotate(total=Sum('montant_mission')).values('total')
+                ),
+            )
+
+    def reserve(self, classification):
+        """
+        Retourne le couple (cotisations disponibles, montant sollicité) à répartir
+        entre les cas non urgents de la classification fournie ('S' ou 'M')
+        """
+        if classification == 'S':
+            urgence, cotisations, sollicite = self.urgence_social, self.cotisations_social, self.sollicite_social
+        else:
+            urgence, cotisations, sollicite = self.urgence_mission, self.cotisations_mission, self.sollicite_mission
+        urgence = urgence or 0
+        return (cotisations or 0) - urgence, (sollicite or 0) - urgence
+
+    def montant_estime(self, classification, montant_sollicite, urgence=False):
+        """
+        Montant estimé d'un cas : le montant sollicité pour un cas d'urgence,
+        sinon une part des cotisations disponibles proportionnelle au montant sollicité
+        """
+        if urgence or montant_sollicite is None:
+            return montant_sollicite
+        if classification not in self._reserves:
+            self._reserves[classification] = self.reserve(classification)
+        cotis_dispo, sollicite = self._reserves[classification]
+        return repartition.estime(montant_sollicite, cotis_dispo, sollicite)
+
+    @property
+    def disponible_social(self):
+        return repartition.reliquat(self.cotisations_social, self.urgence_social, self.alloue_social)
+
+    @property
+    def disponible_mission(self):
+        return repartition.reliquat(self.cotisations_mission, self.urgence_mission, self.alloue_mission)
+
+
 class Reunion(models.Model):
     """
     Réunion de Providence
@@ -117,75 +283,221 @@ class Reunion(models.Model):
     class Meta:
         verbose_name = "réunion"
         ordering = ('-date_reunion',)
+        indexes = [
+            # Tri des réunions
+            models.Index(fields=['date_reunion'], name='reunion_date_idx'),
+        ]
 
     def nombre_cas(self):
-        return self.cas_reunion.count()
+        return self.bilan.nb_cas
     nombre_cas.short_description = "Nombre de cas"
 
+    @cached_property
+    def bilan(self):
+        """
+        Bilan financier de la réunion, calculé en une seule requête
+        et mémorisé sur l'instance (donc pour la durée de la requête HTTP)
+        """
+        return BilanReunion.calcule(self)
+
     def sollicite_social(self):
-        somme = self.cas_reunion.filter(classification='S').\
-            aggregate(social=Sum('montant_sollicite'))
-        return somme['social']
+        return self.bilan.sollicite_social
     sollicite_social.short_description = "Sollicité social"
 
     def sollicite_mission(self):
-        somme = self.cas_reunion.filter(classification='M').\
-            aggregate(mission=Sum('montant_sollicite'))
-        return somme['mission']
+        return self.bilan.sollicite_mission
     sollicite_mission.short_description = "Sollicité mission"
 
     def total_urgence_social(self):
-        somme = self.cas_reunion\
-            .filter(classification='S')\
-            .filter(urgence=True)\
-            .aggregate(social=Sum('montant_sollicite'))
-        total = somme['social'] if somme['social'] else 0
-        return total
+        return self.bilan.urgence_social or 0
     total_urgence_social.short_description = "Urgence social"
 
     def total_urgence_mission(self):
-        somme = self.cas_reunion\
-            .filter(classification='M')\
-            .filter(urgence=True)\
-            .aggregate(mission=Sum('montant_sollicite'))
-        total = somme['mission'] if somme['mission'] else 0
-        return total
+        return self.bilan.urgence_mission or 0
     total_urgence_mission.short_description = "Urgence mission"
 
     def total_cotisation(self):
-        return self.cotisations.aggregate(
-            total_social=Sum('montant_social'),
-            total_mission=Sum('montant_mission')
-        )
+        return {
+            'total_social': self.bilan.cotisations_social,
+            'total_mission': self.bilan.cotisations_mission,
+        }
 
     # @property
     def cotisations_social(self):
-        return self.total_cotisation()['total_social']
+        return self.bilan.cotisations_social
     cotisations_social.short_description = "Cotisations social"
 
     # @property
     def cotisations_mission(self):
-        return self.total_cotisation()['total_mission']
+        return self.bilan.cotisations_mission
     cotisations_mission.short_description = "Cotisations mission"
 
+    def disponible_social(self):
+        return self.bilan.disponible_social
+    disponible_social.short_description = "Reliquat social"
+
+    def disponible_mission(self):
+        return self.bilan.disponible_mission
+    disponible_mission.short_description = "Reliquat mission"
+
     def save(self, *args, **kwargs):
         # Après la création d'une réunion, générer les cotisations des membres
         nouvelle_reunion = self.pk is None
         super().save(*args, **kwargs)  # Procéder à la sauvegarde
 
         if nouvelle_reunion:
-            for membre_prov in Membre.objects.filter(peut_cotiser=True):
-                social = membre_prov.cotisation_social if membre_prov.cotisation_social else 0
-                mission = membre_prov.cotisation_mission if membre_prov.cotisation_mission else 0
-                cotis = Cotisation.objects.create(
-                    membre=membre_prov,
+            # En arrière-plan si TACHES_ASYNCHRONES (voir taches.py), sinon immédiatement
+            taches.planifie('generer_cotisations', cle=f"generer_cotisations:{self.pk}", reunion=self.pk)
+
+    def generer_cotisations(self, taille_lot=500):
+        """
+        Génère en masse les cotisations des membres cotisants pour la réunion.
+        Les membres disposant déjà d'une cotisation pour la réunion sont ignorés,
+        la génération peut donc être relancée sans créer de doublons.
+        Retourne le nombre de cotisations créées.
+        """
+        with transaction.atomic():
+            # Verrouiller la réunion pour sérialiser les générations concurrentes
+            Reunion.objects.select_for_update().filter(pk=self.pk).exists()
+            deja_generes = self.cotisations\
+                .filter(membre__isnull=False)\
+                .values('membre_id')
+            membres = Membre.objects\
+                .filter(peut_cotiser=True)\
+                .exclude(pk__in=deja_generes)\
+                .order_by()\
+                .values_list('pk', 'cotisation_social', 'cotisation_mission')
+            cotisations = [
+                Cotisation(
+                    membre_id=membre_id,
                     reunion=self,
-                    montant_social=social,
-                    montant_mission=mission
+                    montant_social=social if social else 0,
+                    montant_mission=mission if mission else 0,
+                    solde_social=social if social else 0,
+                    solde_mission=mission if mission else 0,
                 )
+                for membre_id, social, mission in membres
+            ]
+            Cotisation.objects.bulk_create(cotisations, batch_size=taille_lot)
+        # bulk_create n'émet pas de signal post_save
+        invalide_modele(Cotisation)
+        StatistiquesReunion.actualise([self.pk])
+        return len(cotisations)
+
+    @staticmethod
+    def libelle(date_reunion, membre_hote, lieu_reunion):
+        """
+        Libellé d'une réunion, également utilisé pour les listes de choix
+        construites sans charger les objets Reunion
+        """
+        return f"{date_reunion.strftime('%d/%m/%Y')} - {membre_hote} ({lieu_reunion})"
+
+    def __str__(self):
+        return self.libelle(self.date_reunion, self.membre_hote, self.lieu_reunion)
+
+
+class StatistiquesReunion(models.Model):
+    """
+    Statistiques d'une réunion (nombre de cas, montants sollicités, urgences,
+    montants alloués, cotisations et reliquats), conservées dans une table
+    pour que la liste des réunions puisse être affichée et triée sans agréger
+    les cas et les cotisations.
+    Elles sont actualisées à chaque modification d'un cas ou d'une cotisation
+    (voir signals.py) ; les traitements en masse doivent appeler actualise().
+    """
+    reunion = models.OneToOneField(
+        Reunion,
+        models.CASCADE,
+        primary_key=True,
+        related_name="statistiques",
+        verbose_name="réunion",
+    )
+    nb_cas = models.PositiveIntegerField(default=0, verbose_name="nombre de cas")
+    sollicite_total = models.PositiveIntegerField(default=0, verbose_name="total sollicité")
+    sollicite_social = models.PositiveIntegerField(default=0, verbose_name="sollicité social")
+    sollicite_mission = models.PositiveIntegerField(default=0, verbose_name="sollicité mission")
+    urgence_social = models.PositiveIntegerField(default=0, verbose_name="urgence social")
+    urgence_mission = models.PositiveIntegerField(default=0, verbose_name="urgence mission")
+    alloue_social = models.PositiveIntegerField(default=0, verbose_name="alloué social")
+    alloue_mission = models.PositiveIntegerField(default=0, verbose_name="alloué mission")
+    cotisations_social = models.PositiveIntegerField(default=0, verbose_name="cotisations social")
+    cotisations_mission = models.PositiveIntegerField(default=0, verbose_name="cotisations mission")
+    reliquat_social = models.IntegerField(default=0, verbose_name="reliquat social")
+    reliquat_mission = models.IntegerField(default=0, verbose_name="reliquat mission")
+
+    class Meta:
+        verbose_name = "statistiques de réunion"
+        verbose_name_plural = "statistiques de réunions"
+        indexes = [
+            models.Index(fields=['nb_cas'], name='stats_reunion_nb_cas_idx'),
+            models.Index(fields=['sollicite_total'], name='stats_reunion_sollicite_idx'),
+            models.Index(fields=['reliquat_social'], name='stats_reunion_rel_social_idx'),
+            models.Index(fields=['reliquat_mission'], name='stats_reunion_rel_mission_idx'),
+        ]
+
+    # Champs recalculés par actualise()
+    CHAMPS_ACTUALISES = (
+        'nb_cas',
+        'sollicite_total',
+        'sollicite_social',
+        'sollicite_mission',
+        'urgence_social',
+        'urgence_mission',
+        'alloue_social',
+        'alloue_mission',
+        'cotisations_social',
+        'cotisations_mission',
+        'reliquat_social',
+        'reliquat_mission',
+    )
+
+    @classmethod
+    def depuis_bilan(cls, montants):
+        """
+        Statistiques construites à partir des montants d'un bilan de réunion
+        (BilanReunion.agrege_reunions)
+        """
+        valeurs = {champ: montants.get(champ) or 0 for champ in BilanReunion.CHAMPS}
+        return cls(
+            reunion_id=montants['pk'],
+            sollicite_total=valeurs['sollicite_social'] + valeurs['sollicite_mission'],
+            reliquat_social=repartition.reliquat(
+                valeurs['cotisations_social'], valeurs['urgence_social'], valeurs['alloue_social']
+            ),
+            reliquat_mission=repartition.reliquat(
+                valeurs['cotisations_mission'], valeurs['urgence_mission'], valeurs['alloue_mission']
+            ),
+            **valeurs,
+        )
+
+    @classmethod
+    def actualise(cls, reunions=None, taille_lot=500, using='default'):
+        """
+        Recalcule les statistiques des réunions fournies (identifiants),
+        ou de toutes les réunions, par lots. Retourne le nombre de réunions traitées.
+        """
+        if reunions is None:
+            reunions = Reunion.objects.using(using).order_by('pk').values_list('pk', flat=True).iterator()
+        reunions = iter(reunions)
+        nombre = 0
+        lot = list(islice(reunions, taille_lot))
+        while lot:
+            statistiques = [
+                cls.depuis_bilan(montants)
+                for montants in BilanReunion.agrege_reunions(Reunion.objects.using(using).filter(pk__in=lot))
+            ]
+            # Insertion des lignes manquantes puis mise à jour de toutes : deux
+            # actualisations simultanées d'une réunion ne peuvent pas entrer en
+            # conflit, comme le feraient une suppression suivie d'une insertion
+            with transaction.atomic(using=using):
+                cls.objects.using(using).bulk_create(statistiques, ignore_conflicts=True)
+                cls.objects.using(using).bulk_update(statistiques, cls.CHAMPS_ACTUALISES)
+            nombre += len(statistiques)
+            lot = list(islice(reunions, taille_lot))
+        return nombre
 
     def __str__(self):
-        return f"{self.date_reunion.strftime('%d/%m/%Y')} - {self.membre_hote} ({self.lieu_reunion})"
+        return f"Statistiques de la réunion {self.reunion_id}"
 
 
 class Entite(models.Model):
@@ -251,10 +563,13 @@ class NatureBesoin(models.Model):
         return self.libelle
 
 
-class Cas(Entite):
+class Cas(SuiviChampsMixin, Entite):
     """
     Cas présenté pour soutien par Providence
     """
+    # Réunion (statistiques) et classification (soldes des cotisations affectées)
+    champs_suivis = ('reunion_id', 'classification')
+
     REMISE_DON = (
         ('O', 'Oui'),
         ('N', 'Non'),
@@ -269,7 +584,14 @@ class Cas(Entite):
     )
 
     soumis_par = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
-    reunion = models.ForeignKey(Reunion, models.CASCADE, blank=False, related_name="cas_reunion", verbose_name="réunion")
+    reunion = models.ForeignKey(
+        Reunion,
+        models.CASCADE,
+        blank=False,
+        related_name="cas_reunion",
+        db_index=False,  # Colonne de tête de l'index cas_reunion_classif_idx
+        verbose_name="réunion",
+    )
     beneficiaire = models.ForeignKey(Beneficiaire, models.CASCADE, related_name="cas_beneficiaire", verbose_name="bénéficiaire")
     montant_sollicite = models.PositiveIntegerField(null=True, blank=True, default=0, verbose_name="montant solllicité")
     montant_alloue = models.PositiveIntegerField(null=True, blank=True, verbose_name="montant alloué")
@@ -288,26 +610,40 @@ class Cas(Entite):
         verbose_name = "cas"
         verbose_name_plural = "cas"
         unique_together = ('reunion', 'beneficiaire')
+        indexes = [
+            # Cas d'une réunion par classification, les urgences en premier (inlines de la réunion)
+            models.Index(fields=['reunion', 'classification', 'urgence'], name='cas_reunion_classif_idx'),
+            # Clé de pagination de la liste des cas (voir pagination.py)
+            models.Index(fields=['reunion', 'id'], name='cas_cle_pagination_idx'),
+        ]
 
-    def save(self, *args, **kwargs):
-        # Si le cas est un cas d'urgence, le montant affecté est automatiquement égal
-        # au montant sollicité
+    # Attributs du bénéficiaire recopiés dans le cas lors de sa création
+    ATTRIBUTS_BENEFICIAIRE = (
+        'nom', 'prenoms', 'sexe', 'communaute_id', 'eglise_locale', 'situation_matrimoniale',
+        'profession', 'fonction', 'nb_enfants', 'anciennete_foi',
+    )
+
+    def recopie_beneficiaire(self, beneficiaire):
+        """
+        Recopie les attributs du bénéficiaire dans le cas
+        """
+        for attribut in self.ATTRIBUTS_BENEFICIAIRE:
+            setattr(self, attribut, getattr(beneficiaire, attribut))
+
+    def applique_urgence(self):
+        """
+        Si le cas est un cas d'urgence, le montant affecté est automatiquement égal
+        au montant sollicité
+        """
         if self.urgence:
             self.montant_alloue = self.montant_sollicite
 
+    def save(self, *args, **kwargs):
+        self.applique_urgence()
+
         # Lors de la création d'un cas, recopier les attributs du bénéficiaire
         if not self.pk:
-            benef = self.beneficiaire
-            self.nom = benef.nom
-            self.prenoms = benef.prenoms
-            self.sexe = benef.sexe
-            self.communaute = benef.communaute
-            self.eglise_locale = benef.eglise_locale
-            self.situation_matrimoniale = benef.situation_matrimoniale
-            self.profession = benef.profession
-            self.fonction = benef.fonction
-            self.nb_enfants = benef.nb_enfants
-            self.anciennete_foi = benef.anciennete_foi
+            self.recopie_beneficiaire(self.beneficiaire)
         super().save(*args, **kwargs)  # Procéder à la sauvegarde
 
     def est_urgent(self):
@@ -318,20 +654,147 @@ class Cas(Entite):
         pass
 
 
-class Cotisation(models.Model):
+def reste_a_affecter(montant, libere, classification):
+    """
+    Expression du reste à affecter d'une cotisation pour une classification :
+    montant non libéré diminué des sommes déjà affectées aux cas de la classification
+    """
+    non_libere = Case(
+        When(**{libere: True}, then=Value(0)),
+        default=F(montant),
+        output_field=models.IntegerField(),
+    )
+    affecte = Subquery(
+        AffectationNonLibere.objects
+            .filter(cotisation=OuterRef('pk'))
+            .order_by()
+            .values('cotisation')
+            .annotate(total=Sum('somme', filter=Q(cas__classification=classification)))
+            .values('total'),
+        output_field=models.IntegerField(),
+    )
+    return ExpressionWrapper(
+        non_libere - Coalesce(affecte, Value(0)),
+        output_field=models.IntegerField(),
+    )
+
+
+class CotisationQuerySet(models.QuerySet):
+    """
+    Requêtes sur les cotisations, indépendantes de la base de données
+    """
+    def avec_restes(self):
+        """
+        Ajoute à chaque cotisation les restes à affecter pour le social et la mission
+        (reste_cotis_social et reste_cotis_mission), calculés depuis les affectations
+        """
+        return self.annotate(
+            reste_cotis_social=reste_a_affecter('montant_social', 'social_libere', 'S'),
+            reste_cotis_mission=reste_a_affecter('montant_mission', 'mission_libere', 'M'),
+        )
+
+    def non_liberees(self):
+        """
+        Cotisations dont le montant social ou le montant mission n'est pas libéré
+        """
+        return self.exclude(social_libere=True, mission_libere=True)
+
+    def recalcule_soldes(self):
+        """
+        Recalcule et enregistre les soldes (restes à affecter) des cotisations
+        en une seule requête de mise à jour. Retourne le nombre de cotisations traitées.
+        """
+        return self.update(
+            solde_social=reste_a_affecter('montant_social', 'social_libere', 'S'),
+            solde_mission=reste_a_affecter('montant_mission', 'mission_libere', 'M'),
+        )
+
+    def soldes_errones(self):
+        """
+        Cotisations dont les soldes enregistrés diffèrent des soldes recalculés
+        """
+        return self.avec_restes().exclude(
+            solde_social=F('reste_cotis_social'),
+            solde_mission=F('reste_cotis_mission'),
+        )
+
+
+class Cotisation(SuiviChampsMixin, models.Model):
     """
     Cotisation mensuelle d'un membre pour le social et la mission
     """
+    # Champs dont dépendent les soldes
+    CHAMPS_SOLDES = ('montant_social', 'social_libere', 'montant_mission', 'mission_libere')
+    champs_suivis = ('reunion_id',) + CHAMPS_SOLDES
+
     membre = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, verbose_name="membre")
-    reunion = models.ForeignKey(Reunion, models.CASCADE, related_name="cotisations", verbose_name="réunion")
+    reunion = models.ForeignKey(
+        Reunion,
+        models.CASCADE,
+        related_name="cotisations",
+        db_index=False,  # Colonne de tête de l'index cotis_reunion_liberation_idx
+        verbose_name="réunion",
+    )
     montant_social = models.PositiveIntegerField(default=0)
     social_libere = models.BooleanField(default=False, verbose_name="montant social libéré ?")
     montant_mission = models.PositiveIntegerField(default=0)
     mission_libere = models.BooleanField(default=False, verbose_name="montant mission libéré ?")
 
+    # Restes à affecter, tenus à jour lors de la modification de la cotisation,
+    # de ses affectations ou de la classification des cas concernés
+    solde_social = models.IntegerField(default=0, editable=False, verbose_name="reste social")
+    solde_mission = models.IntegerField(default=0, editable=False, verbose_name="reste mission")
+
+    objects = CotisationQuerySet.as_manager()
+
     class Meta:
         verbose_name = "cotisation du mois"
         verbose_name_plural = "cotisations du mois"
+        indexes = [
+            # Cotisations d'une réunion, selon leur libération
+            models.Index(fields=['reunion', 'social_libere', 'mission_libere'], name='cotis_reunion_liberation_idx'),
+            # Index partiel des cotisations non libérées (CotisationQuerySet.non_liberees) :
+            # la condition doit rester identique à celle de la requête pour être utilisée
+            models.Index(
+                fields=['reunion'],
+                name='cotis_non_liberee_idx',
+                condition=~Q(social_libere=True, mission_libere=True),
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        meme_ligne = not self._state.adding and kwargs.get('using', self._state.db) == self._state.db
+        if update_fields is None and meme_ligne and not kwargs.get('force_insert') \
+                and not self.champs_modifies(*self.CHAMPS_SOLDES):
+            # Soldes inchangés, non réécrits : ils ont pu être recalculés en base
+            # (modification des affectations) depuis le chargement de la cotisation
+            kwargs['update_fields'] = [
+                champ.attname for champ in self._meta.concrete_fields
+                if not champ.primary_key and champ.attname not in ('solde_social', 'solde_mission')
+            ]
+        else:
+            # Les soldes dépendent des montants et des indicateurs de libération
+            self.calcule_soldes()
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'solde_social', 'solde_mission'}
+        super().save(*args, **kwargs)  # Procéder à la sauvegarde
+
+    def calcule_soldes(self):
+        """
+        Calcule les restes à affecter de la cotisation (sans les enregistrer)
+        """
+        affecte = {'S': 0, 'M': 0}
+        if self.pk:
+            affecte.update(
+                AffectationNonLibere.objects
+                    .filter(cotisation=self)
+                    .order_by()
+                    .values_list('cas__classification')
+                    .annotate(Sum('somme'))
+            )
+        self.solde_social = (0 if self.social_libere else self.montant_social) - affecte['S']
+        self.solde_mission = (0 if self.mission_libere else self.montant_mission) - affecte['M']
 
     def __str__(self):
         return ''
@@ -340,10 +803,13 @@ class Cotisation(models.Model):
 # def cotisation_non_liberee(reunion):
 #     return Q(reunion=reunion) & Q(social_libere=False) | Q(mission_libere=False)
 
-class AffectationNonLibere(models.Model):
+class AffectationNonLibere(SuiviChampsMixin, models.Model):
     """
     Affectation des cotisations non libérées
     """
+    # Cotisation d'origine, dont le solde change aussi si elle est remplacée
+    champs_suivis = ('cotisation_id',)
+
     reunion = models.ForeignKey(
         Reunion,
         on_delete=models.CASCADE,
@@ -353,6 +819,7 @@ class AffectationNonLibere(models.Model):
     cotisation = models.ForeignKey(
         Cotisation,
         on_delete=models.CASCADE,
+        db_index=False,  # Colonne de tête de l'index affect_cotisation_cas_idx
         verbose_name="cotisation de"
     )
     collecteur = models.ForeignKey(
@@ -372,6 +839,10 @@ class AffectationNonLibere(models.Model):
     class Meta:
         verbose_name = "affectation de cotisation non libérée"
         verbose_name_plural = "affectations des cotisations non libérées"
+        indexes = [
+            # Sommes affectées à une cotisation, par classification des cas (calcul des restes)
+            models.Index(fields=['cotisation', 'cas'], name='affect_cotisation_cas_idx'),
+        ]
 
     def __str__(self):
         return f"{self.cotisation.membre}"
@@ -412,3 +883,99 @@ class VueCotisationNonLiberee(models.Model):
 
     def __str__(self):
         return ""
+
+
+class Tache(models.Model):
+    """
+    Traitement exécuté en arrière-plan par la commande traite_taches (voir taches.py)
+    """
+    EN_ATTENTE = 'A'
+    EN_COURS = 'C'
+    SUCCES = 'S'
+    ECHEC = 'E'
+    ETATS = (
+        (EN_ATTENTE, 'En attente'),
+        (EN_COURS, 'En cours'),
+        (SUCCES, 'Terminée'),
+        (ECHEC, 'En échec'),
+    )
+
+    nom = models.CharField(max_length=64)
+    cle = models.CharField(max_length=191, unique=True, null=True, blank=True, verbose_name="clé")
+    arguments = models.TextField(default="{}")
+    etat = models.CharField(max_length=1, choices=ETATS, default=EN_ATTENTE, verbose_name="état")
+    progression = models.PositiveSmallIntegerField(default=0, verbose_name="progression (%)")
+    message = models.CharField(max_length=255, blank=True)
+    tentatives = models.PositiveSmallIntegerField(default=0)
+    tentatives_max = models.PositiveSmallIntegerField(default=3, verbose_name="nombre maximal de tentatives")
+    resultat = models.TextField(blank=True, verbose_name="résultat")
+    erreur = models.TextField(blank=True)
+    travailleur = models.CharField(max_length=128, blank=True)
+    cree_le = models.DateTimeField(auto_now_add=True, verbose_name="créée le")
+    executer_apres = models.DateTimeField(default=timezone.now, verbose_name="exécuter après")
+    debute_le = models.DateTimeField(null=True, blank=True, verbose_name="débutée le")
+    fin_bail = models.DateTimeField(null=True, blank=True, verbose_name="fin du bail")
+    termine_le = models.DateTimeField(null=True, blank=True, verbose_name="terminée le")
+
+    class Meta:
+        verbose_name = "tâche"
+        ordering = ('-cree_le',)
+        indexes = [
+            # Réservation des tâches par les travailleurs
+            models.Index(fields=['etat', 'executer_apres'], name='tache_etat_execution_idx'),
+        ]
+
+    @property
+    def parametres(self):
+        return json.loads(self.arguments)
+
+    def remet_en_attente(self):
+        """
+        Réinitialise la tâche pour une nouvelle exécution (sans l'enregistrer)
+        """
+        self.etat = self.EN_ATTENTE
+        self.progression = 0
+        self.message = ""
+        self.tentatives = 0
+        self.resultat = ""
+        self.erreur = ""
+        self.travailleur = ""
+        self.executer_apres = timezone.now()
+        self.debute_le = self.fin_bail = self.termine_le = None
+
+    def avance(self, fait, total, message=""):
+        """
+        Enregistre la progression de la tâche (fait sur total) et prolonge son bail
+        """
+        self.progression = 100 * fait // total if total else 100
+        self.message = message
+        if self.pk:
+            Tache.objects.filter(pk=self.pk, travailleur=self.travailleur).update(
+                progression=self.progression,
+                message=message,
+                fin_bail=timezone.now() + taches.DUREE_BAIL,
+            )
+
+    def __str__(self):
+        return self.cle or f"{self.nom} ({self.pk})"
+
+
+@taches.tache('generer_cotisations')
+def tache_generer_cotisations(tache, reunion):
+    """
+    Génère les cotisations d'une réunion (ignorée si elle a été supprimée)
+    """
+    reunion = Reunion.objects.filter(pk=reunion).first()
+    return reunion.generer_cotisations() if reunion else 0
+
+
+@taches.tache('recalcule_reunions')
+def tache_recalcule_reunions(tache, reunions):
+    """
+    Recalcule les soldes des cotisations et les statistiques des réunions, une à une
+    """
+    for indice, reunion in enumerate(reunions):
+        Cotisation.objects.filter(reunion_id=reunion).recalcule_soldes()
+        StatistiquesReunion.actualise([reunion])
+        tache.avance(indice + 1, len(reunions), f"{indice + 1} réunion(s) sur {len(reunions)}")
+    return len(reunions)
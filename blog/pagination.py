@@ -0,0 +1,208 @@
+"""
+Pagination par curseur (keyset) des listes de l'administration
+
+La pagination par défaut de l'administration (OFFSET et COUNT(*) exact)
+coûte d'autant plus cher que la page est éloignée et la table volumineuse.
+Ici, les objets sont ordonnés selon une clé unique (par exemple nom, prénoms,
+identifiant) et chaque page est lue à partir de la clé du dernier objet de la
+page précédente (paramètre « apres ») ou du premier objet de la page suivante
+(paramètre « avant ») : la page N coûte autant que la première, l'index de la
+clé étant parcouru à partir de la position du curseur.
+
+Le nombre d'objets affiché est estimé par le planificateur de PostgreSQL
+(statistiques des tables) ; il n'est compté exactement que s'il est faible,
+ou sur les autres bases.
+"""
+import base64
+import binascii
+import json
+
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList, ORDER_VAR
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import CharField, Func, Q
+
+
+# Paramètres d'URL du curseur
+APRES = 'apres'
+AVANT = 'avant'
+
+# En dessous de cette estimation, le nombre d'objets est compté exactement
+SEUIL_ESTIMATION = 10000
+
+
+class SansNull(Func):
+    """
+    Chaîne vide à la place de NULL. La chaîne vide est écrite dans la requête
+    (et non passée en paramètre) pour que l'expression soit identique à celle
+    de l'index de la clé (voir la migration 0008).
+    """
+    template = "COALESCE(%(expressions)s, '')"
+    output_field = CharField()
+
+
+class CleCurseur:
+    """
+    Clé de pagination : suite d'expressions (nom, expression) dont
+    les valeurs identifient chaque objet, dans l'ordre croissant
+    ou décroissant. Les expressions ne doivent pas être nulles.
+    """
+    def __init__(self, expressions, descendant=False):
+        self.expressions = [(f"_cle_{nom}", expression) for nom, expression in expressions]
+        self.descendant = descendant
+
+    def annote(self, queryset):
+        return queryset.annotate(**dict(self.expressions))
+
+    def ordre(self, inverse=False):
+        prefixe = '-' if self.descendant != inverse else ''
+        return [prefixe + alias for alias, expression in self.expressions]
+
+    def condition(self, valeurs, inverse=False):
+        """
+        Objets situés après (ou avant si inverse) ceux de clé valeurs :
+        (a, b, c) > (x, y, z) s'écrit a >= x ET (a > x OU (b >= y ET (b > y OU c > z))),
+        la première comparaison pouvant être résolue par l'index de la clé
+        """
+        sens = 'lt' if self.descendant != inverse else 'gt'
+        alias = [alias for alias, expression in self.expressions]
+        condition = Q(**{f"{alias[-1]}__{sens}": valeurs[-1]})
+        for nom, valeur in reversed(list(zip(alias[:-1], valeurs[:-1]))):
+            condition = Q(**{f"{nom}__{sens}e": valeur}) & (Q(**{f"{nom}__{sens}": valeur}) | condition)
+        return condition
+
+    def valeurs(self, objet):
+        return [getattr(objet, alias) for alias, expression in self.expressions]
+
+    def encode(self, objet):
+        texte = json.dumps(self.valeurs(objet), cls=DjangoJSONEncoder)
+        return base64.urlsafe_b64encode(texte.encode()).decode()
+
+    def decode(self, curseur, queryset):
+        """
+        Valeurs de la clé d'un curseur, converties selon le type des expressions.
+        Lève ValueError si le curseur est invalide.
+        """
+        try:
+            valeurs = json.loads(base64.urlsafe_b64decode(curseur.encode()).decode())
+            if not isinstance(valeurs, list) or len(valeurs) != len(self.expressions):
+                raise ValueError(curseur)
+            return [
+                queryset.query.annotations[alias].output_field.to_python(valeur)
+                for (alias, expression), valeur in zip(self.expressions, valeurs)
+            ]
+        except (TypeError, UnicodeError, ValidationError, json.JSONDecodeError, binascii.Error) as erreur:
+            raise ValueError(curseur) from erreur
+
+
+class PageCurseur:
+    """
+    Page d'objets lue à partir d'un curseur
+    """
+    def __init__(self, queryset, cle, taille, apres=None, avant=None):
+        queryset = cle.annote(queryset)
+        if avant:
+            # Page précédente : lecture en sens inverse à partir du curseur
+            objets = list(
+                queryset.filter(cle.condition(cle.decode(avant, queryset), inverse=True))
+                    .order_by(*cle.ordre(inverse=True))[:taille + 1]
+            )
+            self.precedente = len(objets) > taille
+            self.suivante = True
+            objets = objets[:taille]
+            objets.reverse()
+        else:
+            if apres:
+                queryset = queryset.filter(cle.condition(cle.decode(apres, queryset)))
+            objets = list(queryset.order_by(*cle.ordre())[:taille + 1])
+            self.precedente = bool(apres)
+            self.suivante = len(objets) > taille
+            objets = objets[:taille]
+        self.object_list = objets
+        self.curseur_precedent = cle.encode(objets[0]) if objets and self.precedente else None
+        self.curseur_suivant = cle.encode(objets[-1]) if objets and self.suivante else None
+
+
+def estime_nombre(queryset):
+    """
+    Nombre d'objets du queryset : estimation du planificateur sous PostgreSQL,
+    nombre exact sur les autres bases ou si l'estimation est faible
+    """
+    connexion = connections[queryset.db]
+    if connexion.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connexion.cursor() as curseur:
+        curseur.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = curseur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    estimation = int(plan[0]['Plan']['Plan Rows'])
+    if estimation < SEUIL_ESTIMATION:
+        return queryset.count()
+    return estimation
+
+
+class ChangeListCurseur(ChangeList):
+    """
+    Liste de l'administration paginée par curseur selon la clé
+    cle_pagination de l'administration du modèle. Le tri par colonne
+    et l'affichage de tous les objets reviennent à la pagination standard.
+    """
+    def get_queryset(self, request):
+        # Le curseur n'est pas un filtre : il est retiré des paramètres de la liste
+        # (et donc des liens des filtres, des tris et du formulaire de recherche)
+        self.apres = self.params.pop(APRES, None)
+        self.avant = self.params.pop(AVANT, None)
+        return super().get_queryset(request)
+
+    def get_results(self, request):
+        self.pagination_curseur = ORDER_VAR not in self.params and not self.show_all
+        if not self.pagination_curseur:
+            return super().get_results(request)
+
+        try:
+            page = PageCurseur(
+                self.queryset, self.model_admin.cle_pagination, self.list_per_page,
+                apres=self.apres, avant=self.avant,
+            )
+        except ValueError:
+            raise IncorrectLookupParameters
+        self.result_count = estime_nombre(self.queryset)
+        self.nombre_estime = connections[self.queryset.db].vendor == 'postgresql' \
+            and self.result_count >= SEUIL_ESTIMATION
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = page.object_list
+        self.can_show_all = False
+        self.multi_page = page.precedente or page.suivante
+        self.paginator = None
+        self.page = page
+
+    def url_curseur(self, nom, curseur):
+        return self.get_query_string({nom: curseur})
+
+    def url_premiere(self):
+        return self.get_query_string()
+
+    def url_precedente(self):
+        return self.url_curseur(AVANT, self.page.curseur_precedent)
+
+    def url_suivante(self):
+        return self.url_curseur(APRES, self.page.curseur_suivant)
+
+
+class PaginationCurseurAdminMixin:
+    """
+    Pagination par curseur de la liste des objets (voir ChangeListCurseur)
+    """
+    cle_pagination = None
+    change_list_template = 'admin/blog/change_list_curseur.html'
+    # Le nombre total d'objets, sans filtre, n'est pas compté
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return ChangeListCurseur
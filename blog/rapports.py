@@ -0,0 +1,442 @@
+"""
+Rapports financiers des réunions, exportés en flux
+
+Trois rapports, pour une réunion, une sélection de réunions ou une période :
+- synthese : montants de chaque réunion (sollicités, urgences, alloués,
+  cotisations, reliquats), lus dans la table des statistiques ;
+- cas : montants sollicité, estimé et alloué de chaque cas, et sa part entière des
+  cotisations (moteur de répartition, voir repartition.py) ;
+- cotisations : cotisations non libérées et leurs restes à affecter.
+
+Les lignes sont lues par lots (iterator(chunk_size=...), curseur côté serveur
+sous PostgreSQL) et écrites au fur et à mesure en CSV, en XLSX (une feuille par
+rapport, classeur écrit sans dépendance externe) ou en page HTML imprimable
+(à enregistrer en PDF depuis le navigateur) : la mémoire utilisée ne dépend pas
+du nombre de lignes, et la réponse commence avant la fin de la lecture.
+"""
+import csv
+import io
+import zipfile
+from datetime import date
+from itertools import groupby
+from operator import itemgetter
+from xml.sax.saxutils import escape
+
+from django.http import StreamingHttpResponse
+from django.utils.html import escape as escape_html, format_html, format_html_join
+from django.utils.safestring import mark_safe
+
+from . import repartition
+from .formatage import formatte_montant
+from .models import CLASSIFICATION_CAS, Cas, Cotisation
+
+
+# Nombre de lignes lues par requête
+TAILLE_LOT = 2000
+
+# Taille des blocs envoyés au client
+TAILLE_BLOC = 1 << 16
+
+CLASSIFICATIONS = dict(CLASSIFICATION_CAS)
+
+
+def oui_non(valeur):
+    return "Oui" if valeur else "Non"
+
+
+class Rapport:
+    """
+    Rapport tabulaire : titre, colonnes, et fonction produisant les lignes
+    (tuples) à partir d'un queryset de réunions et d'une taille de lot.
+    Une ligne de total (somme des colonnes numériques) termine le rapport.
+    """
+    def __init__(self, titre, colonnes, lignes):
+        self.titre = titre
+        self.colonnes = colonnes
+        self.lignes = lignes
+
+    def parcourt(self, reunions, taille_lot=TAILLE_LOT):
+        totaux = [None] * len(self.colonnes)
+        for ligne in self.lignes(reunions, taille_lot):
+            for indice, valeur in enumerate(ligne):
+                if isinstance(valeur, int):
+                    totaux[indice] = (totaux[indice] or 0) + valeur
+            yield ligne
+        yield ("Total",) + tuple("" if total is None else total for total in totaux[1:])
+
+
+def lignes_synthese(reunions, taille_lot):
+    lignes = reunions\
+        .order_by('date_reunion', 'pk')\
+        .values_list(
+            'date_reunion',
+            'membre_hote__first_name',
+            'membre_hote__last_name',
+            'lieu_reunion',
+            'statistiques__nb_cas',
+            'statistiques__sollicite_social',
+            'statistiques__sollicite_mission',
+            'statistiques__urgence_social',
+            'statistiques__urgence_mission',
+            'statistiques__alloue_social',
+            'statistiques__alloue_mission',
+            'statistiques__cotisations_social',
+            'statistiques__cotisations_mission',
+            'statistiques__reliquat_social',
+            'statistiques__reliquat_mission',
+        )
+    for date_reunion, prenom, nom, lieu, *montants in lignes.iterator(chunk_size=taille_lot):
+        # Statistiques absentes si elles n'ont pas encore été calculées
+        yield (date_reunion, f"{prenom} {nom}", lieu or "") + tuple(montant or 0 for montant in montants)
+
+
+def lignes_cas(reunions, taille_lot):
+    lignes = Cas.objects.using(reunions.db)\
+        .filter(reunion__in=reunions.values('pk'))\
+        .order_by('reunion__date_reunion', 'reunion_id', 'classification', 'pk')\
+        .values_list(
+            'reunion_id',
+            'classification',
+            'reunion__date_reunion',
+            'nom',
+            'prenoms',
+            'urgence',
+            'montant_sollicite',
+            'montant_alloue',
+            'reunion__statistiques__cotisations_social',
+            'reunion__statistiques__cotisations_mission',
+        )
+    # Les cas d'une réunion et d'une classification se suivent : leurs montants estimés
+    # et leurs parts entières sont calculés ensemble par le moteur de répartition
+    for (_, classification), groupe in groupby(lignes.iterator(chunk_size=taille_lot), key=itemgetter(0, 1)):
+        groupe = list(groupe)
+        cotisations_social, cotisations_mission = groupe[0][-2:]
+        resultat = repartition.repartit(
+            [ligne[6] for ligne in groupe],
+            [ligne[5] for ligne in groupe],
+            cotisations_social if classification == 'S' else cotisations_mission,
+        )
+        for ligne, estime, part in zip(groupe, resultat.estimes, resultat.parts):
+            _, _, date_reunion, nom, prenoms, urgence, sollicite, alloue, _, _ = ligne
+            yield (
+                date_reunion, nom or "", prenoms or "", CLASSIFICATIONS.get(classification, ""),
+                oui_non(urgence), sollicite or 0, estime, part, alloue or 0,
+            )
+
+
+def lignes_cotisations(reunions, taille_lot):
+    lignes = Cotisation.objects.using(reunions.db)\
+        .filter(reunion__in=reunions.values('pk'))\
+        .non_liberees()\
+        .order_by('reunion__date_reunion', 'reunion_id', 'membre__last_name', 'membre__first_name', 'pk')\
+        .values_list(
+            'reunion__date_reunion',
+            'membre__first_name',
+            'membre__last_name',
+            'montant_social',
+            'social_libere',
+            'solde_social',
+            'montant_mission',
+            'mission_libere',
+            'solde_mission',
+        )
+    for date_reunion, prenom, nom, social, social_libere, solde_social, mission, mission_libere, solde_mission in \
+            lignes.iterator(chunk_size=taille_lot):
+        yield (
+            date_reunion, f"{prenom or ''} {nom or ''}".strip(),
+            social, oui_non(social_libere), solde_social,
+            mission, oui_non(mission_libere), solde_mission,
+        )
+
+
+RAPPORTS = {
+    'synthese': Rapport(
+        "Synthèse des réunions",
+        (
+            "Date", "Membre hôte", "Lieu", "Nombre de cas",
+            "Sollicité social", "Sollicité mission", "Urgence social", "Urgence mission",
+            "Alloué social", "Alloué mission", "Cotisations social", "Cotisations mission",
+            "Reliquat social", "Reliquat mission",
+        ),
+        lignes_synthese,
+    ),
+    'cas': Rapport(
+        "Cas et montants alloués",
+        ("Date", "Nom", "Prénoms", "Classification", "Urgence", "Sollicité", "Estimé", "Part", "Alloué"),
+        lignes_cas,
+    ),
+    'cotisations': Rapport(
+        "Cotisations non libérées",
+        (
+            "Date", "Membre", "Cotisation social", "Social libéré", "Reste social",
+            "Cotisation mission", "Mission libérée", "Reste mission",
+        ),
+        lignes_cotisations,
+    ),
+}
+
+
+def par_blocs(morceaux, taille=TAILLE_BLOC):
+    """
+    Regroupe les morceaux de texte fournis en blocs d'environ taille caractères
+    """
+    bloc, longueur = [], 0
+    for morceau in morceaux:
+        bloc.append(morceau)
+        longueur += len(morceau)
+        if longueur >= taille:
+            yield "".join(bloc)
+            bloc, longueur = [], 0
+    if bloc:
+        yield "".join(bloc)
+
+
+# CSV
+
+class Echo:
+    """
+    Pseudo-fichier retournant ce qui y est écrit, pour csv.writer
+    """
+    def write(self, valeur):
+        return valeur
+
+
+def ecrit_csv(rapport, reunions, taille_lot=TAILLE_LOT):
+    """
+    Rapport au format CSV (séparateur point-virgule, avec marque d'ordre
+    des octets pour que les tableurs reconnaissent l'UTF-8)
+    """
+    ecrivain = csv.writer(Echo(), delimiter=';')
+    lignes = (ecrivain.writerow(ligne) for ligne in rapport.parcourt(reunions, taille_lot))
+    yield "\ufeff" + ecrivain.writerow(rapport.colonnes)
+    yield from par_blocs(lignes)
+
+
+# XLSX : classeur SpreadsheetML minimal, une feuille par rapport
+
+XLSX_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '{feuilles}</Types>'
+)
+XLSX_TYPE_FEUILLE = (
+    '<Override PartName="/xl/worksheets/sheet{indice}.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+)
+XLSX_RELATIONS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/></Relationships>'
+)
+XLSX_CLASSEUR = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets>{feuilles}</sheets></workbook>'
+)
+XLSX_CLASSEUR_FEUILLE = '<sheet name="{nom}" sheetId="{indice}" r:id="rId{indice}"/>'
+XLSX_RELATIONS_CLASSEUR = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '{feuilles}<Relationship Id="rIdStyles" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/></Relationships>'
+)
+XLSX_RELATION_FEUILLE = (
+    '<Relationship Id="rId{indice}" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet{indice}.xml"/>'
+)
+# Styles : 0 par défaut, 1 date (format prédéfini 14), 2 en-tête en gras
+XLSX_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+XLSX_DEBUT_FEUILLE = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+XLSX_FIN_FEUILLE = '</sheetData></worksheet>'
+
+# Origine des numéros de série des dates des tableurs
+ORIGINE_DATES = date(1899, 12, 30)
+
+
+def cellule_xlsx(valeur, style=0):
+    if isinstance(valeur, date):
+        return f'<c s="1"><v>{(valeur - ORIGINE_DATES).days}</v></c>'
+    if isinstance(valeur, int) and not isinstance(valeur, bool):
+        return f'<c><v>{valeur}</v></c>'
+    attribut_style = f' s="{style}"' if style else ''
+    return f'<c t="inlineStr"{attribut_style}><is><t>{escape(str(valeur))}</t></is></c>'
+
+
+def ligne_xlsx(valeurs, style=0):
+    return "<row>" + "".join(cellule_xlsx(valeur, style) for valeur in valeurs) + "</row>"
+
+
+class Tampon(io.RawIOBase):
+    """
+    Fichier en écriture seule, non positionnable, dont le contenu est vidé
+    à chaque envoi au client : l'archive ZIP est produite en flux
+    """
+    def __init__(self):
+        super().__init__()
+        self.morceaux = []
+
+    def writable(self):
+        return True
+
+    def write(self, donnees):
+        self.morceaux.append(bytes(donnees))
+        return len(donnees)
+
+    def vide(self):
+        donnees = b"".join(self.morceaux)
+        self.morceaux = []
+        return donnees
+
+
+def ecrit_xlsx(rapports, reunions, taille_lot=TAILLE_LOT):
+    """
+    Classeur XLSX comportant une feuille par rapport
+    """
+    indices = range(1, len(rapports) + 1)
+    tampon = Tampon()
+    with zipfile.ZipFile(tampon, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', XLSX_TYPES.format(
+            feuilles="".join(XLSX_TYPE_FEUILLE.format(indice=indice) for indice in indices)
+        ))
+        archive.writestr('_rels/.rels', XLSX_RELATIONS)
+        archive.writestr('xl/workbook.xml', XLSX_CLASSEUR.format(feuilles="".join(
+            # Noms de feuille : 31 caractères au plus
+            XLSX_CLASSEUR_FEUILLE.format(nom=escape(rapport.titre[:31]), indice=indice)
+            for indice, rapport in zip(indices, rapports)
+        )))
+        archive.writestr('xl/_rels/workbook.xml.rels', XLSX_RELATIONS_CLASSEUR.format(
+            feuilles="".join(XLSX_RELATION_FEUILLE.format(indice=indice) for indice in indices)
+        ))
+        archive.writestr('xl/styles.xml', XLSX_STYLES)
+        yield tampon.vide()
+
+        for indice, rapport in zip(indices, rapports):
+            # Taille inconnue à l'ouverture : force_zip64 autorise plus de 2 Go
+            with archive.open(f'xl/worksheets/sheet{indice}.xml', 'w', force_zip64=True) as feuille:
+                feuille.write((XLSX_DEBUT_FEUILLE + ligne_xlsx(rapport.colonnes, style=2)).encode())
+                for bloc in par_blocs(ligne_xlsx(ligne) for ligne in rapport.parcourt(reunions, taille_lot)):
+                    feuille.write(bloc.encode())
+                    yield tampon.vide()
+                feuille.write(XLSX_FIN_FEUILLE.encode())
+    yield tampon.vide()
+
+
+# HTML imprimable
+
+HTML_STYLE = """
+body { font-family: sans-serif; font-size: 11px; }
+table { border-collapse: collapse; width: 100%; margin-bottom: 2em; }
+th, td { border: 1px solid #999; padding: 2px 4px; }
+th { background: #eee; }
+td.nombre { text-align: right; white-space: nowrap; }
+tr:last-child td { font-weight: bold; }
+thead { display: table-header-group; }
+tr { page-break-inside: avoid; }
+@media print { .imprimer { display: none; } @page { size: landscape; margin: 1cm; } }
+"""
+HTML_DEBUT = """<!DOCTYPE html>
+<html lang="fr">
+<head>
+<meta charset="utf-8">
+<title>{titre}</title>
+<style>{style}</style>
+</head>
+<body>
+<button class="imprimer" onclick="window.print()">Imprimer / enregistrer en PDF</button>
+<h1>{titre}</h1>
+"""
+
+
+def cellule_html(valeur):
+    # Cellules écrites sans format_html, trop coûteux pour des centaines de milliers de cellules
+    if isinstance(valeur, date):
+        return f"<td>{valeur:%d/%m/%Y}</td>"
+    if isinstance(valeur, int) and not isinstance(valeur, bool):
+        return f'<td class="nombre">{formatte_montant(valeur)}</td>'
+    return f"<td>{escape_html(valeur)}</td>"
+
+
+def ecrit_html(rapports, reunions, titre, taille_lot=TAILLE_LOT):
+    """
+    Page HTML imprimable comportant un tableau par rapport
+    """
+    yield format_html(HTML_DEBUT, titre=titre, style=mark_safe(HTML_STYLE))
+    for rapport in rapports:
+        yield format_html(
+            "<h2>{}</h2>\n<table>\n<thead><tr>{}</tr></thead>\n<tbody>\n",
+            rapport.titre,
+            format_html_join("", "<th>{}</th>", ((colonne,) for colonne in rapport.colonnes)),
+        )
+        yield from par_blocs(
+            "<tr>" + "".join(cellule_html(valeur) for valeur in ligne) + "</tr>\n"
+            for ligne in rapport.parcourt(reunions, taille_lot)
+        )
+        yield "</tbody>\n</table>\n"
+    yield "</body>\n</html>\n"
+
+
+# Réponses HTTP
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'html': 'text/html; charset=utf-8',
+}
+
+
+def contenu_rapport(format, reunions, rapport='synthese', titre="Rapport financier", taille_lot=TAILLE_LOT):
+    """
+    Contenu d'un rapport (générateur de morceaux) : le rapport fourni en CSV,
+    tous les rapports en XLSX et en HTML
+    """
+    if format == 'csv':
+        return ecrit_csv(RAPPORTS[rapport], reunions, taille_lot)
+    if format == 'xlsx':
+        return ecrit_xlsx(list(RAPPORTS.values()), reunions, taille_lot)
+    if format == 'html':
+        return ecrit_html(list(RAPPORTS.values()), reunions, titre, taille_lot)
+    raise ValueError(f"Format inconnu : {format}")
+
+
+def reponse_rapport(format, reunions, nom="rapport", rapport='synthese', titre="Rapport financier"):
+    """
+    Réponse HTTP transmettant le rapport en flux, en pièce jointe
+    (sauf la page HTML, affichée pour être imprimée)
+    """
+    reponse = StreamingHttpResponse(
+        contenu_rapport(format, reunions, rapport=rapport, titre=titre),
+        content_type=FORMATS[format],
+    )
+    if format != 'html':
+        if format == 'csv':
+            nom = f"{nom}_{rapport}"
+        reponse['Content-Disposition'] = f'attachment; filename="{nom}.{format}"'
+    return reponse
@@ -0,0 +1,177 @@
+"""
+Recherche plein texte, insensible aux accents et à la casse, des bénéficiaires,
+des cas et des membres
+
+- PostgreSQL : les champs de recherche sont concaténés et normalisés par la
+  fonction immuable providence_recherche() (minuscules, sans accents, extension
+  unaccent) ; un index GIN trigrammes (extension pg_trgm) sur cette expression
+  permet les recherches « contient » (LIKE '%...%') sans parcourir la table.
+- SQLite : une table virtuelle FTS5 par modèle (tokeniseur unicode61 sans
+  diacritiques), tenue à jour par des déclencheurs ; chaque mot recherché est
+  un préfixe.
+- Autres bases : recherche standard de l'administration (icontains).
+
+Les fonctions, index, tables et déclencheurs sont créés par la migration 0007,
+qui contient une copie de leurs instructions (à mettre à jour par une nouvelle
+migration si elles changent).
+Sous SQLite, la reconstruction d'une table par une migration ultérieure supprime
+ses déclencheurs : ils sont recréés, et les tables FTS5 reconstruites, à l'issue
+des migrations (voir installe_recherche).
+"""
+import unicodedata
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import F, Func, TextField
+from django.db.models.expressions import RawSQL
+
+
+# Champs de recherche de chaque table
+CHAMPS_RECHERCHE = {
+    'blog_beneficiaire': ('nom', 'prenoms'),
+    'blog_cas': ('nom', 'prenoms'),
+    'blog_provuser': ('last_name', 'first_name', 'username', 'email'),
+}
+
+# Fonction de normalisation (PostgreSQL) : immuable pour pouvoir être indexée,
+# ce que n'est pas unaccent()
+SQL_FONCTION_POSTGRESQL = """
+CREATE EXTENSION IF NOT EXISTS unaccent;
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE OR REPLACE FUNCTION providence_recherche(VARIADIC textes text[]) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    AS $$ SELECT lower(public.unaccent('public.unaccent'::regdictionary, array_to_string(textes, ' '))) $$;
+"""
+SQL_SUPPRIME_FONCTION_POSTGRESQL = "DROP FUNCTION IF EXISTS providence_recherche(VARIADIC text[]);"
+
+
+def table_fts(table):
+    return f"{table}_fts"
+
+
+def sql_creation(vendor):
+    """
+    Instructions SQL de création des structures de recherche pour la base fournie
+    """
+    instructions = []
+    if vendor == 'postgresql':
+        instructions.append(SQL_FONCTION_POSTGRESQL)
+        for table, champs in CHAMPS_RECHERCHE.items():
+            colonnes = ", ".join(f'"{champ}"' for champ in champs)
+            instructions.append(
+                f'CREATE INDEX IF NOT EXISTS "{table}_recherche_idx" ON "{table}" '
+                f'USING gin (providence_recherche({colonnes}) gin_trgm_ops);'
+            )
+    elif vendor == 'sqlite':
+        for table, champs in CHAMPS_RECHERCHE.items():
+            fts = table_fts(table)
+            colonnes = ", ".join(champs)
+            nouvelles = ", ".join(f"new.{champ}" for champ in champs)
+            anciennes = ", ".join(f"old.{champ}" for champ in champs)
+            instructions += [
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({colonnes}, content='{table}', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2');",
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+                f"INSERT INTO {fts}(rowid, {colonnes}) VALUES (new.id, {nouvelles}); END;",
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {colonnes}) VALUES ('delete', old.id, {anciennes}); END;",
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {colonnes}) VALUES ('delete', old.id, {anciennes}); "
+                f"INSERT INTO {fts}(rowid, {colonnes}) VALUES (new.id, {nouvelles}); END;",
+                # Indexation des lignes existantes
+                f"INSERT INTO {fts}({fts}) VALUES ('rebuild');",
+            ]
+    return instructions
+
+
+def sql_suppression(vendor):
+    """
+    Instructions SQL de suppression des structures de recherche pour la base fournie
+    """
+    instructions = []
+    if vendor == 'postgresql':
+        instructions += [f'DROP INDEX IF EXISTS "{table}_recherche_idx";' for table in CHAMPS_RECHERCHE]
+        instructions.append(SQL_SUPPRIME_FONCTION_POSTGRESQL)
+    elif vendor == 'sqlite':
+        for table in CHAMPS_RECHERCHE:
+            fts = table_fts(table)
+            instructions += [f"DROP TRIGGER IF EXISTS {fts}_{suffixe};" for suffixe in ('ai', 'ad', 'au')]
+            instructions.append(f"DROP TABLE IF EXISTS {fts};")
+    return instructions
+
+
+def installe_recherche(using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Récepteur du signal post_migrate : sous SQLite, recrée les tables FTS5
+    et les déclencheurs manquants, puis réindexe les tables concernées
+    """
+    connexion = connections[using]
+    if connexion.vendor != 'sqlite':
+        return
+    with connexion.cursor() as curseur:
+        curseur.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        existants = {nom for nom, in curseur.fetchall()}
+        if not all(table in existants for table in CHAMPS_RECHERCHE):
+            # Migrations de l'application pas encore appliquées
+            return
+        attendus = {
+            f"{table_fts(table)}{suffixe}"
+            for table in CHAMPS_RECHERCHE
+            for suffixe in ('', '_ai', '_ad', '_au')
+        }
+        if attendus <= existants:
+            return
+        for instruction in sql_creation('sqlite'):
+            curseur.execute(instruction)
+
+
+def normalise(texte):
+    """
+    Texte en minuscules et sans accents
+    """
+    decompose = unicodedata.normalize('NFKD', texte)
+    return "".join(c for c in decompose if not unicodedata.combining(c)).lower()
+
+
+def recherche_disponible(modele):
+    """
+    Indique si la recherche plein texte est disponible pour le modèle
+    sur la base de données courante
+    """
+    return connection.vendor in ('postgresql', 'sqlite') and modele._meta.db_table in CHAMPS_RECHERCHE
+
+
+def recherche(queryset, terme):
+    """
+    Filtre le queryset sur les objets dont les champs de recherche contiennent
+    (PostgreSQL) ou comportent un mot commençant par (SQLite) chacun des mots du terme
+    """
+    mots = normalise(terme).split()
+    if not mots:
+        return queryset
+    table = queryset.model._meta.db_table
+    champs = CHAMPS_RECHERCHE[table]
+
+    if connection.vendor == 'postgresql':
+        # L'expression doit être identique à celle de l'index pour qu'il soit utilisé
+        queryset = queryset.annotate(
+            _recherche=Func(*[F(champ) for champ in champs], function='providence_recherche', output_field=TextField())
+        )
+        for mot in mots:
+            queryset = queryset.filter(_recherche__contains=mot)
+        return queryset
+
+    # SQLite : requête FTS5, chaque mot (entre guillemets) étant un préfixe
+    fts = table_fts(table)
+    requete = " AND ".join('"{}"*'.format(mot.replace('"', '""')) for mot in mots)
+    return queryset.filter(pk__in=RawSQL(f"SELECT rowid FROM {fts} WHERE {fts} MATCH %s", [requete]))
+
+
+class RechercheAdminMixin:
+    """
+    Remplace la recherche de l'administration (et de l'autocomplétion)
+    par la recherche plein texte
+    """
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term or not recherche_disponible(queryset.model):
+            return super().get_search_results(request, queryset, search_term)
+        return recherche(queryset, search_term), False
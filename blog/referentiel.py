@@ -0,0 +1,171 @@
+"""
+Données de référence conservées en mémoire de chaque processus
+
+Les natures de besoin et les communautés sont peu nombreuses et ne changent
+presque jamais, mais sont lues par la plupart des pages (choix des formulaires,
+libellés, autocomplétion). Chaque processus les charge une fois, en une requête,
+puis les relit en mémoire tant que la version de leur modèle (voir cache.py),
+incrémentée par les signaux à chaque modification, est inchangée.
+
+Les versions ne sont vues de tous les processus qu'avec un cache partagé
+(CACHE_URL file:// ou redis://). Avec le cache locmem, propre à chaque processus,
+les objets sont de plus rechargés après CACHE_TIMEOUT secondes, pour que les
+modifications faites dans un autre processus soient prises en compte.
+"""
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.admin.views.autocomplete import AutocompleteJsonView
+from django.contrib.admin.widgets import AutocompleteSelect
+
+from .cache import versions
+from .recherche import normalise
+
+
+class Referentiel:
+    """
+    Objets d'un modèle de référence, en mémoire du processus
+    """
+    def __init__(self, label, champs_recherche=()):
+        self.label = label
+        self.champs_recherche = champs_recherche
+        self._version = None
+        self._charge_le = None
+        self._objets = []
+        self._par_pk = {}
+        self._verrou = threading.Lock()
+
+    @property
+    def modele(self):
+        return apps.get_model(self.label)
+
+    def objets(self):
+        """
+        Objets du modèle, dans son ordre par défaut, rechargés si sa version a changé
+        """
+        # La version est lue avant le chargement : une modification pendant
+        # le chargement entraîne un nouveau chargement à la lecture suivante
+        version, = versions(self.modele)
+        if self._perime(version):
+            with self._verrou:
+                if self._perime(version):
+                    charge_le = time.monotonic()
+                    objets = list(self.modele.objects.all())
+                    self._objets, self._par_pk = objets, {objet.pk: objet for objet in objets}
+                    self._version, self._charge_le = version, charge_le
+        return self._objets
+
+    def _perime(self, version):
+        if version != self._version:
+            return True
+        # Cache propre au processus : modifications des autres processus non signalées
+        return not settings.CACHE_PARTAGE and time.monotonic() - self._charge_le > settings.CACHE_TIMEOUT
+
+    def get(self, pk):
+        """
+        Objet d'identifiant pk (None s'il n'existe pas)
+        """
+        self.objets()
+        return self._par_pk.get(int(pk)) if str(pk).isdigit() else None
+
+    def filtre(self, **attributs):
+        """
+        Objets dont les attributs ont les valeurs fournies
+        """
+        return [
+            objet for objet in self.objets()
+            if all(getattr(objet, nom) == valeur for nom, valeur in attributs.items())
+        ]
+
+    def choix(self, **attributs):
+        """
+        Choix (identifiant, libellé) d'un champ de sélection
+        """
+        return [(objet.pk, str(objet)) for objet in self.filtre(**attributs)]
+
+    def libelles(self):
+        """
+        Dictionnaire {identifiant: libellé}, dans l'ordre par défaut du modèle
+        """
+        return {objet.pk: str(objet) for objet in self.objets()}
+
+    def recherche(self, terme):
+        """
+        Objets dont un des champs de recherche contient chacun des mots du terme
+        (sans tenir compte de la casse ni des accents), comme la recherche de l'administration
+        """
+        mots = normalise(terme).split()
+        return [
+            objet for objet in self.objets()
+            if all(
+                any(mot in normalise(getattr(objet, champ) or "") for champ in self.champs_recherche)
+                for mot in mots
+            )
+        ]
+
+
+natures = Referentiel('blog.NatureBesoin')
+communautes = Referentiel('blog.Communaute', champs_recherche=('nom', 'nom_long'))
+
+
+class AutocompleteReferentiel(AutocompleteSelect):
+    """
+    Sélection avec autocomplétion dont le libellé de la valeur choisie
+    est lu dans un référentiel plutôt qu'en base
+    """
+    def __init__(self, referentiel, *args, **kwargs):
+        self.referentiel = referentiel
+        super().__init__(*args, **kwargs)
+
+    def optgroups(self, name, value, attr=None):
+        default = (None, [], 0)
+        if not self.is_required:
+            default[1].append(self.create_option(name, '', '', False, 0))
+        selectionnes = [str(v) for v in value if str(v) not in self.choices.field.empty_values]
+        for pk in selectionnes:
+            objet = self.referentiel.get(pk)
+            if objet is not None:
+                libelle = self.choices.field.label_from_instance(objet)
+                default[1].append(self.create_option(name, objet.pk, libelle, True, len(default[1])))
+        return [default]
+
+
+class AutocompleteReferentielJsonView(AutocompleteJsonView):
+    """
+    Réponses de l'autocomplétion lues dans un référentiel
+    """
+    referentiel = None
+
+    def get_queryset(self):
+        return self.referentiel.recherche(self.term)
+
+
+class ReferentielAdminMixin:
+    """
+    Administration d'un modèle de référence : l'autocomplétion de ses objets
+    est servie depuis le référentiel
+    """
+    referentiel = None
+
+    def autocomplete_view(self, request):
+        return AutocompleteReferentielJsonView.as_view(model_admin=self, referentiel=self.referentiel)(request)
+
+
+class ReferentielsAdminMixin:
+    """
+    Administration d'un modèle lié à des modèles de référence : les libellés
+    des champs avec autocomplétion vers ces modèles sont lus dans les référentiels
+    """
+    referentiels = {
+        'communaute': communautes,
+    }
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        referentiel = self.referentiels.get(db_field.name)
+        if referentiel is not None and db_field.name in self.get_autocomplete_fields(request):
+            kwargs['widget'] = AutocompleteReferentiel(
+                referentiel, db_field.remote_field, self.admin_site, using=kwargs.get('using'),
+            )
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
@@ -0,0 +1,173 @@
+"""
+Moteur de répartition des cotisations entre les cas d'une réunion
+
+Le moteur travaille sur de simples listes (montants sollicités, indicateurs
+d'urgence, montants alloués) et ne dépend pas de l'interface d'administration :
+il peut être utilisé en lot sur l'historique des réunions, par exemple pour
+des simulations.
+
+Règles de répartition, pour une classification donnée (social ou mission) :
+- un cas d'urgence reçoit le montant sollicité ;
+- les cotisations restantes après les urgences sont réparties entre les autres cas
+  au prorata des montants sollicités ;
+- le reliquat est le montant des cotisations diminué des urgences et des montants
+  alloués aux autres cas.
+"""
+from collections import defaultdict
+
+from django.db.models import Sum
+
+
+def estime(montant_sollicite, disponible, sollicite):
+    """
+    Montant estimé d'un cas non urgent : part du montant disponible
+    proportionnelle au montant sollicité (arrondie à l'entier inférieur)
+    """
+    return montant_sollicite * disponible // sollicite if sollicite != 0 else 0
+
+
+def reliquat(cotisations, urgence, alloue):
+    """
+    Reste des cotisations après déduction des urgences et des montants alloués
+    """
+    return (cotisations or 0) - (urgence or 0) - (alloue or 0)
+
+
+def parts_entieres(montants, disponible):
+    """
+    Répartit le montant disponible en parts entières proportionnelles aux montants
+    fournis (méthode du plus fort reste) : la somme des parts est exactement égale
+    au montant disponible, sans perte due aux arrondis
+    """
+    total = sum(montants)
+    if disponible <= 0 or total == 0:
+        return [0] * len(montants)
+
+    parts = []
+    restes = []
+    for indice, montant in enumerate(montants):
+        part, reste = divmod(montant * disponible, total)
+        parts.append(part)
+        restes.append((-reste, indice))
+
+    # Les unités non distribuées vont aux plus forts restes
+    for _, indice in sorted(restes)[:disponible - sum(parts)]:
+        parts[indice] += 1
+    return parts
+
+
+class Repartition:
+    """
+    Résultat de la répartition des cotisations d'une classification entre ses cas
+    """
+    def __init__(self, cotisations, urgence, sollicite, alloue, estimes, parts):
+        self.cotisations = cotisations
+        self.urgence = urgence
+        self.sollicite = sollicite
+        self.alloue = alloue
+        self.estimes = estimes
+        self.parts = parts
+
+    @property
+    def disponible(self):
+        """Cotisations à répartir entre les cas non urgents"""
+        return self.cotisations - self.urgence
+
+    @property
+    def reliquat(self):
+        return reliquat(self.cotisations, self.urgence, self.alloue)
+
+    def __repr__(self):
+        return (
+            f"<Repartition cotisations={self.cotisations} urgence={self.urgence} "
+            f"sollicite={self.sollicite} reliquat={self.reliquat}>"
+        )
+
+
+def repartit(montants, urgences, cotisations, alloues=None):
+    """
+    Calcule en une passe la répartition des cotisations entre les cas
+    d'une classification :
+    - montants : montants sollicités des cas
+    - urgences : indicateurs d'urgence des cas
+    - cotisations : total des cotisations de la classification
+    - alloues : montants alloués aux cas (facultatif, pour le calcul du reliquat)
+    Les montants estimés et les parts entières sont fournis dans l'ordre des cas.
+    """
+    montants = [montant or 0 for montant in montants]
+    urgences = list(urgences)
+    alloues = [0] * len(montants) if alloues is None else [montant or 0 for montant in alloues]
+    cotisations = cotisations or 0
+
+    urgence = sollicite = alloue = 0
+    montants_hors_urgence = []
+    for montant, urgent, montant_alloue in zip(montants, urgences, alloues):
+        sollicite += montant
+        if urgent:
+            urgence += montant
+        else:
+            alloue += montant_alloue
+            montants_hors_urgence.append(montant)
+
+    disponible = cotisations - urgence
+    sollicite_hors_urgence = sollicite - urgence
+    parts_hors_urgence = iter(parts_entieres(montants_hors_urgence, disponible))
+
+    estimes = []
+    parts = []
+    for montant, urgent in zip(montants, urgences):
+        if urgent:
+            estimes.append(montant)
+            parts.append(montant)
+        else:
+            estimes.append(estime(montant, disponible, sollicite_hors_urgence))
+            parts.append(next(parts_hors_urgence))
+
+    return Repartition(cotisations, urgence, sollicite, alloue, estimes, parts)
+
+
+def repartit_lot(cas, cotisations):
+    """
+    Calcule les répartitions d'un lot de réunions :
+    - cas : itérable de tuples (réunion, classification, montant sollicité, urgence, montant alloué)
+    - cotisations : dictionnaire {(réunion, classification): total des cotisations}
+    Retourne un dictionnaire {(réunion, classification): Repartition}
+    """
+    colonnes = defaultdict(lambda: ([], [], []))
+    for reunion, classification, montant, urgent, montant_alloue in cas:
+        montants, urgences, alloues = colonnes[(reunion, classification)]
+        montants.append(montant)
+        urgences.append(urgent)
+        alloues.append(montant_alloue)
+
+    repartitions = {}
+    for cle in set(colonnes) | set(cotisations):
+        montants, urgences, alloues = colonnes[cle]
+        repartitions[cle] = repartit(montants, urgences, cotisations.get(cle, 0), alloues)
+    return repartitions
+
+
+def repartitions_reunions(reunions):
+    """
+    Charge les cas et les cotisations des réunions fournies (queryset de Reunion)
+    en deux requêtes, puis calcule leurs répartitions avec repartit_lot()
+    """
+    from .models import Cas, Cotisation
+
+    cas = Cas.objects\
+        .filter(reunion__in=reunions)\
+        .order_by('reunion', 'pk')\
+        .values_list('reunion_id', 'classification', 'montant_sollicite', 'urgence', 'montant_alloue')\
+        .iterator()
+
+    cotisations = {}
+    totaux = Cotisation.objects\
+        .filter(reunion__in=reunions)\
+        .order_by()\
+        .values('reunion_id')\
+        .annotate(social=Sum('montant_social'), mission=Sum('montant_mission'))
+    for total in totaux:
+        cotisations[(total['reunion_id'], 'S')] = total['social']
+        cotisations[(total['reunion_id'], 'M')] = total['mission']
+
+    return repartit_lot(cas, cotisations)
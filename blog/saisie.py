@@ -0,0 +1,85 @@
+"""
+Saisie en masse des cas d'une réunion
+
+Les cas sont décrits par des dictionnaires :
+
+    {"beneficiaire": 12, "classification": "S", "urgence": false,
+     "montant_sollicite": 50000, "nature": [1, 3], "description": "..."}
+
+Les bénéficiaires sont lus en une seule requête, leurs attributs recopiés dans
+les cas (comme Cas.save), la règle des cas d'urgence appliquée, puis les cas
+et leurs natures sont insérés par insertions en masse, dans une transaction.
+"""
+from django.db import transaction
+
+from .cache import invalide_modele
+from .models import Beneficiaire, Cas, StatistiquesReunion
+
+
+# Attributs d'un cas pouvant figurer dans sa description
+ATTRIBUTS_CAS = (
+    'classification', 'urgence', 'montant_sollicite', 'montant_alloue',
+    'sollicitation_externe', 'description', 'suivi', 'don_remis', 'compte_rendu',
+)
+
+
+def cree_cas(donnees, reunion, soumis_par=None, using='default'):
+    """
+    Crée les cas de la réunion décrits par l'itérable donnees.
+    Les cas dont le bénéficiaire a déjà un cas pour la réunion sont ignorés.
+    Lève ValueError si un bénéficiaire n'existe pas.
+    Retourne la liste des cas créés et le nombre de cas ignorés.
+    """
+    donnees = list(donnees)
+    ids_beneficiaires = {donnee["beneficiaire"] for donnee in donnees}
+    beneficiaires = Beneficiaire.objects.using(using).in_bulk(ids_beneficiaires)
+    inconnus = ids_beneficiaires - set(beneficiaires)
+    if inconnus:
+        raise ValueError(f"Bénéficiaire(s) inexistant(s) : {', '.join(map(str, sorted(inconnus)))}")
+    existants = set(
+        Cas.objects.using(using)
+            .filter(reunion=reunion, beneficiaire_id__in=ids_beneficiaires)
+            .values_list('beneficiaire_id', flat=True)
+    )
+
+    liste_cas = []
+    natures = []
+    for donnee in donnees:
+        if donnee["beneficiaire"] in existants:
+            continue
+        # Un bénéficiaire présent plusieurs fois dans les données n'a qu'un cas
+        existants.add(donnee["beneficiaire"])
+        cas = Cas(
+            reunion=reunion,
+            beneficiaire=beneficiaires[donnee["beneficiaire"]],
+            soumis_par=soumis_par,
+            **{attribut: donnee[attribut] for attribut in ATTRIBUTS_CAS if attribut in donnee},
+        )
+        cas.recopie_beneficiaire(cas.beneficiaire)
+        cas.applique_urgence()
+        liste_cas.append(cas)
+        natures.append(donnee.get("nature", ()))
+
+    with transaction.atomic(using=using):
+        Cas.objects.using(using).bulk_create(liste_cas)
+        if any(cas.pk is None for cas in liste_cas):
+            # Identifiants non retournés par la base (SQLite) : relus
+            # grâce à l'unicité du couple (réunion, bénéficiaire)
+            ids = dict(
+                Cas.objects.using(using)
+                    .filter(reunion=reunion, beneficiaire_id__in=[cas.beneficiaire_id for cas in liste_cas])
+                    .values_list('beneficiaire_id', 'pk')
+            )
+            for cas in liste_cas:
+                cas.pk = ids[cas.beneficiaire_id]
+        Liaison = Cas.nature.through
+        Liaison.objects.using(using).bulk_create(
+            Liaison(cas_id=cas.pk, naturebesoin_id=nature)
+            for cas, ids_natures in zip(liste_cas, natures)
+            for nature in set(ids_natures)
+        )
+        # Les insertions en masse n'émettent pas de signal
+        transaction.on_commit(lambda: StatistiquesReunion.actualise([reunion.pk], using=using), using=using)
+
+    invalide_modele(Cas, using=using)
+    return liste_cas, len(donnees) - len(liste_cas)
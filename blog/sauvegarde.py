@@ -0,0 +1,255 @@
+"""
+Sauvegarde et restauration en flux des données de Providence
+
+Les données sont écrites au format NDJSON : un objet par ligne, au format
+des fixtures Django ({"model": ..., "pk": ..., "fields": {...}}). Les relations
+plusieurs-à-plusieurs sont écrites sous forme de lignes de leurs tables
+de liaison.
+
+La restauration accepte ce format ainsi que les sauvegardes produites par
+dumpdata (un tableau JSON, comme prov_local_fixture.json), lues par blocs
+sans charger le document entier. Les objets sont d'abord répartis par modèle
+dans des fichiers temporaires, puis insérés dans l'ordre des dépendances
+(Communaute, ProvUser, Reunion, Cotisation et Cas, AffectationNonLibere),
+par lots, chaque lot dans sa propre transaction.
+La mémoire utilisée ne dépend pas de la taille de la sauvegarde.
+"""
+import gzip
+import json
+import tempfile
+from collections import OrderedDict
+
+from django.apps import apps
+from django.core import serializers
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+
+from .cache import invalide_modele
+
+
+# Modèles sauvegardés, dans l'ordre des dépendances des clés étrangères
+MODELES = (
+    'blog.communaute',
+    'blog.naturebesoin',
+    'blog.provuser',
+    'blog.beneficiaire',
+    'blog.reunion',
+    'blog.reunion_liste_presence',
+    'blog.cotisation',
+    'blog.cas',
+    'blog.cas_nature',
+    'blog.affectationnonlibere',
+)
+
+
+def modeles():
+    """
+    Classes des modèles sauvegardés, dans l'ordre des dépendances
+    """
+    return [apps.get_model(label) for label in MODELES]
+
+
+def ouvre_fichier(chemin, mode):
+    """
+    Ouvre un fichier texte en UTF-8, compressé si son nom se termine par .gz
+    """
+    if chemin.endswith('.gz'):
+        return gzip.open(chemin, mode + 't', encoding='utf-8')
+    return open(chemin, mode, encoding='utf-8')
+
+
+class EcritureBase:
+    """
+    Écriture d'objets en base de données, par lots
+    """
+    def __init__(self, using='default', ignorer_conflits=False):
+        self.using = using
+        self.ignorer_conflits = ignorer_conflits
+
+    def ecrit(self, modele, objets):
+        # La taille des requêtes d'insertion est laissée au moteur de base de données
+        # (SQLite limite le nombre de paramètres par requête)
+        with transaction.atomic(using=self.using):
+            modele.objects.using(self.using).bulk_create(objets, ignore_conflicts=self.ignorer_conflits)
+
+    def termine(self, modeles):
+        from .models import Reunion, Cas, Cotisation, StatistiquesReunion
+
+        # Les identifiants ayant été fournis, les séquences (PostgreSQL)
+        # doivent être repositionnées
+        connexion = connections[self.using]
+        requetes = connexion.ops.sequence_reset_sql(no_style(), modeles)
+        if requetes:
+            with connexion.cursor() as curseur:
+                for requete in requetes:
+                    curseur.execute(requete)
+        # Les insertions en masse n'émettent pas de signal
+        for modele in modeles:
+            if not modele._meta.auto_created:
+                invalide_modele(modele, using=self.using)
+        if any(modele in (Reunion, Cas, Cotisation) for modele in modeles):
+            StatistiquesReunion.actualise(using=self.using)
+
+
+class EcritureNdjson:
+    """
+    Écriture d'objets dans un fichier NDJSON (compressé si son nom se termine par .gz)
+    """
+    def __init__(self, chemin):
+        self.fichier = ouvre_fichier(chemin, 'w')
+
+    def ecrit(self, modele, objets):
+        label = modele._meta.label_lower
+        champs = [champ for champ in modele._meta.concrete_fields if not champ.primary_key]
+        for objet in objets:
+            ligne = {
+                'model': label,
+                'pk': objet.pk,
+                'fields': {champ.name: champ.value_from_object(objet) for champ in champs},
+            }
+            self.fichier.write(json.dumps(ligne, cls=DjangoJSONEncoder, ensure_ascii=False))
+            self.fichier.write('\n')
+
+    def termine(self, modeles):
+        self.fichier.close()
+
+
+def lit_objets(fichier, taille_bloc=1 << 20):
+    """
+    Retourne un à un les objets d'une sauvegarde, lue par blocs : objets
+    séparés par des sauts de ligne (NDJSON) ou éléments d'un tableau JSON
+    """
+    decodeur = json.JSONDecoder()
+    tampon = fichier.read(taille_bloc)
+    position = len(tampon) - len(tampon.lstrip())
+    tableau = tampon.startswith('[', position)
+    if tableau:
+        position += 1
+    while True:
+        # Séparateurs entre les objets
+        while position < len(tampon) and tampon[position] in ' \t\r\n,':
+            position += 1
+        if tableau and tampon.startswith(']', position):
+            return
+        try:
+            objet, position = decodeur.raw_decode(tampon, position)
+        except json.JSONDecodeError:
+            # Objet incomplet : lire le bloc suivant
+            bloc = fichier.read(taille_bloc)
+            if not bloc:
+                if position == len(tampon) and not tableau:
+                    return
+                raise
+            tampon = tampon[position:] + bloc
+            position = 0
+            continue
+        yield objet
+
+
+def exporte(chemin, taille_lot=2000, using='default'):
+    """
+    Écrit toutes les données dans un fichier NDJSON, modèle par modèle,
+    dans l'ordre des dépendances. Retourne le nombre d'objets écrits par modèle.
+    """
+    ecriture = EcritureNdjson(chemin)
+    nombres = OrderedDict()
+    try:
+        for modele in modeles():
+            nombre = 0
+            lot = []
+            for objet in modele.objects.using(using).order_by('pk').iterator(chunk_size=taille_lot):
+                lot.append(objet)
+                if len(lot) >= taille_lot:
+                    ecriture.ecrit(modele, lot)
+                    nombre += len(lot)
+                    lot = []
+            ecriture.ecrit(modele, lot)
+            nombres[modele._meta.label_lower] = nombre + len(lot)
+    finally:
+        ecriture.termine(modeles())
+    return nombres
+
+
+def importe(chemin, taille_lot=2000, using='default', ignorer_conflits=False):
+    """
+    Importe une sauvegarde (NDJSON ou tableau JSON) par insertions en masse.
+    Les objets des modèles non sauvegardés (tables de Django, anciens modèles)
+    sont ignorés. Retourne le nombre d'objets importés par modèle et
+    le nombre d'objets ignorés.
+    """
+    from .models import Cotisation
+
+    # Relations plusieurs-à-plusieurs vers des modèles non sauvegardés (groupes et
+    # permissions des membres) : leurs identifiants ne sont pas restaurés
+    relations_ignorees = {
+        modele._meta.label_lower: [
+            champ.name for champ in modele._meta.many_to_many
+            if champ.remote_field.through._meta.label_lower not in MODELES
+        ]
+        for modele in modeles()
+    }
+
+    # Répartition des objets par modèle dans des fichiers temporaires
+    temporaires = OrderedDict((label, tempfile.TemporaryFile('w+', encoding='utf-8')) for label in MODELES)
+    ignores = 0
+    try:
+        with ouvre_fichier(chemin, 'r') as fichier:
+            for objet in lit_objets(fichier):
+                label = objet.get('model', '').lower()
+                temporaire = temporaires.get(label)
+                if temporaire is None:
+                    ignores += 1
+                    continue
+                for nom in relations_ignorees[label]:
+                    objet.get('fields', {}).pop(nom, None)
+                temporaire.write(json.dumps(objet, ensure_ascii=False))
+                temporaire.write('\n')
+
+        ecriture = EcritureBase(using=using, ignorer_conflits=ignorer_conflits)
+        nombres = OrderedDict((label, 0) for label in MODELES)
+        for label, temporaire in temporaires.items():
+            temporaire.seek(0)
+            lot = []
+            for objet in serializers.deserialize('python', map(json.loads, temporaire), using=using,
+                                                 ignorenonexistent=True):
+                lot.append(objet)
+                if len(lot) >= taille_lot:
+                    _insere_lot(ecriture, lot, nombres)
+                    lot = []
+            _insere_lot(ecriture, lot, nombres)
+    finally:
+        for temporaire in temporaires.values():
+            temporaire.close()
+
+    # Les soldes des cotisations ne figurent pas dans les sauvegardes antérieures à leur création
+    Cotisation.objects.using(using).recalcule_soldes()
+    ecriture.termine(modeles())
+    return nombres, ignores
+
+
+def _insere_lot(ecriture, lot, nombres):
+    """
+    Insère un lot d'objets désérialisés d'un même modèle, puis leurs relations
+    plusieurs-à-plusieurs (format dumpdata) vers des modèles sauvegardés
+    """
+    if not lot:
+        return
+    modele = type(lot[0].object)
+    ecriture.ecrit(modele, [objet.object for objet in lot])
+    nombres[modele._meta.label_lower] += len(lot)
+
+    for champ in modele._meta.many_to_many:
+        liaison = champ.remote_field.through
+        if liaison._meta.label_lower not in MODELES:
+            continue
+        source = champ.m2m_field_name()
+        cible = champ.m2m_reverse_field_name()
+        liens = [
+            liaison(**{f"{source}_id": objet.object.pk, f"{cible}_id": pk})
+            for objet in lot
+            for pk in objet.m2m_data.get(champ.name, ())
+        ]
+        if liens:
+            ecriture.ecrit(liaison, liens)
+            nombres[liaison._meta.label_lower] += len(liens)
@@ -0,0 +1,107 @@
+"""
+Connexion des récepteurs de signaux de l'application
+"""
+from django.core.signals import request_started, request_finished
+from django.db.models.signals import pre_save, post_save, post_delete, post_migrate
+
+from .cache import invalide_modele_recepteur
+from .connexions import verifie_connexions, memorise_utilisation
+from .recherche import installe_recherche
+from .transactions import a_la_validation
+from .models import (
+    Communaute,
+    ProvUser,
+    Membre,
+    Reunion,
+    Cas,
+    NatureBesoin,
+    Cotisation,
+    AffectationNonLibere,
+    StatistiquesReunion,
+)
+
+
+def memorise_valeurs_precedentes(sender, instance, using, **kwargs):
+    """
+    Avant l'enregistrement d'un cas, d'une cotisation ou d'une affectation, mémorise
+    les valeurs en base de ses champs suivis (réunion, cotisation ou classification
+    d'origine), sans requête si l'objet a été chargé depuis la base
+    """
+    instance.memorise_valeurs_precedentes(using)
+
+
+def recalcule_soldes_affectation(sender, instance, using, **kwargs):
+    """
+    Après l'enregistrement ou la suppression d'une affectation, recalcule
+    les soldes des cotisations concernées
+    """
+    cotisations = {instance.cotisation_id, instance.valeur_precedente('cotisation_id')}
+    Cotisation.objects.using(using).filter(pk__in=cotisations - {None}).recalcule_soldes()
+
+
+def recalcule_soldes_cas(sender, instance, created, using, **kwargs):
+    """
+    Après la modification de la classification d'un cas, recalcule les soldes
+    des cotisations qui lui sont affectées
+    """
+    if not created and instance.valeur_precedente('classification') != instance.classification:
+        Cotisation.objects.using(using)\
+            .filter(pk__in=AffectationNonLibere.objects.filter(cas=instance).values('cotisation_id'))\
+            .recalcule_soldes()
+
+
+def actualise_statistiques(sender, instance, using, **kwargs):
+    """
+    Après l'enregistrement ou la suppression d'un cas ou d'une cotisation,
+    actualise les statistiques des réunions concernées.
+    L'actualisation a lieu une fois, après la validation de la transaction, pour
+    toutes les réunions modifiées pendant la transaction : la réunion peut être
+    en cours de suppression (suppression en cascade de ses cas).
+    """
+    reunions = {instance.reunion_id, instance.valeur_precedente('reunion_id')} - {None}
+    a_la_validation(
+        "statistiques",
+        lambda reunions: StatistiquesReunion.actualise(sorted(reunions), using=using),
+        reunions,
+        using=using,
+    )
+
+
+def connecte_signaux():
+    """
+    Connecte les récepteurs (appelé au démarrage de l'application)
+    """
+    # Toute modification d'un de ces modèles rend obsolètes les données
+    # mises en cache qui en dépendent
+    for modele in (Communaute, ProvUser, Membre, Reunion, Cas, NatureBesoin, Cotisation, AffectationNonLibere):
+        post_save.connect(
+            invalide_modele_recepteur,
+            sender=modele,
+            dispatch_uid=f"cache_save_{modele.__name__}",
+        )
+        post_delete.connect(
+            invalide_modele_recepteur,
+            sender=modele,
+            dispatch_uid=f"cache_delete_{modele.__name__}",
+        )
+
+    # Valeurs remplacées par l'enregistrement
+    for modele in (Cas, Cotisation, AffectationNonLibere):
+        pre_save.connect(memorise_valeurs_precedentes, sender=modele, dispatch_uid=f"precedentes_{modele.__name__}")
+
+    # Soldes des cotisations non libérées
+    post_save.connect(recalcule_soldes_affectation, sender=AffectationNonLibere, dispatch_uid="soldes_affectation_save")
+    post_delete.connect(recalcule_soldes_affectation, sender=AffectationNonLibere, dispatch_uid="soldes_affectation_delete")
+    post_save.connect(recalcule_soldes_cas, sender=Cas, dispatch_uid="soldes_cas_save")
+
+    # Statistiques des réunions
+    for modele in (Cas, Cotisation):
+        post_save.connect(actualise_statistiques, sender=modele, dispatch_uid=f"statistiques_save_{modele.__name__}")
+        post_delete.connect(actualise_statistiques, sender=modele, dispatch_uid=f"statistiques_delete_{modele.__name__}")
+
+    # Vérification des connexions persistantes à la base de données
+    request_started.connect(verifie_connexions, dispatch_uid="verifie_connexions")
+    request_finished.connect(memorise_utilisation, dispatch_uid="memorise_utilisation")
+
+    # Structures de la recherche plein texte (SQLite)
+    post_migrate.connect(installe_recherche, dispatch_uid="installe_recherche")
@@ -0,0 +1,186 @@
+"""
+File de tâches en arrière-plan, conservée en base de données
+
+Les traitements longs (génération des cotisations d'une nouvelle réunion,
+recalcul des soldes et des statistiques) sont enregistrés comme tâches (modèle
+Tache) pendant la requête HTTP, puis exécutés par un ou plusieurs travailleurs
+(commande traite_taches, ligne worker du Procfile), sans courtier de messages :
+
+- une tâche planifiée avec une clé n'est pas dupliquée tant qu'une tâche de même
+  clé est en attente ou en cours ; une tâche de même clé terminée est replanifiée ;
+- chaque travailleur réserve la tâche suivante par une mise à jour conditionnelle,
+  en ignorant sous PostgreSQL les tâches verrouillées par les autres travailleurs
+  (SELECT ... FOR UPDATE SKIP LOCKED) ;
+- une tâche en échec est replanifiée avec un délai croissant jusqu'à son nombre
+  maximal de tentatives ; la tâche d'un travailleur arrêté est reprise à
+  l'expiration de son bail ;
+- la tâche enregistre elle-même sa progression (Tache.avance), affichée dans
+  l'administration.
+
+Si le réglage TACHES_ASYNCHRONES est faux (par défaut), les tâches sont exécutées
+immédiatement, dans la requête, sans être enregistrées.
+"""
+import json
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+
+# Fonctions exécutées par les tâches, par nom
+FONCTIONS = {}
+
+# Délai avant la deuxième tentative d'une tâche en échec (doublé à chaque tentative)
+DELAI_NOUVELLE_TENTATIVE = timedelta(seconds=30)
+
+# Durée au-delà de laquelle une tâche en cours est considérée comme abandonnée
+# par son travailleur (prolongée à chaque progression)
+DUREE_BAIL = timedelta(hours=1)
+
+
+def tache(nom):
+    """
+    Décorateur enregistrant une fonction exécutable en tâche sous le nom fourni.
+    La fonction reçoit la tâche (pour sa progression) et ses arguments nommés,
+    et retourne un résultat sérialisable en JSON.
+    """
+    def enregistre(fonction):
+        FONCTIONS[nom] = fonction
+        return fonction
+    return enregistre
+
+
+def asynchrone():
+    return getattr(settings, 'TACHES_ASYNCHRONES', False)
+
+
+def identifiant_travailleur():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def planifie(nom, cle=None, tentatives_max=3, using=DEFAULT_DB_ALIAS, **arguments):
+    """
+    Planifie l'exécution de la tâche nom avec les arguments fournis (sérialisables
+    en JSON) et la retourne. Une tâche de même clé en attente ou en cours est
+    retournée telle quelle. Hors mode asynchrone, la tâche est exécutée immédiatement.
+    """
+    if nom not in FONCTIONS:
+        raise ValueError(f"Tâche inconnue : {nom}")
+    Tache = apps.get_model('blog', 'Tache')
+    valeurs = {
+        'nom': nom,
+        'arguments': json.dumps(arguments, cls=DjangoJSONEncoder),
+        'tentatives_max': tentatives_max,
+    }
+
+    if not asynchrone():
+        tache = Tache(cle=cle, **valeurs)
+        tache.resultat = json.dumps(FONCTIONS[nom](tache, **tache.parametres), cls=DjangoJSONEncoder)
+        tache.etat, tache.progression = Tache.SUCCES, 100
+        return tache
+
+    taches = Tache.objects.using(using)
+    if cle is None:
+        return taches.create(**valeurs)
+    with transaction.atomic(using=using):
+        tache = taches.select_for_update().filter(cle=cle).first()
+        if tache is None:
+            try:
+                with transaction.atomic(using=using):
+                    return taches.create(cle=cle, **valeurs)
+            except IntegrityError:
+                # Tâche de même clé planifiée simultanément
+                return taches.get(cle=cle)
+        if tache.etat in (Tache.EN_ATTENTE, Tache.EN_COURS):
+            return tache
+        for champ, valeur in valeurs.items():
+            setattr(tache, champ, valeur)
+        tache.remet_en_attente()
+        tache.save(using=using)
+    return tache
+
+
+def reserve(travailleur, using=DEFAULT_DB_ALIAS):
+    """
+    Réserve pour le travailleur la prochaine tâche à exécuter (en attente et due,
+    ou en cours avec un bail expiré) et la retourne, ou None s'il n'y en a pas
+    """
+    Tache = apps.get_model('blog', 'Tache')
+    maintenant = timezone.now()
+    disponibles = Tache.objects.using(using).filter(
+        Q(etat=Tache.EN_ATTENTE, executer_apres__lte=maintenant)
+        | Q(etat=Tache.EN_COURS, fin_bail__lt=maintenant)
+    )
+    candidates = disponibles.order_by('executer_apres', 'pk').values_list('pk', flat=True)
+    verrou = connections[using].features.has_select_for_update_skip_locked
+
+    with transaction.atomic(using=using):
+        if verrou:
+            candidates = candidates.select_for_update(skip_locked=True)[:1]
+        else:
+            candidates = candidates[:10]
+        for pk in candidates:
+            # Mise à jour conditionnelle : sans verrou (SQLite), la tâche
+            # peut avoir été réservée entre-temps par un autre travailleur
+            reservee = disponibles.filter(pk=pk).update(
+                etat=Tache.EN_COURS,
+                travailleur=travailleur,
+                tentatives=F('tentatives') + 1,
+                debute_le=maintenant,
+                fin_bail=maintenant + DUREE_BAIL,
+            )
+            if reservee:
+                return Tache.objects.using(using).get(pk=pk)
+    return None
+
+
+def execute(tache, using=DEFAULT_DB_ALIAS):
+    """
+    Exécute une tâche réservée et enregistre son résultat, ou son échec :
+    nouvelle tentative différée tant que le nombre maximal n'est pas atteint.
+    Retourne True si la tâche a réussi.
+    """
+    Tache = apps.get_model('blog', 'Tache')
+    # Le résultat n'est pas enregistré si la tâche, dont le bail a expiré,
+    # a été reprise par un autre travailleur
+    taches = Tache.objects.using(using).filter(pk=tache.pk, travailleur=tache.travailleur)
+    try:
+        if tache.nom not in FONCTIONS:
+            raise ValueError(f"Tâche inconnue : {tache.nom}")
+        resultat = FONCTIONS[tache.nom](tache, **tache.parametres)
+    except Exception:
+        erreur = traceback.format_exc()
+        maintenant = timezone.now()
+        if tache.tentatives < tache.tentatives_max:
+            delai = DELAI_NOUVELLE_TENTATIVE * 2 ** (tache.tentatives - 1)
+            taches.update(etat=Tache.EN_ATTENTE, executer_apres=maintenant + delai, fin_bail=None, erreur=erreur)
+        else:
+            taches.update(etat=Tache.ECHEC, termine_le=maintenant, fin_bail=None, erreur=erreur)
+        return False
+
+    taches.update(
+        etat=Tache.SUCCES,
+        progression=100,
+        resultat=json.dumps(resultat, cls=DjangoJSONEncoder),
+        erreur="",
+        termine_le=timezone.now(),
+        fin_bail=None,
+    )
+    return True
+
+
+def traite_suivante(travailleur, using=DEFAULT_DB_ALIAS):
+    """
+    Réserve et exécute la prochaine tâche. Retourne la tâche, ou None s'il n'y en a pas.
+    """
+    tache = reserve(travailleur, using=using)
+    if tache is not None:
+        execute(tache, using=using)
+    return tache
@@ -1,3 +1,975 @@
-from django.test import TestCase
+import csv
+import io
+import locale
+import os
+import re
+import tempfile
+import zipfile
+from contextlib import contextmanager
+from datetime import date
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections
+from django.db.models import Sum
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+
+from .benchmark import (
+    ECHELLES,
+    genere_jeu,
+    mesure_pages,
+    charge_references,
+    regressions,
+)
+from .generateur import GenerateurDonnees
+from .admin import AffectationNonLibereInline, BeneficiaireAdmin, CasAdmin, ReunionInlineMixin
+from . import repartition, taches
+from .cache import choix_membres, choix_reunions, versions
+from .formatage import formatte_montant, formatte_nombre
+from .membres import importe_membres
+from .management.commands.bench_formatage import formatte_nombre_locale
+from .models import (
+    AffectationNonLibere, BilanReunion, Reunion, VueCotisationNonLiberee, Cas, Cotisation, Beneficiaire, NatureBesoin, Communaute, Membre, ProvUser, Tache, StatistiquesReunion,
+)
+from .pagination import PageCurseur
+from .rapports import contenu_rapport
+from .recherche import recherche, recherche_disponible
+from .referentiel import communautes, natures
+from .saisie import cree_cas
+from .sauvegarde import EcritureBase, exporte, importe, lit_objets, modeles, ouvre_fichier
+
+
+@contextmanager
+def validation_simulee(using='default'):
+    """
+    Exécute, en sortie de bloc, les traitements en attente de la validation de
+    la transaction (jamais validée dans un TestCase). Ceux planifiés avant le bloc
+    (setUpTestData) sont inclus : les traitements de même clé y sont regroupés.
+    """
+    connexion = connections[using]
+    yield
+    traitements = connexion.run_on_commit[:]
+    del connexion.run_on_commit[:]
+    for _, traitement in traitements:
+        traitement()
+
+
+class RegressionRequetesAdminTests(TestCase):
+    """
+    Le nombre de requêtes de chaque page d'administration ne doit pas dépasser
+    la référence enregistrée (commande bench_admin --echelle test --enregistrer)
+    """
+    echelle = 'test'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = genere_jeu(**ECHELLES[cls.echelle])
+
+    def test_nombre_requetes_pages(self):
+        references = charge_references().get(self.echelle)
+        self.assertTrue(references, f"Aucune référence pour l'échelle {self.echelle}")
+
+        mesures = mesure_pages(self.admin)
+        self.assertEqual(regressions(mesures, references), [])
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class PageReunionTests(TestCase):
+    """
+    Les champs et les formsets de la page d'une réunion se comportent comme
+    ceux d'un ModelForm ordinaire malgré le partage des choix et des lignes
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = genere_jeu(**ECHELLES['test'])
+        cls.reunion = Reunion.objects.order_by('-date_reunion').first()
+        ProvUser.objects.create(username="dons-test", last_name="Dons", personne_physique=False)
+
+    def requete(self):
+        requete = RequestFactory().get(f"/admin/blog/reunion/{self.reunion.pk}/change/")
+        requete.user = self.admin
+        return requete
+
+    def donnees_page(self, reponse):
+        """
+        Données POST de la page de modification, reprenant les valeurs affichées
+        du formulaire principal et de tous les formsets
+        """
+        formulaires = [reponse.context['adminform'].form]
+        for inline in reponse.context['inline_admin_formsets']:
+            formulaires += [inline.formset.management_form] + list(inline.formset.forms)
+        donnees = {}
+        for formulaire in formulaires:
+            for nom in formulaire.fields:
+                valeur = formulaire[nom].value()
+                if valeur is None or valeur is False:
+                    continue
+                if valeur is True:
+                    valeur = 'on'
+                elif isinstance(valeur, (list, tuple)):
+                    valeur = [str(v) for v in valeur]
+                donnees[formulaire.add_prefix(nom)] = valeur
+        return donnees
+
+    def test_enregistrement_page(self):
+        # Cotisations (deux inlines partageant les mêmes objets) et affectations modifiées
+        self.client.force_login(self.admin)
+        url = f"/admin/blog/reunion/{self.reunion.pk}/change/"
+        donnees = self.donnees_page(self.client.get(url))
+        cotisations = list(Cotisation.objects.filter(reunion=self.reunion).order_by('pk'))
+        affectation = self.reunion.affectations.order_by('pk').first()
+        prefixes = {
+            cle[:-len('-id')]: valeur for cle, valeur in donnees.items()
+            if cle.endswith('-id') and cle.startswith(('cotisations-', 'affectations-'))
+        }
+        modifiees = {}
+        for prefixe, pk in prefixes.items():
+            if prefixe.startswith('cotisations-') and int(pk) in (cotisations[0].pk, cotisations[1].pk):
+                donnees[f'{prefixe}-montant_social'] = int(donnees[f'{prefixe}-montant_social']) + 500
+                modifiees[int(pk)] = donnees[f'{prefixe}-montant_social']
+            elif prefixe.startswith('affectations-') and int(pk) == affectation.pk:
+                somme = donnees[f'{prefixe}-somme'] = affectation.somme + 100
+        self.assertEqual(len(modifiees), 2)
+
+        with mock.patch.object(Cotisation, 'save', autospec=True, side_effect=Cotisation.save) as enregistrement:
+            reponse = self.client.post(url, donnees)
+        self.assertEqual(reponse.status_code, 302, reponse.context and reponse.context['errors'])
+
+        # Chaque cotisation modifiée est enregistrée une fois, les autres ne le sont pas
+        enregistrees = [appel.args[0].pk for appel in enregistrement.call_args_list]
+        self.assertEqual(sorted(enregistrees), sorted(modifiees))
+        for pk, montant in modifiees.items():
+            self.assertEqual(Cotisation.objects.get(pk=pk).montant_social, montant)
+        affectation.refresh_from_db()
+        self.assertEqual(affectation.somme, somme)
+        self.assertFalse(Cotisation.objects.filter(reunion=self.reunion).soldes_errones().exists())
+
+    def test_choix_limites(self):
+        # Le collecteur est choisi par autocomplétion, parmi les personnes physiques (limit_choices_to)
+        inline = AffectationNonLibereInline(Reunion, admin.site)
+        formset = inline.get_formset(self.requete(), self.reunion)(instance=self.reunion)
+        champ = formset.forms[0].fields['collecteur']
+        self.assertIsInstance(champ.widget.widget, AutocompleteSelect)
+        self.assertEqual(
+            sorted(champ.queryset.values_list('pk', flat=True)),
+            sorted(ProvUser.objects.filter(personne_physique=True).values_list('pk', flat=True)),
+        )
+
+    def test_page_sans_listes_de_membres(self):
+        # Ni soumis_par, ni le collecteur, ni la cotisation des affectations
+        # ne listent tous les membres à chaque ligne
+        self.client.force_login(self.admin)
+        contenu = self.client.get(f"/admin/blog/reunion/{self.reunion.pk}/change/").content.decode()
+        self.assertNotRegex(contenu, r'name="[^"]*-soumis_par"')
+        affectations = list(self.reunion.affectations.select_related('collecteur', 'cotisation__membre').order_by('pk'))
+        for champ, objet in (('collecteur', 'collecteur'), ('cotisation', 'cotisation')):
+            selects = re.findall(rf'<select name="affectations-\d+-{champ}".*?</select>', contenu, re.S)
+            self.assertEqual(len(selects), len(affectations))
+            for affectation, select in zip(affectations, selects):
+                # Seule l'option de l'objet choisi, avec son libellé
+                choisi = getattr(affectation, objet)
+                libelle = choisi.membre if champ == 'cotisation' else choisi
+                self.assertEqual(select.count('<option'), 1)
+                self.assertIn(f'<option value="{choisi.pk}" selected>{libelle}</option>', select)
+
+    def test_autocompletion_cotisations(self):
+        # Cotisations non libérées de la réunion, filtrées sur le nom du membre
+        self.client.force_login(self.admin)
+        url = reverse('admin:blog_reunion_cotisations', args=[self.reunion.pk])
+        non_liberees = Cotisation.objects.filter(reunion=self.reunion).non_liberees().select_related('membre')
+        reponse = self.client.get(url).json()
+        self.assertEqual(sorted(int(r['id']) for r in reponse['results']), sorted(c.pk for c in non_liberees))
+        self.assertFalse(reponse['pagination']['more'])
+        cotisation = non_liberees.first()
+        resultats = self.client.get(url, {'term': cotisation.membre.last_name}).json()['results']
+        self.assertIn({'id': str(cotisation.pk), 'text': str(cotisation.membre)}, resultats)
+        self.assertTrue(all(
+            non_liberees.filter(pk=r['id'], membre__last_name=cotisation.membre.last_name).exists() for r in resultats
+        ))
+
+    def test_inline_hors_plan(self):
+        # Un inline sans lignes dans le plan de la page lit ses objets par sa propre requête
+        class CotisationsInline(ReunionInlineMixin, admin.TabularInline):
+            model = Cotisation
+
+        formset = CotisationsInline(Reunion, admin.site).get_formset(self.requete(), self.reunion)
+        self.assertCountEqual(
+            formset(instance=self.reunion).get_queryset(),
+            Cotisation.objects.filter(reunion=self.reunion),
+        )
+
+
+class BilanReunionTests(TestCase):
+    """
+    Le bilan d'une réunion, obtenu par une requête d'agrégation, donne les mêmes
+    montants que le calcul précédent, par une requête par montant
+    """
+    @classmethod
+    def setUpTestData(cls):
+        GenerateurDonnees(EcritureBase()).genere(
+            membres=10, reunions=4, beneficiaires=20, cas_par_reunion=12, affectations_par_reunion=0,
+            taux_urgence=0.3,
+        )
+
+    def montants_separes(self, reunion):
+        def somme(queryset, champ):
+            return queryset.aggregate(total=Sum(champ))['total']
+
+        montants = {'nb_cas': reunion.cas_reunion.count()}
+        for classification, suffixe in (('S', 'social'), ('M', 'mission')):
+            cas = reunion.cas_reunion.filter(classification=classification)
+            montants[f'sollicite_{suffixe}'] = somme(cas, 'montant_sollicite')
+            montants[f'urgence_{suffixe}'] = somme(cas.filter(urgence=True), 'montant_sollicite') or 0
+            montants[f'alloue_{suffixe}'] = somme(cas.filter(urgence=False), 'montant_alloue') or 0
+            montants[f'cotisations_{suffixe}'] = somme(reunion.cotisations.all(), f'montant_{suffixe}') or 0
+            montants[f'disponible_{suffixe}'] = \
+                montants[f'cotisations_{suffixe}'] - montants[f'urgence_{suffixe}'] - montants[f'alloue_{suffixe}']
+        return montants
+
+    def test_montants(self):
+        for reunion in Reunion.objects.all():
+            bilan = BilanReunion.calcule(reunion)
+            for champ, valeur in self.montants_separes(reunion).items():
+                with self.subTest(reunion=reunion.pk, champ=champ):
+                    self.assertEqual(getattr(bilan, champ) or 0, valeur or 0)
+
+    def test_reunions_en_une_requete(self):
+        with self.assertNumQueries(1):
+            montants = {m['pk']: m for m in BilanReunion.agrege_reunions(Reunion.objects.all())}
+        self.assertEqual(set(montants), set(Reunion.objects.values_list('pk', flat=True)))
+        for pk, montants_reunion in montants.items():
+            self.assertEqual(montants_reunion['nb_cas'], Cas.objects.filter(reunion_id=pk).count())
+
+
+class GenerationCotisationsTests(TestCase):
+    """
+    La génération des cotisations d'une réunion crée une cotisation par membre
+    cotisant, et peut être relancée sans créer de doublons
+    """
+    def test_idempotence(self):
+        hote = Membre.objects.filter(personne_physique=True).first()
+        # Génération à la création de la réunion (tâche exécutée immédiatement)
+        reunion = Reunion.objects.create(membre_hote=hote, date_reunion=date(2030, 1, 15))
+        cotisants = Membre.objects.filter(peut_cotiser=True).count()
+        self.assertGreater(cotisants, 0)
+        self.assertEqual(reunion.cotisations.count(), cotisants)
+
+        self.assertEqual(reunion.generer_cotisations(), 0)
+        self.assertEqual(reunion.cotisations.count(), cotisants)
+        self.assertEqual(reunion.cotisations.values('membre_id').distinct().count(), cotisants)
+
+        # Seuls les nouveaux membres cotisants reçoivent une cotisation
+        Membre.objects.create(username="nouveau", last_name="Nouveau", peut_cotiser=True, cotisation_social=2000)
+        self.assertEqual(reunion.generer_cotisations(), 1)
+        self.assertEqual(reunion.cotisations.count(), cotisants + 1)
+        self.assertEqual(reunion.statistiques.cotisations_social, sum(
+            reunion.cotisations.values_list('montant_social', flat=True)
+        ))
+
+
+class CotisationsNonLibereesTests(TestCase):
+    """
+    La requête portable des cotisations non libérées donne les mêmes restes à
+    affecter qu'un calcul à partir des affectations (et que la vue PostgreSQL)
+    """
+    @classmethod
+    def setUpTestData(cls):
+        GenerateurDonnees(EcritureBase()).genere(
+            membres=12, reunions=2, beneficiaires=10, cas_par_reunion=6, affectations_par_reunion=15,
+            taux_liberation=0.5,
+        )
+
+    def restes_attendus(self):
+        affecte = {}
+        for cotisation, classification, somme in AffectationNonLibere.objects\
+                .values_list('cotisation_id', 'cas__classification', 'somme'):
+            affecte[(cotisation, classification)] = affecte.get((cotisation, classification), 0) + somme
+        return {
+            cotisation.pk: (
+                (0 if cotisation.social_libere else cotisation.montant_social) - affecte.get((cotisation.pk, 'S'), 0),
+                (0 if cotisation.mission_libere else cotisation.montant_mission) - affecte.get((cotisation.pk, 'M'), 0),
+            )
+            for cotisation in Cotisation.objects.all()
+            if not (cotisation.social_libere and cotisation.mission_libere)
+        }
+
+    def test_requete_orm(self):
+        attendus = self.restes_attendus()
+        self.assertTrue(attendus)
+        restes = Cotisation.objects.non_liberees().avec_restes()\
+            .values_list('pk', 'reste_cotis_social', 'reste_cotis_mission')
+        self.assertEqual({pk: (social, mission) for pk, social, mission in restes}, attendus)
+
+    @skipUnless(connection.vendor == 'postgresql', "Vue propre à PostgreSQL")
+    def test_vue(self):
+        restes = VueCotisationNonLiberee.objects.values_list('pk', 'reste_cotis_social', 'reste_cotis_mission')
+        self.assertEqual({pk: (social, mission) for pk, social, mission in restes}, self.restes_attendus())
+
+
+class SoldesCotisationsTests(TestCase):
+    """
+    Les soldes enregistrés des cotisations suivent la création, la modification
+    et la suppression des affectations, et la classification des cas affectés
+    """
+    @classmethod
+    def setUpTestData(cls):
+        GenerateurDonnees(EcritureBase()).genere(
+            membres=10, reunions=1, beneficiaires=10, cas_par_reunion=6, affectations_par_reunion=0,
+            taux_liberation=0,
+        )
+        cls.reunion = Reunion.objects.get()
+        cls.cotisation, cls.autre = Cotisation.objects.filter(reunion=cls.reunion, montant_social__gt=0)[:2]
+        cls.cas = Cas.objects.filter(reunion=cls.reunion).first()
+        Cas.objects.filter(pk=cls.cas.pk).update(classification='S')
+        cls.collecteur = ProvUser.objects.filter(personne_physique=True).first()
+
+    def assertSoldes(self, cotisation, social, mission):
+        cotisation.refresh_from_db()
+        self.assertEqual((cotisation.solde_social, cotisation.solde_mission), (social, mission))
+        self.assertFalse(Cotisation.objects.filter(reunion=self.reunion).soldes_errones().exists())
+
+    def test_affectations(self):
+        social, mission = self.cotisation.montant_social, self.cotisation.montant_mission
+        affectation = AffectationNonLibere.objects.create(
+            reunion=self.reunion, cotisation=self.cotisation, collecteur=self.collecteur, somme=1000, cas=self.cas,
+        )
+        self.assertSoldes(self.cotisation, social - 1000, mission)
+
+        affectation.somme = 1500
+        affectation.save()
+        self.assertSoldes(self.cotisation, social - 1500, mission)
+
+        # Changement de cotisation : les deux cotisations sont recalculées
+        affectation.cotisation = self.autre
+        affectation.save()
+        self.assertSoldes(self.cotisation, social, mission)
+        self.assertSoldes(self.autre, self.autre.montant_social - 1500, self.autre.montant_mission)
+
+        # Changement de classification du cas : la somme passe sur le solde mission
+        cas = Cas.objects.get(pk=self.cas.pk)
+        cas.classification = 'M'
+        cas.save()
+        self.assertSoldes(self.autre, self.autre.montant_social, self.autre.montant_mission - 1500)
+
+        affectation.delete()
+        self.assertSoldes(self.autre, self.autre.montant_social, self.autre.montant_mission)
+
+    def test_cotisation_chargee_avant_affectation(self):
+        # Montants inchangés : l'enregistrement ne réécrit pas les soldes périmés de l'objet
+        cotisation = Cotisation.objects.get(pk=self.cotisation.pk)
+        AffectationNonLibere.objects.create(
+            reunion=self.reunion, cotisation=cotisation, collecteur=self.collecteur, somme=1000, cas=self.cas,
+        )
+        cotisation.membre = self.collecteur
+        cotisation.save()
+        self.assertSoldes(cotisation, cotisation.montant_social - 1000, cotisation.montant_mission)
+
+    def test_liberation(self):
+        cotisation = Cotisation.objects.get(pk=self.cotisation.pk)
+        cotisation.social_libere = True
+        cotisation.save()
+        self.assertSoldes(cotisation, 0, cotisation.montant_mission)
+
+
+class CacheTests(TestCase):
+    """
+    Les données en cache sont relues sans requête, puis recalculées après
+    la modification (validée) des modèles dont elles dépendent
+    """
+    @classmethod
+    def setUpTestData(cls):
+        GenerateurDonnees(EcritureBase()).genere(
+            membres=5, reunions=2, beneficiaires=10, cas_par_reunion=3, affectations_par_reunion=0,
+        )
+        cls.reunion = Reunion.objects.order_by('pk').first()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_bilan(self):
+        bilan = BilanReunion.calcule(self.reunion)
+        with self.assertNumQueries(0):
+            self.assertEqual(BilanReunion.calcule(self.reunion).nb_cas, bilan.nb_cas)
+
+        cas = Cas.objects.filter(reunion=self.reunion).first()
+        with validation_simulee():
+            cas.montant_sollicite += 1000
+            cas.save()
+            # Modification non validée : bilan inchangé
+            self.assertEqual(BilanReunion.calcule(self.reunion).nb_cas, bilan.nb_cas)
+        sollicite = bilan.sollicite_social if cas.classification == 'S' else bilan.sollicite_mission
+        nouveau = BilanReunion.calcule(self.reunion)
+        self.assertEqual(
+            nouveau.sollicite_social if cas.classification == 'S' else nouveau.sollicite_mission,
+            sollicite + 1000,
+        )
+
+    def test_suppression(self):
+        BilanReunion.calcule(self.reunion)
+        with validation_simulee():
+            Cas.objects.filter(reunion=self.reunion).first().delete()
+        self.assertEqual(
+            BilanReunion.calcule(self.reunion).nb_cas, Cas.objects.filter(reunion=self.reunion).count(),
+        )
+
+    def test_listes_de_choix(self):
+        choix_reunions(), choix_membres()
+        with validation_simulee():
+            membre = Membre.objects.create(username="cache", first_name="Ama", last_name="Cache")
+            reunion = Reunion.objects.create(membre_hote=membre, date_reunion=date(2031, 3, 1))
+        self.assertIn((membre.pk, "Ama Cache"), choix_membres())
+        self.assertEqual(choix_reunions()[0][0], str(reunion.pk))
+
+
+class StatistiquesReunionTests(TestCase):
+    """
+    Les statistiques d'une réunion sont actualisées une fois par transaction,
+    sans relire les objets modifiés, et leur actualisation peut être répétée
+    """
+    @classmethod
+    def setUpTestData(cls):
+        genere_jeu(**ECHELLES['test'])
+        cls.reunion = Reunion.objects.order_by('-date_reunion').first()
+
+    def test_actualisation_groupee(self):
+        cotisations = list(Cotisation.objects.filter(reunion=self.reunion)[:3])
+        with mock.patch.object(StatistiquesReunion, 'actualise', wraps=StatistiquesReunion.actualise) as actualise:
+            with validation_simulee():
+                for cotisation in cotisations:
+                    cotisation.montant_social += 1000
+                    cotisation.save()
+        actualise.assert_called_once_with([self.reunion.pk], using='default')
+        self.assertEqual(
+            StatistiquesReunion.objects.get(reunion=self.reunion).cotisations_social,
+            sum(Cotisation.objects.filter(reunion=self.reunion).values_list('montant_social', flat=True)),
+        )
+
+    def test_sans_relecture(self):
+        # Cas chargé depuis la base : ni relecture avant l'enregistrement,
+        # ni recalcul des soldes si sa classification est inchangée
+        cas = Cas.objects.filter(reunion=self.reunion).first()
+        cas.montant_alloue = 0
+        with self.assertNumQueries(1):
+            cas.save(update_fields=['montant_alloue'])
+
+    def test_actualisation_repetee(self):
+        nombre = StatistiquesReunion.objects.count()
+        self.assertEqual(StatistiquesReunion.actualise(), Reunion.objects.count())
+        self.assertEqual(StatistiquesReunion.actualise(), Reunion.objects.count())
+        self.assertEqual(StatistiquesReunion.objects.count(), nombre)
+
+
+class FormatageTests(TestCase):
+    """
+    Les montants sont formatés comme par le module locale avec la locale fr_FR
+    """
+    valeurs = [
+        None, 0, 7, 999, 1000, -1500, 20000, 1234567, -98765432,
+        1.0, 2.5, 1234.5, 1234567.5, Decimal('1500'), Decimal('1234.50'),
+    ]
+
+    def test_valeurs_attendues(self):
+        self.assertEqual(formatte_montant(1234567), "1\u202f234\u202f567")
+        self.assertEqual(formatte_montant(-1500), "-1\u202f500")
+        self.assertEqual(formatte_montant(1234.5), "1\u202f234,5")
+        # 1 et 1.0 ne partagent pas une entrée du cache
+        self.assertEqual(formatte_montant(1), "1")
+        self.assertEqual(formatte_montant(1.0), "1")
+        self.assertEqual(formatte_montant(Decimal('1234.50')), "1\u202f234,50")
+        self.assertIn(">-</div>", formatte_nombre(None))
+
+    def test_identique_module_locale(self):
+        precedente = locale.setlocale(locale.LC_NUMERIC)
+        try:
+            locale.setlocale(locale.LC_NUMERIC, 'fr_FR.UTF-8')
+        except locale.Error:
+            self.skipTest("Locale fr_FR.UTF-8 indisponible")
+        try:
+            for valeur in self.valeurs:
+                with self.subTest(valeur=valeur):
+                    self.assertEqual(
+                        formatte_nombre(valeur, 'green', gras=True),
+                        formatte_nombre_locale(valeur, 'green', gras=True),
+                    )
+        finally:
+            locale.setlocale(locale.LC_NUMERIC, precedente)
+
+
+class RepartitionTests(TestCase):
+    """
+    Le moteur de répartition sert les urgences, répartit le reste au prorata en
+    parts entières de somme exacte, et donne les mêmes montants que le bilan des réunions
+    """
+    def test_plus_forts_restes(self):
+        self.assertEqual(repartition.parts_entieres([1, 1, 1], 10), [4, 3, 3])
+        self.assertEqual(repartition.parts_entieres([1, 2, 3], 100), [17, 33, 50])
+        self.assertEqual(sum(repartition.parts_entieres([7, 11, 13, 17], 1001)), 1001)
+
+    def test_totaux_nuls(self):
+        self.assertEqual(repartition.parts_entieres([0, 0], 100), [0, 0])
+        self.assertEqual(repartition.parts_entieres([5, 5], 0), [0, 0])
+        self.assertEqual(repartition.parts_entieres([5, 5], -10), [0, 0])
+        resultat = repartition.repartit([0, None], [False, False], 100)
+        self.assertEqual((resultat.estimes, resultat.parts, resultat.reliquat), ([0, 0], [0, 0], 100))
+        resultat = repartition.repartit([], [], None)
+        self.assertEqual((resultat.estimes, resultat.parts, resultat.reliquat), ([], [], 0))
+
+    def test_urgences(self):
+        # L'urgence reçoit le montant sollicité, le reste est réparti au prorata
+        resultat = repartition.repartit([100, 200, 300], [True, False, False], 350, alloues=[0, 90, 120])
+        self.assertEqual(resultat.urgence, 100)
+        self.assertEqual(resultat.disponible, 250)
+        self.assertEqual(resultat.estimes, [100, 100, 150])
+        self.assertEqual(resultat.parts, [100, 100, 150])
+        self.assertEqual(resultat.reliquat, 350 - 100 - 90 - 120)
+        # Urgences supérieures aux cotisations : rien à répartir
+        resultat = repartition.repartit([500, 200], [True, False], 300)
+        self.assertEqual(resultat.parts, [500, 0])
+        self.assertEqual(resultat.reliquat, -200)
+
+    def test_identique_bilan(self):
+        GenerateurDonnees(EcritureBase()).genere(
+            membres=10, reunions=4, beneficiaires=20, cas_par_reunion=8, affectations_par_reunion=0,
+        )
+        repartitions = repartition.repartitions_reunions(Reunion.objects.all())
+        for reunion in Reunion.objects.all():
+            bilan = BilanReunion.calcule(reunion)
+            for classification, disponible in (('S', bilan.disponible_social), ('M', bilan.disponible_mission)):
+                resultat = repartitions[(reunion.pk, classification)]
+                self.assertEqual(resultat.reliquat, disponible)
+                cas = reunion.cas_reunion.filter(classification=classification).order_by('pk')
+                self.assertEqual(
+                    resultat.estimes,
+                    [bilan.montant_estime(classification, c.montant_sollicite or 0, c.urgence) for c in cas],
+                )
+
+
+class GenerationDonneesTests(TestCase):
+    """
+    La commande genere_donnees produit les nombres d'objets demandés,
+    avec des soldes et des statistiques cohérents
+    """
+    def test_nombres(self):
+        membres, beneficiaires = ProvUser.objects.count(), Beneficiaire.objects.count()
+        call_command(
+            'genere_donnees', membres=8, reunions=3, beneficiaires=12, cas_par_reunion=5,
+            affectations_par_reunion=4, taux_liberation=0, stdout=io.StringIO(),
+        )
+        self.assertEqual(ProvUser.objects.count(), membres + 8)
+        self.assertEqual(Beneficiaire.objects.count(), beneficiaires + 12)
+        self.assertEqual(Reunion.objects.count(), 3)
+        self.assertEqual(Cas.objects.count(), 3 * 5)
+        self.assertEqual(AffectationNonLibere.objects.count(), 3 * 4)
+        cotisants = ProvUser.objects.filter(username__startswith="membre", peut_cotiser=True).count()
+        self.assertEqual(Cotisation.objects.count(), 3 * cotisants)
+        self.assertTrue(Reunion.liste_presence.through.objects.exists())
+        self.assertEqual(StatistiquesReunion.objects.count(), 3)
+        self.assertFalse(Cotisation.objects.soldes_errones().exists())
+        # Mots de passe inutilisables distincts
+        generes = ProvUser.objects.filter(username__startswith="membre")
+        self.assertEqual(generes.values('password').distinct().count(), 8)
+
+
+class SauvegardeTests(TestCase):
+    """
+    Une sauvegarde NDJSON restaurée dans une base vide redonne les mêmes données
+    """
+    @classmethod
+    def setUpTestData(cls):
+        GenerateurDonnees(EcritureBase()).genere(
+            membres=6, reunions=2, beneficiaires=8, cas_par_reunion=4, affectations_par_reunion=3,
+        )
+
+    def empreinte(self):
+        # Les dates et heures sont sauvegardées à la milliseconde près
+        empreinte = {}
+        for modele in modeles():
+            champs = [
+                champ.attname for champ in modele._meta.concrete_fields
+                if champ.get_internal_type() != 'DateTimeField'
+            ]
+            empreinte[modele._meta.label_lower] = list(modele.objects.order_by('pk').values_list(*champs))
+        return empreinte
+
+    def test_aller_retour(self):
+        avant = self.empreinte()
+        with tempfile.TemporaryDirectory() as dossier:
+            chemin = os.path.join(dossier, "sauvegarde.ndjson.gz")
+            nombres = exporte(chemin, taille_lot=5)
+            with ouvre_fichier(chemin, 'r') as fichier:
+                self.assertEqual(sum(1 for _ in lit_objets(fichier, taille_bloc=64)), sum(nombres.values()))
+
+            for modele in reversed(modeles()):
+                modele.objects.all().delete()
+            importes, ignores = importe(chemin, taille_lot=5)
+
+        self.assertEqual(ignores, 0)
+        self.assertEqual(importes, nombres)
+        self.assertEqual(self.empreinte(), avant)
+
+    def test_lecture_tableau(self):
+        # Format dumpdata : tableau JSON lu par petits blocs
+        contenu = '[\n  {"model": "blog.communaute", "pk": 1, "fields": {"nom": "A, [B]"}},\n  {"pk": 2}\n]\n'
+        self.assertEqual(
+            list(lit_objets(io.StringIO(contenu), taille_bloc=7)),
+            [{"model": "blog.communaute", "pk": 1, "fields": {"nom": "A, [B]"}}, {"pk": 2}],
+        )
+
+
+class ImportMembresTests(TestCase):
+    """
+    L'import en masse crée les membres décrits, rattachés à leur communauté
+    """
+    def donnees(self, nombre):
+        return [
+            {
+                "username": f"import{i}", "prenoms": "Awa", "nom": f"Import {i}", "email": "",
+                "superuser": False, "sexe": "F", "tel1": "", "tel2": "", "adresse": "",
+                "communaute": Communaute.objects.first().nom, "eglise_locale": "", "activite": "",
+                "profession": "", "montant_social": 5000, "montant_mission": 5000,
+                "personne": True, "cotisation": True,
+            }
+            for i in range(nombre)
+        ]
+
+    def test_mots_de_passe_inutilisables(self):
+        # Sans mot de passe : un mot de passe inutilisable distinct par membre
+        self.assertEqual(importe_membres(self.donnees(3), ProvUser, Communaute), (3, 0))
+        membres = ProvUser.objects.filter(username__startswith="import")
+        self.assertFalse(any(membre.has_usable_password() for membre in membres))
+        self.assertEqual(len({membre.password for membre in membres}), 3)
+        self.assertEqual({membre.communaute_id for membre in membres}, {Communaute.objects.first().pk})
+
+    def test_membres_existants_ignores(self):
+        importe_membres(self.donnees(2), ProvUser, Communaute, mot_de_passe="secret")
+        self.assertEqual(importe_membres(self.donnees(3), ProvUser, Communaute, mot_de_passe="secret"), (1, 2))
+        self.assertTrue(ProvUser.objects.get(username="import2").check_password("secret"))
+
+    def test_identifiants_en_double(self):
+        # Un identifiant répété, dans un lot ou d'un lot à l'autre, n'est créé qu'une fois
+        donnees = self.donnees(3)
+        donnees += [donnees[0], donnees[2]]
+        self.assertEqual(importe_membres(donnees, ProvUser, Communaute, taille_lot=2), (3, 2))
+        self.assertEqual(ProvUser.objects.filter(username__startswith="import").count(), 3)
+
+    def test_import_atomique(self):
+        # Une erreur dans un lot annule les lots précédents
+        donnees = self.donnees(3)
+        donnees[2]["username"] = None
+        with self.assertRaises(IntegrityError):
+            importe_membres(donnees, ProvUser, Communaute, taille_lot=2)
+        self.assertFalse(ProvUser.objects.filter(username__startswith="import").exists())
+
+
+@skipUnless(connection.vendor == 'postgresql', "Plans d'exécution propres à PostgreSQL")
+class PlansExecutionTests(TestCase):
+    """
+    À partir de 100 000 lignes, les requêtes des inlines de la réunion et le calcul
+    des restes à affecter utilisent les index composites et partiels
+    (migration 0006) plutôt qu'un parcours séquentiel des tables
+    """
+    @classmethod
+    def setUpTestData(cls):
+        # Environ 100 000 cotisations, 100 000 cas et 40 000 affectations
+        GenerateurDonnees(EcritureBase(), taille_lot=5000).genere(
+            membres=600,
+            reunions=200,
+            beneficiaires=1000,
+            cas_par_reunion=500,
+            affectations_par_reunion=200,
+        )
+        with connection.cursor() as curseur:
+            curseur.execute("ANALYZE")
+        cls.reunion = Reunion.objects.order_by('pk').last()
+
+    def assertIndexUtilise(self, queryset, index, table):
+        plan = queryset.explain()
+        self.assertIn(index, plan)
+        self.assertNotIn(f"Seq Scan on {table}", plan)
+
+    def test_cas_par_classification(self):
+        # Inlines des cas sociaux et des cas mission
+        cas = Cas.objects.filter(reunion=self.reunion, classification='S').order_by('-urgence')
+        self.assertIndexUtilise(cas, 'cas_reunion_classif_idx', 'blog_cas')
+
+    def test_cotisations_reunion(self):
+        cotisations = Cotisation.objects.filter(reunion=self.reunion)
+        self.assertIndexUtilise(cotisations, 'cotis_reunion_liberation_idx', 'blog_cotisation')
+
+    def test_cotisations_non_liberees(self):
+        # Inline des cotisations non libérées et choix des cotisations des affectations
+        cotisations = Cotisation.objects.filter(reunion=self.reunion).non_liberees()
+        self.assertIndexUtilise(cotisations, 'cotis_non_liberee_idx', 'blog_cotisation')
+
+    def test_restes_a_affecter(self):
+        cotisations = Cotisation.objects.filter(reunion=self.reunion).non_liberees().avec_restes()
+        self.assertIndexUtilise(cotisations, 'affect_cotisation_cas_idx', 'blog_affectationnonlibere')
+
+
+class SaisieCasTests(TestCase):
+    """
+    La saisie en masse des cas équivaut à leur création un par un,
+    en un nombre de requêtes indépendant du nombre de cas
+    """
+    @classmethod
+    def setUpTestData(cls):
+        GenerateurDonnees(EcritureBase()).genere(
+            membres=5, reunions=1, beneficiaires=30, cas_par_reunion=0, affectations_par_reunion=0,
+        )
+        cls.reunion = Reunion.objects.get()
+        cls.natures = list(NatureBesoin.objects.values_list('pk', flat=True)[:2])
+
+    def donnees(self, beneficiaires):
+        return [
+            {"beneficiaire": pk, "urgence": pk % 2 == 0, "montant_sollicite": 1000 * pk,
+             "montant_alloue": 500, "nature": self.natures}
+            for pk in beneficiaires
+        ]
+
+    def test_creation(self):
+        beneficiaires = list(Beneficiaire.objects.order_by('pk').values_list('pk', flat=True))
+        crees, ignores = cree_cas(self.donnees(beneficiaires[:20]), self.reunion)
+        self.assertEqual((len(crees), ignores), (20, 0))
+
+        for cas in Cas.objects.filter(reunion=self.reunion).select_related('beneficiaire'):
+            beneficiaire = cas.beneficiaire
+            self.assertEqual(
+                [getattr(cas, attribut) for attribut in Cas.ATTRIBUTS_BENEFICIAIRE],
+                [getattr(beneficiaire, attribut) for attribut in Cas.ATTRIBUTS_BENEFICIAIRE],
+            )
+            self.assertEqual(cas.montant_alloue, cas.montant_sollicite if cas.urgence else 500)
+            self.assertEqual(sorted(cas.nature.values_list('pk', flat=True)), sorted(self.natures))
+
+        # Les bénéficiaires ayant déjà un cas sont ignorés. Le nombre de requêtes
+        # ne dépend pas du nombre de cas (deux requêtes par cas auparavant).
+        with CaptureQueriesContext(connection) as requetes:
+            crees, ignores = cree_cas(self.donnees(beneficiaires), self.reunion)
+        self.assertEqual((len(crees), ignores), (10, 20))
+        self.assertLess(len(requetes), 10)
+
+    def test_beneficiaire_inexistant(self):
+        with self.assertRaises(ValueError):
+            cree_cas([{"beneficiaire": 0}], self.reunion)
+        self.assertFalse(Cas.objects.exists())
+
+
+@override_settings(TACHES_ASYNCHRONES=True)
+class TachesTests(TestCase):
+    """
+    Les traitements longs sont planifiés une seule fois par clé, puis exécutés
+    par un travailleur, avec de nouvelles tentatives en cas d'échec
+    """
+    @classmethod
+    def setUpTestData(cls):
+        GenerateurDonnees(EcritureBase()).genere(
+            membres=5, reunions=0, beneficiaires=0, cas_par_reunion=0, affectations_par_reunion=0,
+        )
+        cls.hote = Membre.objects.first()
+
+    def test_generation_cotisations(self):
+        reunion = Reunion.objects.create(membre_hote=self.hote, date_reunion=date(2021, 1, 1))
+        self.assertFalse(reunion.cotisations.exists())
+        tache = Tache.objects.get(cle=f"generer_cotisations:{reunion.pk}")
+        self.assertEqual(taches.planifie('generer_cotisations', cle=tache.cle, reunion=reunion.pk), tache)
+
+        self.assertEqual(taches.traite_suivante("test"), tache)
+        tache.refresh_from_db()
+        self.assertEqual((tache.etat, tache.progression, tache.tentatives), (Tache.SUCCES, 100, 1))
+        self.assertEqual(reunion.cotisations.count(), Membre.objects.filter(peut_cotiser=True).count())
+        self.assertIsNone(taches.traite_suivante("test"))
+
+    def test_nouvelles_tentatives(self):
+        fonction = mock.Mock(side_effect=RuntimeError("indisponible"))
+        with mock.patch.dict(taches.FONCTIONS, {'essai': fonction}):
+            tache = taches.planifie('essai', cle="essai", tentatives_max=2, valeur=1)
+            taches.traite_suivante("test")
+            tache.refresh_from_db()
+            self.assertEqual((tache.etat, tache.tentatives), (Tache.EN_ATTENTE, 1))
+            self.assertIn("indisponible", tache.erreur)
+
+            # Nouvelle tentative différée
+            self.assertIsNone(taches.traite_suivante("test"))
+            Tache.objects.filter(pk=tache.pk).update(executer_apres=timezone.now())
+            taches.traite_suivante("test")
+            tache.refresh_from_db()
+            self.assertEqual((tache.etat, tache.tentatives), (Tache.ECHEC, 2))
+        fonction.assert_called_with(mock.ANY, valeur=1)
+
+
+class RapportsTests(TestCase):
+    """
+    Les rapports financiers sont produits en flux et reprennent les montants
+    des statistiques, des cas et des cotisations
+    """
+    @classmethod
+    def setUpTestData(cls):
+        GenerateurDonnees(EcritureBase()).genere(
+            membres=10, reunions=3, beneficiaires=10, cas_par_reunion=4, affectations_par_reunion=2,
+        )
+
+    def lignes_csv(self, rapport):
+        contenu = "".join(contenu_rapport('csv', Reunion.objects.all(), rapport=rapport, taille_lot=2))
+        return list(csv.reader(io.StringIO(contenu.lstrip("\ufeff")), delimiter=';'))
+
+    def test_csv(self):
+        synthese = self.lignes_csv('synthese')
+        self.assertEqual(len(synthese), 1 + Reunion.objects.count() + 1)
+        self.assertEqual(synthese[-1][3], str(Cas.objects.count()))
+
+        cas = self.lignes_csv('cas')
+        self.assertEqual(len(cas), 1 + Cas.objects.count() + 1)
+        self.assertEqual(int(cas[-1][5]), sum(Cas.objects.values_list('montant_sollicite', flat=True)))
+        # Parts entières du moteur de répartition
+        self.assertEqual(cas[0][7], "Part")
+        repartitions = repartition.repartitions_reunions(Reunion.objects.all())
+        self.assertEqual(int(cas[-1][7]), sum(sum(resultat.parts) for resultat in repartitions.values()))
+
+    def test_xlsx(self):
+        contenu = b"".join(contenu_rapport('xlsx', Reunion.objects.all()))
+        archive = zipfile.ZipFile(io.BytesIO(contenu))
+        self.assertIsNone(archive.testzip())
+        feuilles = [nom for nom in archive.namelist() if nom.startswith('xl/worksheets/')]
+        self.assertEqual(len(feuilles), 3)
+        self.assertEqual(archive.read(feuilles[1]).count(b"<row>"), 1 + Cas.objects.count() + 1)
+
+
+class ReferentielTests(TestCase):
+    """
+    Les données de référence sont lues en mémoire, et rechargées après leur modification
+    """
+    def test_lecture_en_memoire(self):
+        natures.objets()
+        with self.assertNumQueries(0):
+            choix = natures.choix(classification='S')
+        self.assertEqual(choix, list(NatureBesoin.objects.filter(classification='S').values_list('pk', 'libelle')))
+
+        with validation_simulee():
+            nature = NatureBesoin.objects.create(libelle="Logement", classification='S')
+        self.assertIn((nature.pk, "Logement"), natures.choix(classification='S'))
+
+    def test_invalidation_a_la_validation(self):
+        # La version n'est incrémentée qu'une fois, à la validation de la transaction
+        version, = versions(NatureBesoin)
+        with validation_simulee():
+            for libelle in ("Logement", "Transport"):
+                NatureBesoin.objects.create(libelle=libelle, classification='S')
+            self.assertEqual(versions(NatureBesoin), [version])
+        self.assertEqual(versions(NatureBesoin), [version + 1])
+
+    @override_settings(CACHE_PARTAGE=False, CACHE_TIMEOUT=60)
+    def test_rechargement_cache_non_partage(self):
+        # Modification non validée (comme faite dans un autre processus) : version inchangée
+        natures.objets()
+        NatureBesoin.objects.create(libelle="Transport", classification='S')
+        self.assertNotIn("Transport", natures.libelles().values())
+        natures._charge_le -= 61
+        self.assertIn("Transport", natures.libelles().values())
+
+    def test_recherche(self):
+        with validation_simulee():
+            communaute = Communaute.objects.create(nom="CÉZ", nom_long="Communauté de Zéphyrine")
+        self.assertEqual(communautes.recherche("zephyr COMMUNAUTE"), [communaute])
+
+
+class PaginationCurseurTests(TestCase):
+    """
+    La pagination par curseur parcourt chaque objet une fois, dans l'ordre de la clé,
+    dans les deux sens
+    """
+    taille = 7
+
+    @classmethod
+    def setUpTestData(cls):
+        noms = ["Yao", None, "Koné", "Yao", "Bamba", None, "Koné"]
+        Beneficiaire.objects.bulk_create(
+            Beneficiaire(nom=noms[i % len(noms)], prenoms=None if i % 5 == 0 else f"P{i % 3}")
+            for i in range(40)
+        )
+        cle = lambda b: (b.nom or "", b.prenoms or "", b.pk)
+        cls.attendus = [b.pk for b in sorted(Beneficiaire.objects.all(), key=cle)]
+
+    def page(self, **curseur):
+        return PageCurseur(Beneficiaire.objects.all(), BeneficiaireAdmin.cle_pagination, self.taille, **curseur)
+
+    def test_parcours(self):
+        pages = [self.page()]
+        while pages[-1].suivante:
+            pages.append(self.page(apres=pages[-1].curseur_suivant))
+        self.assertEqual([b.pk for page in pages for b in page.object_list], self.attendus)
+        self.assertFalse(pages[0].precedente)
+
+        # Retour en arrière depuis la dernière page
+        precedentes = [pages[-1]]
+        while precedentes[-1].precedente:
+            precedentes.append(self.page(avant=precedentes[-1].curseur_precedent))
+        self.assertEqual(
+            [[b.pk for b in page.object_list] for page in reversed(precedentes)],
+            [[b.pk for b in page.object_list] for page in pages],
+        )
+
+    def test_curseur_invalide(self):
+        with self.assertRaises(ValueError):
+            self.page(apres="invalide")
+
+
+class PaginationCurseurCasTests(TestCase):
+    """
+    La liste des cas est parcourue par réunion puis par cas, du plus récent au plus ancien,
+    avec ou sans filtre sur la réunion
+    """
+    taille = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        GenerateurDonnees(EcritureBase()).genere(
+            membres=10, reunions=3, beneficiaires=30, cas_par_reunion=8, affectations_par_reunion=0,
+        )
+
+    def parcours(self, queryset):
+        pages = [PageCurseur(queryset, CasAdmin.cle_pagination, self.taille)]
+        while pages[-1].suivante:
+            pages.append(PageCurseur(queryset, CasAdmin.cle_pagination, self.taille, apres=pages[-1].curseur_suivant))
+        return [cas.pk for page in pages for cas in page.object_list]
+
+    def test_parcours(self):
+        attendus = [cas.pk for cas in sorted(Cas.objects.all(), key=lambda c: (c.reunion_id, c.pk), reverse=True)]
+        self.assertEqual(self.parcours(Cas.objects.all()), attendus)
+
+        reunion = Reunion.objects.order_by('pk').first()
+        self.assertEqual(
+            self.parcours(Cas.objects.filter(reunion=reunion)),
+            list(Cas.objects.filter(reunion=reunion).order_by('-pk').values_list('pk', flat=True)),
+        )
+
+
+@skipUnless(recherche_disponible(Beneficiaire), "Recherche plein texte indisponible sur cette base")
+class RechercheTests(TestCase):
+    """
+    Recherche insensible aux accents et à la casse, tenue à jour lors des modifications
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.beneficiaire = Beneficiaire.objects.create(nom="Kouamé", prenoms="Adèle Éloïse", sexe='F')
+        Beneficiaire.objects.create(nom="Koné", prenoms="Adama", sexe='M')
+
+    def recherche(self, terme):
+        return list(recherche(Beneficiaire.objects.all(), terme))
+
+    def test_accents_et_casse(self):
+        self.assertEqual(self.recherche("KOUAME eloise"), [self.beneficiaire])
+        self.assertEqual(self.recherche("kouamé"), [self.beneficiaire])
+
+    def test_modification_et_suppression(self):
+        self.beneficiaire.nom = "Yao"
+        self.beneficiaire.save()
+        self.assertEqual(self.recherche("kouame"), [])
+        self.assertEqual(self.recherche("yao"), [self.beneficiaire])
+        self.beneficiaire.delete()
+        self.assertEqual(self.recherche("yao"), [])
@@ -0,0 +1,43 @@
+"""
+Traitements différés à la validation des transactions
+
+Les traitements déclenchés par l'enregistrement d'un objet (invalidation du
+cache, actualisation des statistiques) ne doivent avoir lieu qu'une fois les
+modifications visibles des autres connexions, c'est-à-dire après la validation
+de la transaction. Ils sont de plus regroupés : une transaction enregistrant
+N objets ne déclenche qu'un traitement, portant sur l'ensemble des valeurs
+(modèles, réunions) concernées.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+
+class TraitementDiffere:
+    """
+    Traitement fonction(valeurs) en attente de la validation d'une transaction
+    """
+    def __init__(self, cle, fonction):
+        self.cle = cle
+        self.fonction = fonction
+        self.valeurs = set()
+
+    def __call__(self):
+        self.fonction(self.valeurs)
+
+
+def a_la_validation(cle, fonction, valeurs, using=DEFAULT_DB_ALIAS):
+    """
+    Appelle fonction(valeurs) à la validation de la transaction en cours, ou
+    immédiatement hors transaction. Les appels de même clé faits pendant une
+    transaction sont regroupés en un seul, sur l'union des valeurs fournies.
+    """
+    connexion = connections[using]
+    if connexion.in_atomic_block:
+        # Traitement de même clé déjà en attente (s'il n'a pas été annulé
+        # avec le point de sauvegarde dans lequel il a été planifié)
+        for _, traitement in connexion.run_on_commit:
+            if isinstance(traitement, TraitementDiffere) and traitement.cle == cle:
+                traitement.valeurs.update(valeurs)
+                return
+    traitement = TraitementDiffere(cle, fonction)
+    traitement.valeurs.update(valeurs)
+    transaction.on_commit(traitement, using=using)
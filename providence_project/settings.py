@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 
 import os
 import django_heroku
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -91,6 +92,65 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# Le backend est choisi par la variable d'environnement CACHE_URL :
+# - locmem:// (défaut) : mémoire locale du processus
+# - file:///chemin/du/dossier : fichiers sur disque, partagés entre les workers
+# - redis://hote:port/base : serveur Redis (nécessite le paquet django-redis)
+#
+# Les données mises en cache (bilans des réunions, listes de choix) sont
+# invalidées par des numéros de version conservés dans le cache lui-même (voir
+# blog/cache.py). Avec locmem://, chaque processus (workers gunicorn, commandes
+# d'import, travailleur traite_taches) a son propre cache : une modification faite
+# dans l'un n'invalide pas le cache des autres. La durée de conservation par
+# défaut y est donc courte (CACHE_TIMEOUT, 60 secondes), ce qui borne la durée
+# pendant laquelle un worker peut servir des données périmées. En production, avec
+# plusieurs processus, utiliser file:// ou redis://.
+CACHE_URL = os.environ.get('CACHE_URL', default='locmem://')
+CACHE_PARTAGE = CACHE_URL.startswith(('file://', 'redis://', 'rediss://'))
+CACHE_TIMEOUT = int(os.environ.get('CACHE_TIMEOUT', default=24 * 3600 if CACHE_PARTAGE else 60))
+
+if CACHE_URL.startswith('file://'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': CACHE_URL[len('file://'):],
+            'TIMEOUT': CACHE_TIMEOUT,
+        }
+    }
+elif CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': CACHE_URL,
+            'TIMEOUT': CACHE_TIMEOUT,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'providence',
+            'TIMEOUT': CACHE_TIMEOUT,
+        }
+    }
+
+
+# Tâches en arrière-plan (voir blog/taches.py) : si TACHES_ASYNCHRONES vaut 1,
+# les traitements longs sont exécutés par la commande traite_taches (ligne worker
+# du Procfile) ; sinon, immédiatement, dans la requête. Le travailleur invalidant
+# le cache des données qu'il modifie, le mode asynchrone exige un cache partagé
+# entre processus (CACHE_URL file:// ou redis://)
+TACHES_ASYNCHRONES = os.environ.get('TACHES_ASYNCHRONES', default='0') == '1'
+
+if TACHES_ASYNCHRONES and not CACHE_PARTAGE:
+    raise ImproperlyConfigured(
+        "TACHES_ASYNCHRONES=1 nécessite un cache partagé entre processus "
+        "(CACHE_URL file:// ou redis://)"
+    )
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -204,6 +264,38 @@ if os.path.isfile(os.path.join(BASE_DIR, ".env")):
         del DATABASES['default']['OPTIONS']['sslmode']
     DEBUG = True
 
+
+# Connexions à la base de données
+# Le mode est choisi par la variable d'environnement DB_POOL :
+# - persistent (défaut) : chaque worker conserve sa connexion entre les requêtes
+#   (durée de vie CONN_MAX_AGE, 600 s par défaut) ; une connexion inutilisée depuis
+#   plus de DB_HEALTH_CHECK_DELAY secondes est vérifiée au début de la requête suivante
+# - pgbouncer : connexion par requête à un pooler local (PGBOUNCER_HOST, PGBOUNCER_PORT),
+#   compatible avec son mode transaction (pas de curseurs côté serveur). Le SSL
+#   (sslmode=require de django_heroku) n'est pas exigé du pooler local, souvent sans
+#   TLS : mode PGBOUNCER_SSLMODE s'il est fourni, sinon défaut de libpq (prefer)
+# - off : une nouvelle connexion par requête
+DB_POOL = os.environ.get('DB_POOL', default='persistent')
+DB_HEALTH_CHECK_DELAY = int(os.environ.get('DB_HEALTH_CHECK_DELAY', default=30))
+
+if DB_POOL not in ('persistent', 'pgbouncer', 'off'):
+    raise ImproperlyConfigured(
+        f"DB_POOL={DB_POOL} inconnu : les valeurs possibles sont persistent, pgbouncer et off"
+    )
+
+if DB_POOL == 'pgbouncer':
+    DATABASES['default']['HOST'] = os.environ.get('PGBOUNCER_HOST', default='127.0.0.1')
+    DATABASES['default']['PORT'] = os.environ.get('PGBOUNCER_PORT', default='6432')
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+    DATABASES['default'].setdefault('OPTIONS', {}).pop('sslmode', None)
+    if os.environ.get('PGBOUNCER_SSLMODE'):
+        DATABASES['default']['OPTIONS']['sslmode'] = os.environ['PGBOUNCER_SSLMODE']
+elif DB_POOL == 'off':
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('CONN_MAX_AGE', default=600))
+
 # Classe User personnalisée pour Providence
 AUTH_USER_MODEL = 'blog.ProvUser'
 